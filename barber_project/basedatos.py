@@ -0,0 +1,74 @@
+"""
+Configuración de SQLite para producción.
+
+Todo se ajusta con variables de entorno (ver settings.DATABASES):
+
+    BARBERIA_DB_PATH          Ruta del fichero (por defecto db.sqlite3 junto a manage.py)
+    BARBERIA_DB_WAL           1/0: modo WAL, los lectores no esperan al escritor (por defecto 1)
+    BARBERIA_DB_SYNCHRONOUS   OFF/NORMAL/FULL (por defecto NORMAL, seguro con WAL)
+    BARBERIA_DB_CACHE_KB      Caché de páginas por conexión, en KiB (por defecto 20000)
+    BARBERIA_DB_MMAP_MB       Tamaño de mmap, en MiB (por defecto 128; 0 lo desactiva)
+    BARBERIA_DB_TIMEOUT       Segundos que se espera a un bloqueo antes de fallar (por defecto 20)
+    BARBERIA_DB_TRANSACCION   DEFERRED/IMMEDIATE/EXCLUSIVE (por defecto IMMEDIATE)
+    BARBERIA_DB_CONN_MAX_AGE  Segundos que se reutiliza una conexión (por defecto 60)
+    BARBERIA_DB_LECTURA       1: añade el alias "lectura" (conexión de solo lectura) y el router
+"""
+
+import os
+
+
+def _entorno(nombre, defecto):
+    return os.environ.get(f"BARBERIA_DB_{nombre}", defecto)
+
+
+def pragmas():
+    # Se ejecutan al abrir cada conexión
+    lista = []
+    if _entorno("WAL", "1") == "1":
+        lista.append("PRAGMA journal_mode=WAL")
+    lista += [
+        f"PRAGMA synchronous={_entorno('SYNCHRONOUS', 'NORMAL')}",
+        f"PRAGMA cache_size=-{int(_entorno('CACHE_KB', '20000'))}",
+        f"PRAGMA mmap_size={int(_entorno('MMAP_MB', '128')) * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    return lista
+
+
+def configuracion_sqlite(ruta_por_defecto):
+    ruta = _entorno("PATH", str(ruta_por_defecto))
+    principal = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": ruta,
+        "CONN_MAX_AGE": int(_entorno("CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "timeout": float(_entorno("TIMEOUT", "20")),
+            # BEGIN IMMEDIATE: el bloqueo de escritura se pide al empezar la transacción,
+            # así que la espera de "timeout" sirve (en DEFERRED, subir de lectura a
+            # escritura falla al instante con "database is locked")
+            "transaction_mode": _entorno("TRANSACCION", "IMMEDIATE"),
+            "init_command": ";".join(pragmas()),
+        },
+    }
+    bases = {"default": principal}
+
+    if _entorno("LECTURA", "0") == "1":
+        bases["lectura"] = {
+            **principal,
+            # Mismo fichero, abierto en solo lectura: con WAL ve todo lo confirmado
+            "NAME": f"file:{ruta}?mode=ro",
+            "OPTIONS": {
+                **principal["OPTIONS"],
+                "uri": True,
+                "init_command": ";".join(p for p in pragmas() if "journal_mode" not in p),
+            },
+            "TEST": {"MIRROR": "default"},
+        }
+    return bases
+
+
+def routers():
+    if _entorno("LECTURA", "0") == "1":
+        return ["barber_project.routers.RouterSoloLectura"]
+    return []
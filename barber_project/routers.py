@@ -0,0 +1,53 @@
+"""
+Envía las lecturas de las vistas marcadas con @solo_lectura al alias "lectura".
+
+Solo se activa con BARBERIA_DB_LECTURA=1 (ver basedatos.py). Las escrituras
+(sesiones, last_login...) siguen yendo a "default" aunque ocurran dentro de
+una vista de solo lectura.
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+from inspect import iscoroutinefunction
+
+from django.db import connections
+
+
+_solo_lectura = ContextVar("solo_lectura", default=False)
+
+
+def solo_lectura(vista):
+    if iscoroutinefunction(vista):
+        @wraps(vista)
+        async def envoltorio(*args, **kwargs):
+            marca = _solo_lectura.set(True)
+            try:
+                return await vista(*args, **kwargs)
+            finally:
+                _solo_lectura.reset(marca)
+    else:
+        @wraps(vista)
+        def envoltorio(*args, **kwargs):
+            marca = _solo_lectura.set(True)
+            try:
+                return vista(*args, **kwargs)
+            finally:
+                _solo_lectura.reset(marca)
+    return envoltorio
+
+
+class RouterSoloLectura:
+    def db_for_read(self, model, **hints):
+        if _solo_lectura.get() and "lectura" in connections:
+            return "lectura"
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Es la misma base de datos vista por dos conexiones
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == "default"
@@ -14,6 +14,8 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 
+from .basedatos import configuracion_sqlite, routers as routers_sqlite
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -43,6 +45,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # El primero, para medir también las consultas de sesión y autenticación
+    'gestion_citas.middleware.RendimientoMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,7 +60,8 @@ ROOT_URLCONF = 'barber_project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates que además mide el tiempo de render por petición
+        'BACKEND': 'gestion_citas.rendimiento.PlantillasMedidas',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,11 +80,103 @@ WSGI_APPLICATION = 'barber_project.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# WAL, busy timeout, BEGIN IMMEDIATE y reutilización de conexiones; todo ajustable
+# con variables BARBERIA_DB_* (ver barber_project/basedatos.py)
+
+DATABASES = configuracion_sqlite(BASE_DIR / 'db.sqlite3')
+
+DATABASE_ROUTERS = routers_sqlite()
+
+
+# Cache
+# Memoria local por defecto; con BARBERIA_CACHE_DIR se usa caché en ficheros,
+# compartida entre procesos (necesaria para que la invalidación llegue a todos)
+
+if os.environ.get('BARBERIA_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ['BARBERIA_CACHE_DIR'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'barberia',
+        }
     }
+
+
+# Lista de espera (gestion_citas.lista_espera, comando lista_espera)
+# Minutos que tiene un cliente para confirmar un hueco que se le ha reservado
+LISTA_ESPERA_MINUTOS_OFERTA = int(os.environ.get('BARBERIA_ESPERA_MINUTOS', 30))
+# True: la cita se le asigna sin pedir confirmación
+LISTA_ESPERA_ASIGNAR = os.environ.get('BARBERIA_ESPERA_ASIGNAR') == '1'
+
+
+# Correos a los clientes (gestion_citas.notificaciones, comando enviar_correos)
+# Sin BARBERIA_EMAIL_HOST se escriben por consola
+if os.environ.get('BARBERIA_EMAIL_HOST'):
+    EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+    EMAIL_HOST = os.environ['BARBERIA_EMAIL_HOST']
+    EMAIL_PORT = int(os.environ.get('BARBERIA_EMAIL_PORT', 587))
+    EMAIL_HOST_USER = os.environ.get('BARBERIA_EMAIL_USUARIO', '')
+    EMAIL_HOST_PASSWORD = os.environ.get('BARBERIA_EMAIL_CLAVE', '')
+    EMAIL_USE_TLS = os.environ.get('BARBERIA_EMAIL_TLS', '1') == '1'
+else:
+    EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = os.environ.get('BARBERIA_EMAIL_REMITENTE', 'Barbería <citas@barberia.local>')
+# Horas antes de la cita a las que sale el recordatorio
+NOTIFICACIONES_HORAS_RECORDATORIO = 24
+
+
+# Rendimiento por petición (gestion_citas.middleware.RendimientoMiddleware)
+# Máximo de consultas por vista (url_name), contando la primera petición en frío; si se
+# supera se registra un WARNING
+
+RENDIMIENTO_PRESUPUESTO_CONSULTAS = {
+    'home': 5,
+    'mis_citas': 6,
+    # Con la capacidad del rango ya guardada bastan 6 y 4; los días que
+    # recalcular_capacidad aún no ha calculado cuestan las tres del horario y las citas
+    'disponibilidad_barbero': 9,
+    'calendario_barbero': 8,
+    'agenda_profesional': 5,
+    # 5 con el catálogo en caché; el filtro de barbero lo lee (dos consultas) tras cada
+    # cambio de barberos o servicios
+    'dashboard_staff': 7,
+}
+
+RENDIMIENTO_SERVER_TIMING = True
+
+# Cada petición deja una línea JSON en gestion_citas.rendimiento. Con BARBERIA_LOG_RENDIMIENTO
+# se escriben todas en ese fichero (para resumen_rendimiento); si no, solo los avisos por consola
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'rendimiento': (
+            {
+                'class': 'logging.handlers.WatchedFileHandler',
+                'filename': os.environ['BARBERIA_LOG_RENDIMIENTO'],
+                'formatter': 'json',
+            }
+            if os.environ.get('BARBERIA_LOG_RENDIMIENTO')
+            else {'class': 'logging.StreamHandler', 'formatter': 'json', 'level': 'WARNING'}
+        ),
+    },
+    'loggers': {
+        'gestion_citas.rendimiento': {
+            'handlers': ['rendimiento'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
 }
 
 
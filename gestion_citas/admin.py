@@ -1,20 +1,168 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Usuario, Servicio, Barbero, Cita
+from django.core.paginator import Paginator
+from django.db.models import Max
+from django.utils.functional import cached_property
+from .models import (
+    Usuario, Servicio, Barbero, Cita, Resena, HorarioSemanal, ExcepcionHorario, CierreTienda, EntradaEspera,
+    HistorialEstadoCita, MensajeSalida,
+)
+from . import busqueda
+
+
+# Por debajo de esto se cuenta siempre de verdad
+UMBRAL_ESTIMACION = 10000
+# Con filtros se cuenta como mucho hasta aquí (100 páginas del admin)
+LIMITE_CUENTA = 10000
+
+
+class PaginadorEstimado(Paginator):
+    """Paginator del admin que no hace COUNT(*) de tablas grandes.
+
+    Sin filtros, el total es el id más alto, que SQLite saca del árbol del
+    rowid sin recorrer la tabla: las citas y los usuarios casi no se borran
+    (cancelar ya no borra), así que se parece mucho al número real. Si se han
+    borrado filas, el total se pasa y las últimas páginas salen vacías; al
+    pedir una de ellas se cuenta de verdad y se sirve la última que tiene
+    filas. Con filtros se cuenta de verdad, pero solo hasta LIMITE_CUENTA
+    filas; para ir más allá de la página 100 hay que afinar el filtro.
+    """
+
+    estimado = False
+
+    @cached_property
+    def count(self):
+        consulta = self.object_list
+        if not consulta.query.where:
+            estimado = consulta.aggregate(maximo=Max("pk"))["maximo"] or 0
+            if estimado > UMBRAL_ESTIMACION:
+                self.estimado = True
+                return estimado
+            return consulta.count()
+        return consulta[:LIMITE_CUENTA].count()
+
+    def page(self, number):
+        pagina = super().page(number)
+        # Evaluar la página aquí no cuesta nada: el changelist vuelve a usar la misma lista
+        if not self.estimado or pagina.number == 1 or pagina.object_list:
+            return pagina
+        ultima = max(1, -(-self.object_list.count() // self.per_page))
+        return super().page(ultima)
+
+
+class TablaGrande:
+    """Paginación del admin para tablas con muchas filas; va delante de la clase del admin."""
+
+    # Ni el "(N en total)" de la búsqueda, que sería otro COUNT(*) de la tabla entera
+    paginator = PaginadorEstimado
+    show_full_result_count = False
+
+
+class AdminTablaGrande(TablaGrande, admin.ModelAdmin):
+    pass
+
 
 # Configuración para gestionar el Usuario personalizado en el Admin
 @admin.register(Usuario)
-class UsuarioAdmin(UserAdmin):
-    ordering = ('email',)
+class UsuarioAdmin(TablaGrande, UserAdmin):
     list_display = ('email', 'first_name', 'last_name', 'is_staff')
     search_fields = ('email', 'first_name', 'last_name')
     # Esto es necesario porque ya no usamos username
-    ordering = ['email']
+    ordering = ('email',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Los search_fields se buscan en el índice de texto, no con icontains (ver busqueda.py)
+        consulta = busqueda.consulta_fts(search_term)
+        if consulta is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(busqueda.filtro_usuarios(consulta)), False
+
+# search_fields hace falta para los autocompletados de CitaAdmin y ResenaAdmin
+@admin.register(Servicio)
+class ServicioAdmin(admin.ModelAdmin):
+    search_fields = ('nombre',)
+
+
+# El horario de cada barbero se edita desde su ficha
+class HorarioSemanalInline(admin.TabularInline):
+    model = HorarioSemanal
+    extra = 0
+
+
+class ExcepcionHorarioInline(admin.TabularInline):
+    model = ExcepcionHorario
+    extra = 0
+
+
+@admin.register(Barbero)
+class BarberoAdmin(admin.ModelAdmin):
+    search_fields = ('nombre', 'apellido')
+    inlines = [HorarioSemanalInline, ExcepcionHorarioInline]
+
+
+@admin.register(CierreTienda)
+class CierreTiendaAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'motivo')
+
+# El historial solo se consulta: las filas las escriben los cambios de estado
+class HistorialEstadoCitaInline(admin.TabularInline):
+    model = HistorialEstadoCita
+    fields = ('momento', 'estado_anterior', 'estado', 'autor')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('autor')
 
-admin.site.register(Servicio)
-admin.site.register(Barbero)
 
 @admin.register(Cita)
-class CitaAdmin(admin.ModelAdmin):
+class CitaAdmin(AdminTablaGrande):
     list_display = ('usuario', 'barbero', 'servicio', 'fecha', 'hora', 'estado')
-    list_filter = ('fecha', 'estado', 'barbero')
\ No newline at end of file
+    # Cliente, barbero y servicio en la misma consulta que las citas, no uno por fila
+    list_select_related = ('usuario', 'barbero', 'servicio')
+    # Navegar por año/mes/día en vez del filtro de fechas
+    date_hierarchy = 'fecha'
+    list_filter = ('estado', 'barbero')
+    # Datos del cliente y notas, por el índice de texto como en UsuarioAdmin
+    search_fields = ('usuario__email', 'usuario__first_name', 'usuario__last_name', 'notas')
+    # Sin desplegables con todos los clientes (ni todas las series) en el formulario
+    autocomplete_fields = ('usuario', 'barbero', 'servicio')
+    raw_id_fields = ('serie',)
+    inlines = [HistorialEstadoCitaInline]
+
+    def get_search_results(self, request, queryset, search_term):
+        consulta = busqueda.consulta_fts(search_term)
+        if consulta is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(busqueda.filtro_citas(consulta)), False
+
+
+@admin.register(Resena)
+class ResenaAdmin(AdminTablaGrande):
+    list_display = ('__str__', 'usuario', 'puntuacion', 'fecha')
+    # Resena.__str__ lee el barbero
+    list_select_related = ('barbero', 'usuario')
+    date_hierarchy = 'fecha'
+    list_filter = ('puntuacion', 'barbero')
+    autocomplete_fields = ('barbero', 'usuario')
+
+
+@admin.register(EntradaEspera)
+class EntradaEsperaAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'barbero', 'fecha', 'desde', 'hasta', 'estado', 'creada')
+    list_select_related = ('usuario', 'barbero')
+    list_filter = ('estado', 'barbero')
+    autocomplete_fields = ('usuario', 'barbero', 'servicio')
+    raw_id_fields = ('cita',)
+
+
+@admin.register(MensajeSalida)
+class MensajeSalidaAdmin(AdminTablaGrande):
+    list_display = ('tipo', 'usuario', 'cita', 'estado', 'enviar_desde', 'intentos', 'enviado')
+    list_select_related = ('usuario', 'cita')
+    list_filter = ('estado', 'tipo')
+    raw_id_fields = ('usuario', 'cita')
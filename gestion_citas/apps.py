@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class GestionCitasConfig(AppConfig):
     name = 'gestion_citas'
+
+    def ready(self):
+        # Conecta los receptores de señales (agregados de reseñas, etc.)
+        from . import signals  # noqa: F401
@@ -0,0 +1,224 @@
+"""
+Reproduce una mezcla de peticiones realista y mide cada tipo de petición.
+
+La mezcla (bench/mezcla.jsonl) es una línea JSON por tipo de petición:
+
+    {"nombre": "disponibilidad_mes", "vista": "disponibilidad_barbero",
+     "args": ["{barbero}"], "params": {"mes": "{mes}"}, "sesion": "cliente", "peso": 18}
+
+`vista` es el nombre de la URL en gestion_citas/urls.py, `sesion` es anonimo,
+cliente o staff, `metodo` GET (por defecto) o POST con `datos`, y `peso` la
+frecuencia relativa. Los textos entre llaves se sustituyen en cada petición
+por valores sacados de la BD sembrada ({barbero}, {servicio}, {mes},
+{fecha_futura}, {hora}).
+"""
+
+import http.client
+import json
+import random
+import re
+import statistics
+from collections import defaultdict
+from datetime import date, timedelta
+from pathlib import Path
+from time import perf_counter
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .huecos import HORARIOS_DISPONIBLES
+from .models import Barbero, Servicio, Usuario
+
+
+CARPETA = Path(__file__).resolve().parent / "bench"
+MEZCLA_POR_DEFECTO = CARPETA / "mezcla.jsonl"
+REFERENCIA_POR_DEFECTO = CARPETA / "referencia.json"
+
+# Cuántos clientes distintos se turnan en las peticiones con sesión de cliente
+CLIENTES_SIMULTANEOS = 10
+
+
+def cargar_mezcla(ruta=MEZCLA_POR_DEFECTO):
+    mezcla = []
+    with open(ruta, encoding="utf-8") as fichero:
+        for numero, linea in enumerate(fichero, 1):
+            if not linea.strip():
+                continue
+            entrada = json.loads(linea)
+            faltan = {"nombre", "vista", "peso"} - set(entrada)
+            if faltan:
+                raise ValueError(f"{ruta}:{numero}: faltan {', '.join(sorted(faltan))}")
+            entrada.setdefault("sesion", "anonimo")
+            entrada.setdefault("metodo", "GET")
+            mezcla.append(entrada)
+    return mezcla
+
+
+class ClienteLocal:
+    # El Client de pruebas de Django, en el mismo proceso; cuenta las consultas directamente
+    def __init__(self, usuario=None):
+        self.cliente = Client()
+        if usuario is not None:
+            self.cliente.force_login(usuario)
+
+    def pedir(self, metodo, ruta, datos=None):
+        with CaptureQueriesContext(connection) as consultas:
+            if metodo == "POST":
+                respuesta = self.cliente.post(ruta, datos or {})
+            else:
+                respuesta = self.cliente.get(ruta)
+        return respuesta.status_code, len(consultas)
+
+
+class ClienteHttp:
+    # Un servidor ya arrancado sobre la misma BD; las consultas salen de la cabecera Server-Timing
+    def __init__(self, url, usuario=None):
+        destino = urlsplit(url)
+        self.conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=30)
+        self.csrf = get_random_string(32)
+        cookies = {settings.CSRF_COOKIE_NAME: self.csrf}
+        if usuario is not None:
+            cliente = Client()
+            cliente.force_login(usuario)
+            cookies[settings.SESSION_COOKIE_NAME] = cliente.cookies[settings.SESSION_COOKIE_NAME].value
+        self.cookies = "; ".join(f"{nombre}={valor}" for nombre, valor in cookies.items())
+
+    def pedir(self, metodo, ruta, datos=None):
+        cabeceras = {"Cookie": self.cookies}
+        cuerpo = None
+        if metodo == "POST":
+            cuerpo = urlencode({**(datos or {}), "csrfmiddlewaretoken": self.csrf})
+            cabeceras["Content-Type"] = "application/x-www-form-urlencoded"
+        self.conexion.request(metodo, ruta, body=cuerpo, headers=cabeceras)
+        respuesta = self.conexion.getresponse()
+        respuesta.read()
+        # Las cookies que devuelve (p. ej. mensajes tras reservar) se ignoran: todas las
+        # peticiones de la mezcla salen con la misma sesión
+        consultas = re.search(r'desc="(\d+) consultas"', respuesta.getheader("Server-Timing") or "")
+        return respuesta.status, int(consultas.group(1)) if consultas else None
+
+
+def _clientes(crear):
+    # Un cliente anónimo, uno de staff y varios de clientes con sesión iniciada
+    staff = Usuario.objects.filter(is_staff=True).order_by("id").first()
+    clientes = list(Usuario.objects.filter(is_staff=False).order_by("id")[:CLIENTES_SIMULTANEOS])
+    return {
+        "anonimo": [crear(None)],
+        "staff": [crear(staff)] if staff else [],
+        "cliente": [crear(usuario) for usuario in clientes],
+    }
+
+
+def _valores(aleatorio, barberos, servicios, hoy):
+    return {
+        "barbero": aleatorio.choice(barberos),
+        "servicio": aleatorio.choice(servicios),
+        "mes": f"{hoy:%Y-%m}",
+        "fecha_futura": f"{hoy + timedelta(days=aleatorio.randint(1, 30)):%Y-%m-%d}",
+        "hora": aleatorio.choice(HORARIOS_DISPONIBLES),
+    }
+
+
+def _rellenar(valor, valores):
+    return str(valor).format(**valores)
+
+
+def reproducir(mezcla, peticiones, semilla=42, crear_cliente=ClienteLocal, calentamiento=0):
+    """Lanza `peticiones` peticiones elegidas de la mezcla según su peso y devuelve las métricas.
+
+    `crear_cliente(usuario)` devuelve un objeto con pedir(metodo, ruta, datos)
+    -> (estado, consultas): ClienteLocal o un ClienteHttp ligado a una URL.
+    """
+    aleatorio = random.Random(semilla)
+    hoy = date.today()
+    barberos = list(Barbero.objects.values_list("id", flat=True))
+    servicios = list(Servicio.objects.values_list("id", flat=True))
+    clientes = _clientes(crear_cliente)
+    pesos = [entrada["peso"] for entrada in mezcla]
+
+    medidas = defaultdict(lambda: {"latencias": [], "consultas": [], "errores": 0})
+    inicio_total = None
+    for numero in range(calentamiento + peticiones):
+        if numero == calentamiento:
+            medidas.clear()
+            inicio_total = perf_counter()
+        entrada = aleatorio.choices(mezcla, weights=pesos)[0]
+        if not clientes[entrada["sesion"]]:
+            continue
+        valores = _valores(aleatorio, barberos, servicios, hoy)
+        ruta = reverse(entrada["vista"], args=[_rellenar(arg, valores) for arg in entrada.get("args", [])])
+        if entrada.get("params"):
+            ruta += "?" + urlencode({clave: _rellenar(valor, valores) for clave, valor in entrada["params"].items()})
+        datos = {clave: _rellenar(valor, valores) for clave, valor in entrada.get("datos", {}).items()}
+
+        cliente = aleatorio.choice(clientes[entrada["sesion"]])
+        inicio = perf_counter()
+        try:
+            estado, consultas = cliente.pedir(entrada["metodo"], ruta, datos)
+        except (OSError, http.client.HTTPException):
+            estado, consultas = None, None
+        medida = medidas[entrada["nombre"]]
+        medida["vista"] = entrada["vista"]
+        if estado is None or estado >= 400:
+            medida["errores"] += 1
+            continue
+        medida["latencias"].append((perf_counter() - inicio) * 1000)
+        if consultas is not None:
+            medida["consultas"].append(consultas)
+
+    duracion = perf_counter() - inicio_total
+    return {
+        "peticiones": peticiones,
+        "duracion_s": round(duracion, 3),
+        "rps": round(peticiones / duracion, 1) if duracion else 0.0,
+        "endpoints": {nombre: _resumir(medida, duracion) for nombre, medida in sorted(medidas.items())},
+    }
+
+
+def _resumir(medida, duracion):
+    latencias, consultas = medida["latencias"], medida["consultas"]
+    p50, p95, p99 = _percentiles(latencias)
+    return {
+        "vista": medida["vista"],
+        "n": len(latencias),
+        "errores": medida["errores"],
+        "rps": round(len(latencias) / duracion, 1) if duracion else 0.0,
+        "p50_ms": round(p50, 2),
+        "p95_ms": round(p95, 2),
+        "p99_ms": round(p99, 2),
+        "consultas_media": round(statistics.fmean(consultas), 2) if consultas else None,
+        "consultas_max": max(consultas) if consultas else None,
+    }
+
+
+def _percentiles(valores):
+    if len(valores) < 2:
+        return (valores[0],) * 3 if valores else (0.0,) * 3
+    cortes = statistics.quantiles(valores, n=100)
+    return cortes[49], cortes[94], cortes[98]
+
+
+def comparar(resultados, referencia, tolerancia=None):
+    """Lista de regresiones frente a una ejecución de referencia.
+
+    Las consultas por petición son deterministas y se comparan siempre; los
+    tiempos solo si se da `tolerancia` (0.25 = hasta un 25 % más lento en p95),
+    porque dependen de la máquina.
+    """
+    regresiones = []
+    for nombre, antes in referencia["endpoints"].items():
+        ahora = resultados["endpoints"].get(nombre)
+        if ahora is None:
+            continue
+        if ahora["errores"] > antes["errores"]:
+            regresiones.append(f"{nombre}: {ahora['errores']} errores (antes {antes['errores']})")
+        if None not in (ahora["consultas_max"], antes["consultas_max"]) and ahora["consultas_max"] > antes["consultas_max"]:
+            regresiones.append(f"{nombre}: hasta {ahora['consultas_max']} consultas (antes {antes['consultas_max']})")
+        if tolerancia is not None and antes["p95_ms"] and ahora["p95_ms"] > antes["p95_ms"] * (1 + tolerancia):
+            regresiones.append(f"{nombre}: p95 {ahora['p95_ms']} ms (antes {antes['p95_ms']} ms)")
+    return regresiones
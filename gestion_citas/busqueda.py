@@ -0,0 +1,139 @@
+"""
+Búsqueda de texto del staff: clientes por nombre, apellidos y correo, y citas
+por sus notas o por su cliente.
+
+El admin buscaba con icontains, un LIKE '%...%' que recorre la tabla entera
+(y en SQLite solo ignora mayúsculas en ASCII). Ahora hay dos tablas FTS5 de
+contenido externo, creadas en la migración 0014:
+
+- busqueda_usuario (email, first_name, last_name), sobre gestion_citas_usuario.
+- busqueda_cita (notas), sobre gestion_citas_cita; solo entran las que tienen notas.
+
+Las mantienen al día triggers de SQLite, no señales: así también las ven los
+bulk_create y update() de sembrado, importación y series. El tokenizador quita
+tildes ("garcia" encuentra "García") y parte los correos por "@" y ".". Cada
+palabra buscada es un prefijo, y la tabla guarda índices de prefijos de 2 y 3
+letras para que las búsquedas cortas no recorran todo el vocabulario.
+
+Los triggers van con la tabla de Django, no con la de FTS5: cuando una
+migración hace que SQLite rehaga gestion_citas_usuario o gestion_citas_cita
+(AlterField, RemoveField...), se pierden sin aviso y el índice se queda
+atrás. Esa migración tiene que acabar con
+RunPython(busqueda.reconstruir, RunPython.noop), que los vuelve a crear y
+rehace los índices.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Cita, Usuario
+
+
+# Palabras como mucho por búsqueda y resultados por tipo en la API
+MAX_TERMINOS = 6
+RESULTADOS_POR_TIPO = 20
+
+_PALABRA = re.compile(r"\w{2,}")
+
+_IDS_USUARIOS = "SELECT rowid FROM busqueda_usuario WHERE busqueda_usuario MATCH %s"
+_IDS_CITAS = "SELECT rowid FROM busqueda_cita WHERE busqueda_cita MATCH %s"
+
+
+# Los mismos triggers que crea la migración 0014. Esa migración tiene su propia copia: si
+# alguno cambia, hace falta una migración nueva que termine en reconstruir()
+TRIGGERS_USUARIO = {
+    "busqueda_usuario_alta": """CREATE TRIGGER busqueda_usuario_alta AFTER INSERT ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (rowid, email, first_name, last_name)
+        VALUES (new.id, new.email, new.first_name, new.last_name);
+    END""",
+    "busqueda_usuario_baja": """CREATE TRIGGER busqueda_usuario_baja AFTER DELETE ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (busqueda_usuario, rowid, email, first_name, last_name)
+        VALUES ('delete', old.id, old.email, old.first_name, old.last_name);
+    END""",
+    # Solo si cambia algo de lo indexado: el last_login de cada inicio de sesión no toca el índice
+    "busqueda_usuario_cambio": """CREATE TRIGGER busqueda_usuario_cambio AFTER UPDATE OF email, first_name, last_name ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (busqueda_usuario, rowid, email, first_name, last_name)
+        VALUES ('delete', old.id, old.email, old.first_name, old.last_name);
+        INSERT INTO busqueda_usuario (rowid, email, first_name, last_name)
+        VALUES (new.id, new.email, new.first_name, new.last_name);
+    END""",
+}
+
+# Solo las citas con notas: el alta y la baja miran la misma condición para que
+# el índice nunca reciba un 'delete' de algo que no tiene
+TRIGGERS_CITA = {
+    "busqueda_cita_alta": """CREATE TRIGGER busqueda_cita_alta AFTER INSERT ON gestion_citas_cita WHEN new.notas <> '' BEGIN
+        INSERT INTO busqueda_cita (rowid, notas) VALUES (new.id, new.notas);
+    END""",
+    "busqueda_cita_baja": """CREATE TRIGGER busqueda_cita_baja AFTER DELETE ON gestion_citas_cita WHEN old.notas <> '' BEGIN
+        INSERT INTO busqueda_cita (busqueda_cita, rowid, notas) VALUES ('delete', old.id, old.notas);
+    END""",
+    "busqueda_cita_cambio": """CREATE TRIGGER busqueda_cita_cambio AFTER UPDATE OF notas ON gestion_citas_cita BEGIN
+        INSERT INTO busqueda_cita (busqueda_cita, rowid, notas)
+        SELECT 'delete', old.id, old.notas WHERE old.notas <> '';
+        INSERT INTO busqueda_cita (rowid, notas)
+        SELECT new.id, new.notas WHERE new.notas <> '';
+    END""",
+}
+
+RELLENAR_CITAS = "INSERT INTO busqueda_cita (rowid, notas) SELECT id, notas FROM gestion_citas_cita WHERE notas <> ''"
+
+
+def reconstruir(apps=None, schema_editor=None):
+    """Vuelve a crear los triggers y rehace los dos índices desde las tablas de Django.
+
+    Con esta firma sirve tal cual para RunPython; fuera de una migración se
+    llama sin argumentos.
+    """
+    conexion = schema_editor.connection if schema_editor is not None else connection
+    with conexion.cursor() as cursor:
+        for nombre, sql in (TRIGGERS_USUARIO | TRIGGERS_CITA).items():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {nombre}")
+            cursor.execute(sql)
+        cursor.execute("INSERT INTO busqueda_usuario (busqueda_usuario) VALUES ('rebuild')")
+        # 'rebuild' metería también las citas sin notas, que los triggers no quitan nunca
+        cursor.execute("INSERT INTO busqueda_cita (busqueda_cita) VALUES ('delete-all')")
+        cursor.execute(RELLENAR_CITAS)
+
+
+def consulta_fts(texto):
+    """Texto del buscador -> consulta MATCH (todas las palabras, como prefijos), o None si no queda nada.
+
+    Cada palabra va entre comillas, así que nada de lo que escriba el usuario
+    se interpreta como sintaxis de FTS5.
+    """
+    palabras = _PALABRA.findall(texto.lower())[:MAX_TERMINOS]
+    if not palabras:
+        return None
+    return " ".join(f'"{palabra}"*' for palabra in palabras)
+
+
+def filtro_usuarios(consulta):
+    return Q(id__in=RawSQL(_IDS_USUARIOS, (consulta,)))
+
+
+def filtro_citas(consulta):
+    # Por sus notas o por los datos de su cliente
+    return Q(id__in=RawSQL(_IDS_CITAS, (consulta,))) | Q(usuario_id__in=RawSQL(_IDS_USUARIOS, (consulta,)))
+
+
+def clientes(consulta, limite=RESULTADOS_POR_TIPO):
+    """Los clientes que coinciden, del más al menos relevante (bm25 de FTS5)."""
+    return list(Usuario.objects.raw(
+        "SELECT u.id, u.email, u.first_name, u.last_name"
+        " FROM busqueda_usuario b JOIN gestion_citas_usuario u ON u.id = b.rowid"
+        " WHERE busqueda_usuario MATCH %s ORDER BY b.rank LIMIT %s",
+        (consulta, limite),
+    ))
+
+
+def citas(consulta, limite=RESULTADOS_POR_TIPO):
+    # Las más recientes primero: entre citas, la fecha importa más que la relevancia
+    return list(
+        Cita.objects.filter(filtro_citas(consulta))
+        .select_related("usuario", "barbero", "servicio")
+        .order_by("-fecha", "-hora", "-id")[:limite]
+    )
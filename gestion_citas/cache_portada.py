@@ -0,0 +1,36 @@
+import hashlib
+
+from django.core.cache import caches, InvalidCacheBackendError
+from django.core.cache.utils import make_template_fragment_key
+
+
+# Nombres de los fragmentos {% cache %} de public/home.html
+FRAGMENTOS_PORTADA = ("portada_servicios", "portada_barberos")
+
+# Página completa que se sirve a visitantes anónimos
+CLAVE_PAGINA_ANONIMA = "portada:anonima"
+
+
+def _cache():
+    # La misma caché que usa la etiqueta {% cache %}
+    try:
+        return caches["template_fragments"]
+    except InvalidCacheBackendError:
+        return caches["default"]
+
+
+def pagina_anonima():
+    # Devuelve (contenido, etag) o None
+    return _cache().get(CLAVE_PAGINA_ANONIMA)
+
+
+def guardar_pagina_anonima(contenido):
+    etag = '"%s"' % hashlib.md5(contenido).hexdigest()
+    # Sin caducidad: solo la invalidan las señales de los modelos
+    _cache().set(CLAVE_PAGINA_ANONIMA, (contenido, etag), None)
+    return etag
+
+
+def invalidar_portada(**kwargs):
+    claves = [make_template_fragment_key(nombre) for nombre in FRAGMENTOS_PORTADA]
+    _cache().delete_many(claves + [CLAVE_PAGINA_ANONIMA])
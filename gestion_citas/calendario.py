@@ -0,0 +1,160 @@
+"""
+Calendarios .ics por barbero y por cliente, para suscribirse desde el móvil.
+
+Los clientes de calendario vuelven a pedir la URL cada pocos minutos, así que
+lo normal tiene que ser un 304 barato:
+
+- La URL lleva un token (HMAC del tipo y el id con la SECRET_KEY): se
+  comprueba sin sesión y sin consultas.
+- Solo entra una ventana de fechas (DIAS_ATRAS hacia atrás, DIAS_ADELANTE
+  hacia delante), leída por el índice (barbero o usuario, fecha, hora, actualizado).
+- La versión es la última modificación y el número de citas de la ventana
+  (el número cuenta también los borrados), más la versión del catálogo para
+  los nombres de barberos y servicios. Sale de una consulta agregada que no
+  sale del índice; si coincide con If-None-Match, 304 y nada más.
+- Si no coincide, el .ics se genera mientras se envía, con iterator(), como
+  la exportación de intercambio.py.
+"""
+
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from . import catalogo
+from .models import Barbero, Cita
+
+
+DIAS_ATRAS = 30
+DIAS_ADELANTE = 365
+TAMANO_BLOQUE = 500
+
+# De quién es cada calendario: tipo de la URL -> campo de Cita
+PROPIETARIOS = {"barbero": "barbero_id", "cliente": "usuario_id"}
+
+ESTADOS_ICS = {
+    "PENDIENTE": "TENTATIVE",
+    "CONFIRMADA": "CONFIRMED",
+    "CANCELADA": "CANCELLED",
+    "NO_PRESENTADO": "CONFIRMED",
+}
+
+_CAMPOS = [
+    "id", "fecha", "hora", "estado", "notas", "actualizado", "servicio__nombre", "servicio__duracion",
+    "barbero__nombre", "barbero__apellido", "usuario__first_name", "usuario__last_name",
+]
+
+
+# --- Acceso ---
+
+def token(tipo, propietario_id):
+    return salted_hmac("gestion_citas.calendario", f"{tipo}:{propietario_id}", algorithm="sha256").hexdigest()[:32]
+
+
+def token_valido(tipo, propietario_id, valor):
+    return tipo in PROPIETARIOS and constant_time_compare(token(tipo, propietario_id), valor)
+
+
+def url(tipo, propietario_id):
+    return reverse(f"ics_{tipo}", args=[propietario_id, token(tipo, propietario_id)])
+
+
+# --- Consulta y versión ---
+
+def ventana(hoy=None):
+    hoy = hoy or timezone.localdate()
+    return hoy - timedelta(days=DIAS_ATRAS), hoy + timedelta(days=DIAS_ADELANTE)
+
+
+def citas(tipo, propietario_id, desde, hasta):
+    return Cita.objects.filter(**{PROPIETARIOS[tipo]: propietario_id}, fecha__gte=desde, fecha__lt=hasta)
+
+
+def version(citas, desde):
+    """El ETag del calendario: cambia si cambia, se añade o se borra alguna cita de la ventana."""
+    datos = citas.order_by().aggregate(ultima=Max("actualizado"), total=Count("id"))
+    clave = f"{desde}:{datos['ultima']}:{datos['total']}:{catalogo.version()}"
+    return '"%s"' % hashlib.md5(clave.encode()).hexdigest()
+
+
+def nombre(tipo, propietario_id):
+    # None si el barbero ya no existe
+    if tipo == "cliente":
+        return "Mis citas en la barbería"
+    barbero = Barbero.objects.filter(id=propietario_id).values_list("nombre", "apellido").first()
+    return barbero and f"Agenda de {barbero[0]} {barbero[1]}"
+
+
+# --- Formato iCalendar (RFC 5545) ---
+
+def _texto(valor):
+    return (
+        valor.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+        .replace("\r\n", "\\n").replace("\n", "\\n")
+    )
+
+
+def _linea(linea):
+    # Máximo 75 bytes por línea; las de continuación empiezan por un espacio
+    if len(linea.encode()) <= 75:
+        return linea + "\r\n"
+    trozos, actual, tamano, limite = [], "", 0, 75
+    for caracter in linea:
+        bytes_caracter = len(caracter.encode())
+        if tamano + bytes_caracter > limite:
+            trozos.append(actual)
+            actual, tamano, limite = "", 0, 74
+        actual += caracter
+        tamano += bytes_caracter
+    trozos.append(actual)
+    return "\r\n ".join(trozos) + "\r\n"
+
+
+def _utc(momento):
+    return momento.astimezone(dt_timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _evento(tipo, fila, dominio):
+    (cita_id, fecha, hora, estado, notas, actualizado, servicio, duracion,
+     barbero, apellido, cliente, apellido_cliente) = fila
+    inicio = timezone.make_aware(datetime.combine(fecha, hora))
+    if tipo == "barbero":
+        resumen = f"{servicio} - {cliente} {apellido_cliente}"
+    else:
+        resumen = f"{servicio} con {barbero} {apellido}"
+    lineas = [
+        "BEGIN:VEVENT",
+        f"UID:cita-{cita_id}@{dominio}",
+        f"DTSTAMP:{_utc(actualizado)}",
+        f"LAST-MODIFIED:{_utc(actualizado)}",
+        f"DTSTART:{_utc(inicio)}",
+        f"DTEND:{_utc(inicio + timedelta(minutes=duracion))}",
+        f"SUMMARY:{_texto(resumen)}",
+        f"STATUS:{ESTADOS_ICS[estado]}",
+    ]
+    if notas:
+        lineas.append(f"DESCRIPTION:{_texto(notas)}")
+    lineas.append("END:VEVENT")
+    return "".join(_linea(linea) for linea in lineas)
+
+
+def generar(tipo, citas, titulo, dominio, chunk_size=TAMANO_BLOQUE):
+    """El .ics por trozos: cabecera, un VEVENT por cita (también las canceladas,
+    para que el móvil las quite) y cierre."""
+    yield "".join(_linea(linea) for linea in [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:-//{dominio}//Barberia//ES",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        f"X-WR-CALNAME:{_texto(titulo)}",
+        f"X-WR-TIMEZONE:{settings.TIME_ZONE}",
+    ])
+    consulta = citas.order_by("fecha", "hora", "id").values_list(*_CAMPOS)
+    for fila in consulta.iterator(chunk_size=chunk_size):
+        yield _evento(tipo, fila, dominio)
+    yield "END:VCALENDAR\r\n"
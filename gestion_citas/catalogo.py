@@ -0,0 +1,91 @@
+"""
+Catálogo de barberos y servicios para los formularios de reserva.
+
+Son pocas filas, cambian casi nunca y se leían enteras en cada formulario
+(desplegables, precios para el JavaScript). Ahora se leen una vez:
+
+- La caché compartida guarda el catálogo bajo una clave con versión
+  ("catalogo:<versión>") y la versión vigente en "catalogo:version".
+- Cada proceso se queda además con la última copia que ha leído y solo la
+  cambia si la versión de la caché ya no coincide.
+
+Las señales de Barbero y Servicio llaman a invalidar_catalogo() en el momento
+(para que la propia transacción vea el cambio) y otra vez al confirmarla (para
+que nadie se quede con lo de antes del commit): se estrena una versión nueva y
+los procesos la cargan en su siguiente petición. Así, un formulario cuesta una
+lectura de la caché y ninguna consulta.
+"""
+
+import json
+import time
+from collections import namedtuple
+
+from django.core.cache import cache
+
+from .models import Barbero, Servicio
+
+
+CLAVE_VERSION = "catalogo:version"
+
+# Lo que pintan los formularios y reservar_cita.html; nada que cambie con cada reseña
+CAMPOS_BARBERO = ("id", "nombre", "apellido", "foto", "miniaturas")
+
+
+class Catalogo(namedtuple("Catalogo", ["version", "barberos", "servicios", "precios_json"])):
+    """`barberos` y `servicios` son listas de instancias, en el orden de los desplegables."""
+
+    def buscar(self, lista, pk):
+        # Diccionarios por id, creados la primera vez que se valida un formulario
+        indices = self.__dict__.setdefault("_indices", {})
+        if lista not in indices:
+            indices[lista] = {str(objeto.pk): objeto for objeto in getattr(self, lista)}
+        return indices[lista].get(str(pk))
+
+
+_local = None
+
+
+def version():
+    """La versión vigente del catálogo; cambia con cada invalidar_catalogo().
+
+    Sirve para las claves de caché y los ETag de lo que pinta nombres de barberos o servicios.
+    """
+    vigente = cache.get(CLAVE_VERSION)
+    if vigente is None:
+        # add(): si otro proceso se adelanta, nos quedamos con la suya
+        cache.add(CLAVE_VERSION, time.time_ns(), None)
+        vigente = cache.get(CLAVE_VERSION)
+    return vigente
+
+
+def _construir(version):
+    servicios = list(Servicio.objects.all())
+    return Catalogo(
+        version=version,
+        barberos=list(Barbero.objects.only(*CAMPOS_BARBERO)),
+        servicios=servicios,
+        precios_json=json.dumps({servicio.id: float(servicio.precio) for servicio in servicios}),
+    )
+
+
+def actual():
+    """El catálogo vigente: de este proceso, de la caché compartida o, si no está, de la BD."""
+    global _local
+    vigente = version()
+    if _local is not None and _local.version == vigente:
+        return _local
+    clave = f"catalogo:{vigente}"
+    catalogo = cache.get(clave)
+    if catalogo is None:
+        catalogo = _construir(vigente)
+        cache.set(clave, catalogo, None)
+    _local = catalogo
+    return catalogo
+
+
+def invalidar_catalogo(**kwargs):
+    # Con una versión nueva las copias de los procesos dejan de valer; la vieja de la caché sobra
+    anterior = cache.get(CLAVE_VERSION)
+    cache.set(CLAVE_VERSION, time.time_ns(), None)
+    if anterior is not None:
+        cache.delete(f"catalogo:{anterior}")
@@ -0,0 +1,36 @@
+from django.db.models import Q
+from django.utils import timezone
+
+from . import horarios, resumenes
+from .models import Cita
+
+
+def citas_vencidas(ahora=None):
+    # Pendientes cuya hora ya ha pasado (días anteriores u hoy antes de ahora)
+    ahora = timezone.localtime(ahora)
+    return Cita.objects.filter(
+        Q(fecha__lt=ahora.date()) | Q(fecha=ahora.date(), hora__lt=ahora.time()),
+        estado="PENDIENTE",
+    )
+
+
+def expirar_citas_vencidas(lote=500, ahora=None):
+    """Marca como CANCELADA las pendientes vencidas, en lotes de `lote` filas.
+
+    Cada lote va en su propia transacción para no retener el bloqueo de escritura
+    de SQLite más de lo necesario. Es idempotente: una segunda pasada no cambia nada.
+    Devuelve el número de citas caducadas.
+    """
+    ahora = ahora or timezone.now()
+    total = 0
+    while True:
+        ids = list(citas_vencidas(ahora).order_by("fecha", "hora").values_list("id", flat=True)[:lote])
+        if not ids:
+            if total:
+                # Las de hoy liberan sus huecos en el calendario (los días pasados no se guardan)
+                horarios.actualizar_ocupacion(timezone.localdate(ahora))
+            return total
+        # Volvemos a filtrar por estado por si alguien la confirmó entre medias
+        total += resumenes.cambiar_estado(
+            Cita.objects.filter(id__in=ids, estado="PENDIENTE"), "CANCELADA"
+        )
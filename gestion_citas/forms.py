@@ -1,7 +1,70 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import Usuario, Cita, Resena
+from django.urls import reverse_lazy
+from . import catalogo
+from .models import Usuario, Cita, Resena, Barbero, SerieCita, Servicio, EntradaEspera
 from django.forms import DateInput, TimeInput
+import datetime
+
+
+class CampoCatalogo(forms.ModelChoiceField):
+    """Desplegable de barberos o servicios que se pinta y valida con el catálogo en caché.
+
+    Sin consultas: las opciones y el objeto elegido salen de catalogo.actual().
+    `lista` es "barberos" o "servicios".
+    """
+
+    def __init__(self, lista, queryset, **kwargs):
+        self.lista = lista
+        super().__init__(queryset, **kwargs)
+        # Opciones perezosas: se calculan al pintar, con el catálogo de ese momento
+        self.choices = self._opciones
+
+    def _opciones(self):
+        opciones = [("", self.empty_label)] if self.empty_label is not None else []
+        return opciones + [
+            (objeto.pk, self.label_from_instance(objeto)) for objeto in getattr(catalogo.actual(), self.lista)
+        ]
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        objeto = catalogo.actual().buscar(self.lista, value)
+        if objeto is None:
+            raise forms.ValidationError(self.error_messages["invalid_choice"], code="invalid_choice")
+        return objeto
+
+
+def campo_barbero(**kwargs):
+    kwargs.setdefault("widget", forms.Select(attrs={"class": "form-select"}))
+    return CampoCatalogo("barberos", Barbero.objects.all(), label="Barbero", **kwargs)
+
+
+def campo_servicio(**kwargs):
+    kwargs.setdefault("widget", forms.Select(attrs={"class": "form-select"}))
+    return CampoCatalogo("servicios", Servicio.objects.all(), label="Servicio", **kwargs)
+
+
+class BuscadorUsuario(forms.TextInput):
+    """Campo de texto que busca clientes por el principio del correo (api buscar_usuarios).
+
+    Lo que se envía es el id, en un campo oculto; nunca se pinta la lista de clientes.
+    """
+
+    template_name = "gestion_citas/widgets/buscador_usuario.html"
+
+    def __init__(self, attrs=None):
+        super().__init__({"class": "form-control", "autocomplete": "off", **(attrs or {})})
+
+    def get_context(self, name, value, attrs):
+        contexto = super().get_context(name, value, attrs)
+        # El cliente elegido se busca por su id (una consulta por clave primaria)
+        usuario = Usuario.objects.filter(pk=value).first() if str(value or "").isdigit() else None
+        contexto["widget"].update(
+            etiqueta=str(usuario) if usuario else "",
+            url=reverse_lazy("buscar_usuarios"),
+        )
+        return contexto
 
 
 class RegistroUsuarioForm(UserCreationForm):
@@ -17,6 +80,9 @@ class RegistroUsuarioForm(UserCreationForm):
 
 
 class CitaForm(forms.ModelForm):
+    barbero = campo_barbero()
+    servicio = campo_servicio()
+
     class Meta:
         model = Cita
         fields = ["barbero", "servicio", "fecha", "hora", "notas"]
@@ -30,13 +96,10 @@ class CitaForm(forms.ModelForm):
                     "placeholder": "Ej: Corte con navaja...",
                 }
             ),
-            "barbero": forms.Select(attrs={"class": "form-select"}),
-            "servicio": forms.Select(attrs={"class": "form-select"}),
         }
 
     def clean_fecha(self):
         fecha = self.cleaned_data["fecha"]
-        import datetime
 
         if fecha < datetime.date.today():
             raise forms.ValidationError("No puedes reservar en una fecha pasada.")
@@ -70,6 +133,9 @@ class ResenaForm(forms.ModelForm):
 
 
 class CitaStaffForm(forms.ModelForm):
+    barbero = campo_barbero()
+    servicio = campo_servicio()
+
     class Meta:
         model = Cita
         fields = ['usuario', 'barbero', 'servicio', 'fecha', 'hora', 'estado', 'notas']
@@ -77,8 +143,108 @@ class CitaStaffForm(forms.ModelForm):
             'fecha': DateInput(format='%Y-%m-%d', attrs={'type': 'date', 'class': 'form-control'}),
             'hora': TimeInput(attrs={'type': 'time', 'class': 'form-control'}),
             'notas': forms.Textarea(attrs={'rows': 3, 'class': 'form-control'}),
-            'barbero': forms.Select(attrs={'class': 'form-select'}),
-            'servicio': forms.Select(attrs={'class': 'form-select'}),
             'estado': forms.Select(attrs={'class': 'form-select'}),
-            'usuario': forms.Select(attrs={'class': 'form-select'}),
+            # Con miles de clientes no cabe un <select>: se buscan por correo
+            'usuario': BuscadorUsuario(),
         }
+
+
+class FiltroDashboardForm(forms.Form):
+    desde = forms.DateField(required=False, widget=DateInput(attrs={"type": "date", "class": "form-control"}))
+    hasta = forms.DateField(required=False, widget=DateInput(attrs={"type": "date", "class": "form-control"}))
+    barbero = campo_barbero(required=False, empty_label="Todos los barberos")
+
+
+class FiltroAgendaForm(forms.Form):
+    semana = forms.DateField(required=False, widget=DateInput(attrs={"type": "date", "class": "form-control"}))
+    barbero = campo_barbero(required=False, empty_label="Todos los barberos")
+    estado = forms.ChoiceField(
+        choices=[("", "Todos los estados")] + Cita.ESTADOS, required=False,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    # Cursor de paginación: "AAAA-MM-DD,HH:MM:SS,id" de la última cita de la página anterior
+    despues = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def clean_despues(self):
+        valor = self.cleaned_data["despues"]
+        if not valor:
+            return None
+        try:
+            fecha, hora, cita_id = valor.split(",")
+            return (
+                datetime.date.fromisoformat(fecha),
+                datetime.time.fromisoformat(hora),
+                int(cita_id),
+            )
+        except ValueError:
+            raise forms.ValidationError("Cursor de paginación no válido.")
+
+
+class SerieCitaForm(forms.ModelForm):
+    barbero = campo_barbero()
+    servicio = campo_servicio()
+
+    class Meta:
+        model = SerieCita
+        fields = ["barbero", "servicio", "hora", "fecha_inicio", "cada_semanas", "fecha_fin", "notas"]
+        labels = {
+            "fecha_inicio": "Primera cita",
+            "cada_semanas": "Repetir cada (semanas)",
+            "fecha_fin": "Hasta",
+        }
+        widgets = {
+            "hora": TimeInput(attrs={"type": "time", "class": "form-control"}),
+            "fecha_inicio": DateInput(attrs={"type": "date", "class": "form-control"}),
+            "cada_semanas": forms.NumberInput(attrs={"min": 1, "max": 8, "class": "form-control"}),
+            "fecha_fin": DateInput(attrs={"type": "date", "class": "form-control"}),
+            "notas": forms.Textarea(attrs={"rows": 2, "class": "form-control"}),
+        }
+
+    def clean_fecha_inicio(self):
+        fecha = self.cleaned_data["fecha_inicio"]
+        if fecha < datetime.date.today():
+            raise forms.ValidationError("No puedes reservar en una fecha pasada.")
+        return fecha
+
+    def clean(self):
+        from .series import MAX_CITAS_SERIE
+
+        datos = super().clean()
+        inicio, fin, cada = datos.get("fecha_inicio"), datos.get("fecha_fin"), datos.get("cada_semanas")
+        if inicio and fin and cada and (fin - inicio).days // (7 * cada) + 1 > MAX_CITAS_SERIE:
+            raise forms.ValidationError(f"Una serie puede tener como máximo {MAX_CITAS_SERIE} citas.")
+        return datos
+
+
+class CambioSerieForm(forms.Form):
+    # Cambios que se aplican a una cita de la serie y a todas las siguientes
+    hora = forms.TimeField(widget=TimeInput(attrs={"type": "time", "class": "form-control"}))
+    servicio = campo_servicio()
+
+
+class EntradaEsperaForm(forms.ModelForm):
+    barbero = campo_barbero()
+    servicio = campo_servicio()
+
+    class Meta:
+        model = EntradaEspera
+        fields = ["barbero", "servicio", "fecha", "desde", "hasta"]
+        labels = {"desde": "Desde las", "hasta": "Hasta las"}
+        help_texts = {"desde": "", "hasta": "Hora de inicio más tardía que te vendría bien."}
+        widgets = {
+            "fecha": DateInput(attrs={"type": "date", "class": "form-control"}),
+            "desde": TimeInput(attrs={"type": "time", "class": "form-control"}),
+            "hasta": TimeInput(attrs={"type": "time", "class": "form-control"}),
+        }
+
+    def clean_fecha(self):
+        fecha = self.cleaned_data["fecha"]
+        if fecha < datetime.date.today():
+            raise forms.ValidationError("No puedes apuntarte para una fecha pasada.")
+        return fecha
+
+    def clean(self):
+        datos = super().clean()
+        if datos.get("desde") and datos.get("hasta") and datos["hasta"] < datos["desde"]:
+            raise forms.ValidationError("La franja termina antes de empezar.")
+        return datos
@@ -0,0 +1,86 @@
+"""
+Historial de estados de las citas y analíticas de cancelaciones.
+
+Cancelar ya no borra la cita: es un cambio de estado más, y cada cambio deja
+una fila en HistorialEstadoCita (la creación también, sin estado anterior).
+
+- Las citas que se guardan de una en una lo registran por señal (signals.py).
+- Los caminos masivos, que no disparan señales, llaman aquí directamente:
+  registrar_creadas() tras un bulk_create y registrar_cambios() desde
+  resumenes.cambiar_estado().
+
+tasas() saca reservas, cancelaciones y no presentados por barbero con un
+único GROUP BY sobre el historial, por su índice (barbero, fecha, estado, cita).
+"""
+
+from django.db.models import Count, Q
+
+from .models import HistorialEstadoCita
+
+
+CANCELADA = "CANCELADA"
+NO_PRESENTADO = "NO_PRESENTADO"
+
+
+def registrar(cita, estado_anterior=None, autor=None):
+    return HistorialEstadoCita.objects.create(
+        cita=cita, barbero_id=cita.barbero_id, fecha=cita.fecha,
+        estado_anterior=estado_anterior, estado=cita.estado, autor=autor,
+    )
+
+
+def registrar_creadas(citas):
+    # Tras un bulk_create (las citas ya tienen id)
+    return HistorialEstadoCita.objects.bulk_create(
+        [
+            HistorialEstadoCita(cita_id=cita.id, barbero_id=cita.barbero_id, fecha=cita.fecha, estado=cita.estado)
+            for cita in citas
+        ],
+        batch_size=500,
+    )
+
+
+def registrar_cambios(filas, nuevo_estado):
+    # filas: (cita_id, barbero_id, fecha, estado anterior) de un update() masivo
+    return HistorialEstadoCita.objects.bulk_create(
+        [
+            HistorialEstadoCita(
+                cita_id=cita_id, barbero_id=barbero_id, fecha=fecha,
+                estado_anterior=anterior, estado=nuevo_estado,
+            )
+            for cita_id, barbero_id, fecha, anterior in filas
+        ],
+        batch_size=500,
+    )
+
+
+def _tasa(parte, total):
+    return round(100 * parte / total, 1) if total else 0.0
+
+
+def tasas(desde=None, hasta=None, barbero_id=None):
+    """Por barbero: reservas, canceladas y no presentadas de las citas del rango, y sus tasas.
+
+    Las fechas son las de las citas, no las del cambio de estado. Cada cita
+    cuenta una vez aunque haya pasado varias veces por el mismo estado.
+    """
+    filas = HistorialEstadoCita.objects.all()
+    if desde:
+        filas = filas.filter(fecha__gte=desde)
+    if hasta:
+        filas = filas.filter(fecha__lte=hasta)
+    if barbero_id:
+        filas = filas.filter(barbero_id=barbero_id)
+
+    resultado = []
+    for fila in (
+        filas.order_by("barbero__nombre").values("barbero_id", "barbero__nombre").annotate(
+            reservas=Count("cita", distinct=True),
+            canceladas=Count("cita", distinct=True, filter=Q(estado=CANCELADA)),
+            no_presentadas=Count("cita", distinct=True, filter=Q(estado=NO_PRESENTADO)),
+        )
+    ):
+        fila["tasa_cancelacion"] = _tasa(fila["canceladas"], fila["reservas"])
+        fila["tasa_no_presentado"] = _tasa(fila["no_presentadas"], fila["reservas"])
+        resultado.append(fila)
+    return resultado
@@ -0,0 +1,232 @@
+"""
+Horario de trabajo de cada barbero y capacidad diaria precalculada.
+
+Los turnos de un barbero en un día salen, por este orden, de:
+
+1. CierreTienda: ese día no trabaja nadie.
+2. ExcepcionHorario del barbero en esa fecha (sin horas, día libre).
+3. Su HorarioSemanal para ese día de la semana.
+4. Si no tiene ningún horario semanal, los TURNOS de siempre, todos los días.
+
+CapacidadDiaria guarda el resultado por barbero y día (turnos, huecos y
+huecos ocupados). recalcular() la rehace cuando cambia un horario;
+actualizar_ocupacion() solo recuenta los ocupados cuando cambian las citas.
+Las filas las escribe el comando recalcular_capacidad (cada noche, los
+próximos días), nunca una lectura: los días que aún no tienen fila se
+calculan en memoria cada vez que se piden, sin guardarlos.
+"""
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Max
+
+from .huecos import PASO_MINUTOS, TURNOS, IndiceHuecos, a_hora, a_minutos
+from .models import Barbero, CapacidadDiaria, CierreTienda, Cita, ExcepcionHorario, HorarioSemanal
+
+
+def escribir_turnos(turnos):
+    return " ".join(f"{inicio}-{fin}" for inicio, fin in turnos)
+
+
+def leer_turnos(texto):
+    # "10:00-14:00 16:00-20:00" -> [("10:00", "14:00"), ("16:00", "20:00")], como TURNOS
+    return [tuple(turno.split("-")) for turno in texto.split()]
+
+
+def _texto(hora):
+    return hora.strftime("%H:%M")
+
+
+def turnos_por_dia(barbero_ids, desde, hasta):
+    """{(barbero_id, fecha): [(inicio, fin), ...]} para todos los días del rango.
+
+    Tres consultas en total, sea cual sea el rango y el número de barberos.
+    """
+    semanales = defaultdict(lambda: defaultdict(list))
+    for barbero_id, dia, inicio, fin in (
+        HorarioSemanal.objects.filter(barbero_id__in=barbero_ids)
+        .order_by("inicio").values_list("barbero_id", "dia_semana", "inicio", "fin")
+    ):
+        semanales[barbero_id][dia].append((_texto(inicio), _texto(fin)))
+
+    excepciones = defaultdict(list)
+    for barbero_id, fecha, inicio, fin in (
+        ExcepcionHorario.objects.filter(barbero_id__in=barbero_ids, fecha__gte=desde, fecha__lte=hasta)
+        .order_by("inicio").values_list("barbero_id", "fecha", "inicio", "fin")
+    ):
+        turnos = excepciones[(barbero_id, fecha)]
+        if inicio is not None:
+            turnos.append((_texto(inicio), _texto(fin)))
+
+    cierres = set(CierreTienda.objects.filter(fecha__gte=desde, fecha__lte=hasta).values_list("fecha", flat=True))
+
+    resultado = {}
+    for barbero_id in barbero_ids:
+        semana = semanales.get(barbero_id)
+        fecha = desde
+        while fecha <= hasta:
+            if fecha in cierres:
+                turnos = []
+            elif (barbero_id, fecha) in excepciones:
+                turnos = excepciones[(barbero_id, fecha)]
+            elif semana is not None:
+                turnos = semana.get(fecha.weekday(), [])
+            else:
+                turnos = TURNOS
+            resultado[(barbero_id, fecha)] = turnos
+            fecha += timedelta(days=1)
+    return resultado
+
+
+def turnos_de(barbero_id, fecha):
+    # Los turnos de un solo día: de CapacidadDiaria si ya está calculado (una consulta)
+    texto = CapacidadDiaria.objects.filter(barbero_id=barbero_id, fecha=fecha).values_list("turnos", flat=True).first()
+    if texto is not None:
+        return leer_turnos(texto)
+    return turnos_por_dia([barbero_id], fecha, fecha)[(barbero_id, fecha)]
+
+
+def inicios(turnos, paso=PASO_MINUTOS):
+    # Horas de inicio de cada hueco de `paso` minutos dentro de los turnos
+    horas = []
+    for inicio, fin in turnos:
+        minuto = a_minutos(inicio)
+        while minuto + paso <= a_minutos(fin):
+            horas.append(a_hora(minuto))
+            minuto += paso
+    return horas
+
+
+def dentro_de_turnos(turnos, hora, duracion):
+    minuto = a_minutos(hora)
+    return any(a_minutos(inicio) <= minuto and minuto + duracion <= a_minutos(fin) for inicio, fin in turnos)
+
+
+def _ocupados(indice, fecha, turnos):
+    return sum(not indice.libre(fecha, hora, PASO_MINUTOS) for hora in inicios(turnos))
+
+
+def _indices(barbero_ids, desde, hasta):
+    # Un IndiceHuecos por barbero con todas sus citas activas del rango, en una consulta
+    filas = defaultdict(list)
+    for barbero_id, fecha, hora, duracion in (
+        Cita.objects.filter(barbero_id__in=barbero_ids, fecha__gte=desde, fecha__lte=hasta)
+        .exclude(estado="CANCELADA")
+        .order_by().values_list("barbero_id", "fecha", "hora", "servicio__duracion")
+    ):
+        filas[barbero_id].append((fecha, hora, duracion))
+    return {barbero_id: IndiceHuecos.desde_citas(filas.get(barbero_id, [])) for barbero_id in barbero_ids}
+
+
+def recalcular(desde=None, hasta=None, barbero_id=None):
+    """Rehace CapacidadDiaria desde los horarios y las citas; devuelve cuántas filas escribe.
+
+    Los días pasados no se guardan (el calendario no los enseña). Sin `hasta`
+    se rehacen solo los días que ya estaban calculados.
+    """
+    desde = max(desde or date.today(), date.today())
+    capacidades = CapacidadDiaria.objects.filter(fecha__gte=desde)
+    barberos = Barbero.objects.all()
+    if barbero_id:
+        capacidades, barberos = capacidades.filter(barbero_id=barbero_id), barberos.filter(id=barbero_id)
+    if hasta is None:
+        hasta = capacidades.aggregate(ultimo=Max("fecha"))["ultimo"]
+    if hasta is None or hasta < desde:
+        return 0
+
+    barbero_ids = list(barberos.values_list("id", flat=True))
+    turnos = turnos_por_dia(barbero_ids, desde, hasta)
+    indices = _indices(barbero_ids, desde, hasta)
+    with transaction.atomic():
+        capacidades.filter(fecha__lte=hasta).delete()
+        nuevas = CapacidadDiaria.objects.bulk_create(
+            (
+                CapacidadDiaria(
+                    barbero_id=barbero, fecha=fecha, turnos=escribir_turnos(del_dia),
+                    huecos=len(inicios(del_dia)), ocupados=_ocupados(indices[barbero], fecha, del_dia),
+                )
+                for (barbero, fecha), del_dia in turnos.items()
+            ),
+            batch_size=500,
+        )
+    return len(nuevas)
+
+
+def actualizar_ocupacion(desde, hasta=None, barbero_id=None):
+    """Recuenta los huecos ocupados de los días ya calculados, con los turnos guardados.
+
+    Es lo que hay que llamar tras crear, mover o cancelar citas; los días sin
+    fila no hace falta tocarlos, porque capacidad() los calcula al leerlos.
+    """
+    hasta = hasta or desde
+    capacidades = CapacidadDiaria.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+    if barbero_id:
+        capacidades = capacidades.filter(barbero_id=barbero_id)
+    filas = list(capacidades.order_by().only("barbero_id", "fecha", "turnos", "ocupados"))
+    if not filas:
+        return 0
+
+    indices = _indices({fila.barbero_id for fila in filas}, desde, hasta)
+    cambiadas = []
+    for fila in filas:
+        ocupados = _ocupados(indices[fila.barbero_id], fila.fecha, leer_turnos(fila.turnos))
+        if ocupados != fila.ocupados:
+            fila.ocupados = ocupados
+            cambiadas.append(fila)
+    CapacidadDiaria.objects.bulk_update(cambiadas, ["ocupados"], batch_size=500)
+    return len(cambiadas)
+
+
+def _calcular(barbero_id, dias, indice=None):
+    # {fecha: CapacidadDiaria sin guardar} de los días pedidos, desde los horarios y las citas
+    desde, hasta = min(dias), max(dias)
+    turnos = turnos_por_dia([barbero_id], desde, hasta)
+    if indice is None:
+        indice = _indices([barbero_id], desde, hasta)[barbero_id]
+    calculadas = {}
+    for fecha in dias:
+        del_dia = turnos[(barbero_id, fecha)]
+        calculadas[fecha] = CapacidadDiaria(
+            barbero_id=barbero_id, fecha=fecha, turnos=escribir_turnos(del_dia),
+            huecos=len(inicios(del_dia)), ocupados=_ocupados(indice, fecha, del_dia),
+        )
+    return calculadas
+
+
+def capacidad(barbero_id, desde, hasta, indice=None):
+    """{fecha: CapacidadDiaria} del barbero en el rango. Los días pasados no se devuelven.
+
+    Normalmente es una sola consulta por el índice (barbero, fecha). Los días
+    que aún no tienen fila se calculan en memoria y no se guardan: esto lo
+    llaman vistas de solo lectura, y la tabla la llenan recalcular_capacidad,
+    las señales y los caminos masivos. `indice`, si se pasa, es un IndiceHuecos
+    que ya tiene las citas activas del rango y ahorra volver a leerlas.
+    """
+    desde = max(desde, date.today())
+    filas = {fila.fecha: fila for fila in CapacidadDiaria.objects.filter(
+        barbero_id=barbero_id, fecha__gte=desde, fecha__lte=hasta
+    )}
+    faltan = [desde + timedelta(days=n) for n in range((hasta - desde).days + 1)]
+    faltan = [fecha for fecha in faltan if fecha not in filas]
+    if faltan:
+        filas.update(_calcular(barbero_id, faltan, indice))
+    return filas
+
+
+acapacidad = sync_to_async(capacidad)
+
+
+def horas_posibles():
+    # Todas las horas que pueden llegar a reservarse con algún horario (botones del formulario).
+    # Una consulta: los turnos semanales y los de las excepciones futuras, sin repetidos
+    turnos = HorarioSemanal.objects.order_by().values_list("inicio", "fin").union(
+        ExcepcionHorario.objects.filter(fecha__gte=date.today(), inicio__isnull=False)
+        .order_by().values_list("inicio", "fin")
+    )
+    horas = set(inicios(TURNOS))
+    for inicio, fin in turnos:
+        horas.update(inicios([(_texto(inicio), _texto(fin))]))
+    return [_texto(hora) for hora in sorted(horas)]
@@ -0,0 +1,119 @@
+from bisect import bisect_left
+from datetime import datetime, time
+
+
+# Turnos de trabajo de la barbería (inicio incluido, fin excluido)
+TURNOS = [("10:00", "14:00"), ("16:00", "20:00")]
+
+# Cada cuánto empieza un hueco reservable, en minutos
+PASO_MINUTOS = 30
+
+MINUTOS_DIA = 24 * 60
+
+
+def a_minutos(hora):
+    # Acepta datetime.time o "HH:MM" y devuelve minutos desde medianoche
+    if isinstance(hora, str):
+        hora = datetime.strptime(hora, "%H:%M").time()
+    return hora.hour * 60 + hora.minute
+
+
+def a_hora(minutos):
+    return time(minutos // 60, minutos % 60)
+
+
+def generar_horarios(turnos=TURNOS, paso=PASO_MINUTOS):
+    horarios = []
+    for inicio, fin in turnos:
+        minuto = a_minutos(inicio)
+        while minuto < a_minutos(fin):
+            horarios.append(a_hora(minuto).strftime("%H:%M"))
+            minuto += paso
+    return horarios
+
+
+HORARIOS_DISPONIBLES = generar_horarios()
+
+
+def _clave(fecha, minutos):
+    # Minuto absoluto: permite guardar varios días en el mismo índice
+    return fecha.toordinal() * MINUTOS_DIA + minutos
+
+
+class IndiceHuecos:
+    """Índice ordenado de las citas de un barbero, como intervalos [inicio, fin).
+
+    Las consultas hacen una única búsqueda binaria sobre los inicios y miran el
+    mayor fin acumulado a su izquierda, así que cuestan O(log n) aunque haya
+    citas solapadas de antes.
+    """
+
+    def __init__(self, intervalos=()):
+        intervalos = sorted(intervalos)
+        self.inicios = [inicio for inicio, _ in intervalos]
+        self.max_fin = []
+        mayor = None
+        for _, fin in intervalos:
+            mayor = fin if mayor is None else max(mayor, fin)
+            self.max_fin.append(mayor)
+
+    @classmethod
+    def desde_citas(cls, filas):
+        # filas: iterable de (fecha, hora, duracion en minutos)
+        intervalos = []
+        for fecha, hora, duracion in filas:
+            inicio = _clave(fecha, a_minutos(hora))
+            intervalos.append((inicio, inicio + duracion))
+        return cls(intervalos)
+
+    @classmethod
+    def cargar(cls, barbero_id, desde, hasta=None, excluir=None):
+        # Una sola consulta con las columnas justas, sin instanciar modelos
+        from .models import Cita
+
+        # Las canceladas no ocupan hueco
+        citas = Cita.objects.filter(
+            barbero_id=barbero_id, fecha__gte=desde, fecha__lte=hasta or desde
+        ).exclude(estado="CANCELADA")
+        if excluir is not None:
+            citas = citas.exclude(id=excluir)
+        return cls.desde_citas(
+            citas.order_by().values_list("fecha", "hora", "servicio__duracion")
+        )
+
+    def __len__(self):
+        return len(self.inicios)
+
+    def anadir(self, fecha, hora, duracion):
+        # Inserta una cita ya aceptada (p. ej. durante una importación); O(n)
+        inicio = _clave(fecha, a_minutos(hora))
+        fin = inicio + duracion
+        posicion = bisect_left(self.inicios, inicio)
+        anterior = self.max_fin[posicion - 1] if posicion else fin
+        self.inicios.insert(posicion, inicio)
+        self.max_fin.insert(posicion, max(anterior, fin))
+        # El máximo acumulado de las que van detrás puede subir con la nueva
+        for indice in range(posicion + 1, len(self.max_fin)):
+            if self.max_fin[indice] >= fin:
+                break
+            self.max_fin[indice] = fin
+
+    def libre(self, fecha, hora, duracion):
+        inicio = _clave(fecha, a_minutos(hora))
+        fin = inicio + duracion
+        # Citas que empiezan antes de que acabe la nueva: basta con la que acaba más tarde
+        posicion = bisect_left(self.inicios, fin)
+        return posicion == 0 or self.max_fin[posicion - 1] <= inicio
+
+    def inicios_libres(self, fecha, duracion, turnos=TURNOS, paso=PASO_MINUTOS):
+        # Horas de inicio en las que cabe un servicio de `duracion` minutos sin salirse del turno
+        libres = []
+        for inicio_turno, fin_turno in turnos:
+            minuto = a_minutos(inicio_turno)
+            limite = a_minutos(fin_turno)
+            while minuto + duracion <= limite:
+                hora = a_hora(minuto)
+                if self.libre(fecha, hora, duracion):
+                    libres.append(hora.strftime("%H:%M"))
+                minuto += paso
+        return libres
@@ -0,0 +1,62 @@
+import hashlib
+import posixpath
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+# Tamaños que se generan para cada foto de barbero (ancho, alto), recortados al centro.
+# "-2x" es la misma variante para pantallas de alta densidad.
+VARIANTES = {
+    "avatar": (100, 100),
+    "avatar-2x": (200, 200),
+    "tarjeta": (400, 300),
+    "tarjeta-2x": (800, 600),
+}
+
+FORMATOS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def _nombre_derivado(original, huella, variante, extension):
+    # barberos/juan.jpg -> barberos/juan.3f9a1c2b7d.tarjeta-2x.webp (junto al original)
+    carpeta, fichero = posixpath.split(original)
+    raiz = posixpath.splitext(fichero)[0]
+    return posixpath.join(carpeta, f"{raiz}.{huella}.{variante}.{extension}")
+
+
+def generar_derivados(original, storage=None):
+    """Genera todas las variantes de una foto y devuelve el diccionario para Barbero.miniaturas.
+
+    Los nombres llevan un hash del contenido, así que pueden cachearse para
+    siempre y repetir la operación no vuelve a escribir nada. No toca la BD:
+    se puede llamar desde otro proceso.
+    """
+    storage = storage or default_storage
+    with storage.open(original, "rb") as fichero:
+        contenido = fichero.read()
+    huella = hashlib.sha1(contenido).hexdigest()[:10]
+
+    imagen = ImageOps.exif_transpose(Image.open(BytesIO(contenido))).convert("RGB")
+    derivados = {"origen": original, "huella": huella, "variantes": {}}
+    for variante, tamano in VARIANTES.items():
+        recorte = None
+        rutas = {}
+        for extension, (formato, opciones) in FORMATOS.items():
+            nombre = _nombre_derivado(original, huella, variante, extension)
+            if not storage.exists(nombre):
+                recorte = recorte or ImageOps.fit(imagen, tamano, Image.Resampling.LANCZOS)
+                salida = BytesIO()
+                recorte.save(salida, formato, **opciones)
+                nombre = storage.save(nombre, ContentFile(salida.getvalue()))
+            rutas[extension] = nombre
+        derivados["variantes"][variante] = {"ancho": tamano[0], "alto": tamano[1], **rutas}
+    return derivados
+
+
+def necesita_derivados(barbero):
+    return bool(barbero.foto) and (barbero.miniaturas or {}).get("origen") != barbero.foto.name
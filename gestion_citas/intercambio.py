@@ -0,0 +1,233 @@
+"""
+Importación y exportación masiva de citas (CSV y JSON).
+
+La exportación es un generador: lee las citas con iterator(chunk_size) y va
+soltando texto, así que la memoria no depende de cuántas haya. La
+importación valida por lotes: carga de una vez los usuarios del lote y el
+IndiceHuecos de cada barbero para las fechas del lote, comprueba cada fila
+en memoria (también contra las filas anteriores del mismo fichero) y guarda
+las válidas con bulk_create en una transacción por lote.
+"""
+
+import csv
+import json
+from collections import defaultdict
+from datetime import date, time
+
+from django.db import IntegrityError, transaction
+
+from . import historial, horarios, resumenes
+from .huecos import IndiceHuecos
+from .models import Barbero, Cita, Servicio, Usuario
+
+
+COLUMNAS = [
+    "id", "fecha", "hora", "estado", "barbero_id", "barbero", "servicio_id", "servicio",
+    "duracion", "precio", "usuario_email", "usuario", "notas",
+]
+
+_CAMPOS = [
+    "id", "fecha", "hora", "estado", "barbero_id", "barbero__nombre", "servicio_id", "servicio__nombre",
+    "servicio__duracion", "servicio__precio", "usuario__email", "usuario__first_name", "notas",
+]
+
+TAMANO_BLOQUE = 2000
+TAMANO_LOTE = 1000
+
+ESTADOS = {clave for clave, _ in Cita.ESTADOS}
+
+
+# --- Exportación ---
+
+def filas(citas, chunk_size=TAMANO_BLOQUE):
+    # Tuplas en el orden de COLUMNAS, sin instanciar modelos ni cachear el queryset
+    consulta = citas.order_by("fecha", "hora", "id").values_list(*_CAMPOS)
+    for fila in consulta.iterator(chunk_size=chunk_size):
+        yield [valor.isoformat() if isinstance(valor, (date, time)) else valor for valor in fila]
+
+
+class _Eco:
+    # "Fichero" cuyo write devuelve la línea, para sacar texto de csv.writer
+    def write(self, valor):
+        return valor
+
+
+def exportar_csv(citas, chunk_size=TAMANO_BLOQUE):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(COLUMNAS)
+    for fila in filas(citas, chunk_size):
+        yield escritor.writerow(fila)
+
+
+def exportar_json(citas, chunk_size=TAMANO_BLOQUE):
+    # Una lista JSON, un objeto por línea
+    separador = "[\n"
+    for fila in filas(citas, chunk_size):
+        yield separador + json.dumps(dict(zip(COLUMNAS, fila)), default=str, ensure_ascii=False)
+        separador = ",\n"
+    yield "[]\n" if separador == "[\n" else "\n]\n"
+
+
+EXPORTADORES = {
+    "csv": (exportar_csv, "text/csv; charset=utf-8"),
+    "json": (exportar_json, "application/json"),
+}
+
+
+# --- Importación ---
+
+def leer(fichero, formato):
+    """Devuelve un iterador de diccionarios a partir de un fichero de texto.
+
+    CSV se lee fila a fila. JSON admite una lista (se carga entera) o JSON
+    Lines, un objeto por línea (se lee en streaming).
+    """
+    if formato == "csv":
+        return csv.DictReader(fichero)
+    primero = fichero.read(1)
+    while primero.isspace():
+        primero = fichero.read(1)
+    if primero == "[":
+        return iter(json.loads(primero + fichero.read()))
+    return (json.loads(linea) for linea in _con_primero(primero, fichero) if linea.strip())
+
+
+def _con_primero(primero, fichero):
+    lineas = iter(fichero)
+    yield primero + next(lineas, "")
+    yield from lineas
+
+
+class InformeImportacion:
+    def __init__(self):
+        self.leidas = 0
+        self.validas = 0
+        self.creadas = 0
+        self.errores = []  # (número de fila, mensaje)
+
+    def error(self, numero, mensaje):
+        self.errores.append((numero, mensaje))
+
+    def como_dict(self, limite=None):
+        return {
+            "leidas": self.leidas,
+            "validas": self.validas,
+            "creadas": self.creadas,
+            "con_errores": len(self.errores),
+            "errores": [{"fila": fila, "error": mensaje} for fila, mensaje in self.errores[:limite]],
+        }
+
+
+def importar(registros, lote=TAMANO_LOTE, simular=False):
+    """Valida y crea citas a partir de diccionarios con las columnas de COLUMNAS.
+
+    Usa fecha, hora, barbero_id, servicio_id, usuario_email y, si vienen,
+    estado y notas; el resto se ignora, así que un fichero exportado se puede
+    volver a importar. Las filas con errores se saltan y quedan en el informe.
+    Con `simular` no se escribe nada.
+    """
+    informe = InformeImportacion()
+    barberos = set(Barbero.objects.values_list("id", flat=True))
+    duraciones = dict(Servicio.objects.values_list("id", "duracion"))
+
+    pendientes = []
+    for numero, registro in enumerate(registros, 1):
+        informe.leidas += 1
+        pendientes.append((numero, registro))
+        if len(pendientes) >= lote:
+            _importar_lote(pendientes, barberos, duraciones, informe, simular)
+            pendientes = []
+    if pendientes:
+        _importar_lote(pendientes, barberos, duraciones, informe, simular)
+    return informe
+
+
+def _importar_lote(pendientes, barberos, duraciones, informe, simular):
+    # 1. Cada fila por separado: formato y claves ajenas
+    analizadas = []
+    for numero, registro in pendientes:
+        try:
+            analizadas.append((numero, _analizar(registro, barberos, duraciones)))
+        except ValueError as error:
+            informe.error(numero, str(error))
+
+    emails = {datos["usuario_email"] for _, datos in analizadas}
+    usuarios = dict(Usuario.objects.filter(email__in=emails).values_list("email", "id"))
+
+    # 2. Solapes: un índice por barbero con las citas ya guardadas en las fechas del lote
+    fechas = defaultdict(list)
+    for _, datos in analizadas:
+        fechas[datos["barbero_id"]].append(datos["fecha"])
+    indices = {
+        barbero_id: IndiceHuecos.cargar(barbero_id, min(dias), max(dias))
+        for barbero_id, dias in fechas.items()
+    }
+
+    nuevas = []
+    for numero, datos in analizadas:
+        usuario_id = usuarios.get(datos["usuario_email"])
+        if usuario_id is None:
+            informe.error(numero, f"No existe el usuario {datos['usuario_email']}")
+            continue
+        duracion = duraciones[datos["servicio_id"]]
+        if datos["estado"] != "CANCELADA":
+            indice = indices[datos["barbero_id"]]
+            if not indice.libre(datos["fecha"], datos["hora"], duracion):
+                informe.error(numero, f"El barbero {datos['barbero_id']} ya tiene una cita a esa hora")
+                continue
+            indice.anadir(datos["fecha"], datos["hora"], duracion)
+        nuevas.append((numero, Cita(
+            usuario_id=usuario_id, barbero_id=datos["barbero_id"], servicio_id=datos["servicio_id"],
+            fecha=datos["fecha"], hora=datos["hora"], estado=datos["estado"], notas=datos["notas"],
+        )))
+
+    informe.validas += len(nuevas)
+    if simular or not nuevas:
+        return
+
+    # 3. Un INSERT por bloque y los resúmenes del dashboard de los días tocados
+    try:
+        with transaction.atomic():
+            historial.registrar_creadas(
+                Cita.objects.bulk_create([cita for _, cita in nuevas], batch_size=TAMANO_LOTE)
+            )
+            for barbero_id, dias in fechas.items():
+                resumenes.reconstruir(min(dias), max(dias), barbero_id=barbero_id)
+                horarios.actualizar_ocupacion(min(dias), max(dias), barbero_id=barbero_id)
+    except IntegrityError:
+        # Alguien ha reservado uno de esos huecos mientras importábamos: el lote entero se deshace
+        informe.validas -= len(nuevas)
+        for numero, _ in nuevas:
+            informe.error(numero, "Conflicto con una reserva hecha durante la importación; vuelve a importarla")
+        return
+    informe.creadas += len(nuevas)
+
+
+def _analizar(registro, barberos, duraciones):
+    if not isinstance(registro, dict):
+        raise ValueError("La fila no es un objeto con columnas")
+    faltan = [campo for campo in ("fecha", "hora", "barbero_id", "servicio_id", "usuario_email")
+              if not str(registro.get(campo) or "").strip()]
+    if faltan:
+        raise ValueError(f"Faltan columnas: {', '.join(faltan)}")
+    try:
+        fecha = date.fromisoformat(str(registro["fecha"]).strip())
+        hora = time.fromisoformat(str(registro["hora"]).strip())
+    except ValueError:
+        raise ValueError("Fecha u hora no válida (AAAA-MM-DD y HH:MM)")
+    try:
+        barbero_id, servicio_id = int(registro["barbero_id"]), int(registro["servicio_id"])
+    except (TypeError, ValueError):
+        raise ValueError("barbero_id y servicio_id deben ser números")
+    if barbero_id not in barberos:
+        raise ValueError(f"No existe el barbero {barbero_id}")
+    if servicio_id not in duraciones:
+        raise ValueError(f"No existe el servicio {servicio_id}")
+    estado = str(registro.get("estado") or "PENDIENTE").strip().upper()
+    if estado not in ESTADOS:
+        raise ValueError(f"Estado no válido: {estado}")
+    return {
+        "fecha": fecha, "hora": hora, "barbero_id": barbero_id, "servicio_id": servicio_id,
+        "usuario_email": str(registro["usuario_email"]).strip(), "estado": estado,
+        "notas": registro.get("notas") or None,
+    }
@@ -0,0 +1,191 @@
+"""
+Lista de espera: cuando se libera un hueco, se le ofrece al mejor candidato.
+
+Cancelar una cita solo deja una fila en HuecoLiberado (y solo si alguien
+espera ese día a ese barbero); el trabajo lo hace procesar(), que lanza en
+segundo plano el comando lista_espera:
+
+1. Las ofertas que nadie ha confirmado a tiempo se cancelan; su hueco vuelve
+   a la cola para el siguiente.
+2. Las entradas de días ya pasados caducan.
+3. Para cada hueco de la cola se buscan candidatas con el índice
+   (barbero, fecha, estado, creada): las que esperan ese día, ya por orden de
+   llegada, saltando las que no incluyen la hora en su franja. A la primera a
+   la que le cabe su servicio se le reserva la cita en la misma transacción en
+   que se marca la entrada, y tiene LISTA_ESPERA_MINUTOS_OFERTA minutos para
+   confirmarla (o se le asigna sin más con LISTA_ESPERA_ASIGNAR).
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from . import horarios
+from .huecos import IndiceHuecos
+from .models import Cita, EntradaEspera, HuecoLiberado, MensajeSalida
+from .reservas import _en_transaccion, _es_hueco_duplicado
+
+
+NOTA_CITA = "Reservada desde la lista de espera"
+
+
+def minutos_oferta():
+    return getattr(settings, "LISTA_ESPERA_MINUTOS_OFERTA", 30)
+
+
+def asignar_directamente():
+    return getattr(settings, "LISTA_ESPERA_ASIGNAR", False)
+
+
+# --- Encolar (lo que se hace al cancelar) ---
+
+def encolar(barbero_id, fecha, hora):
+    # Una consulta si nadie espera ese día; dos si hay que encolar
+    if fecha < timezone.localdate():
+        return False
+    if not EntradaEspera.objects.filter(barbero_id=barbero_id, fecha=fecha, estado=EntradaEspera.ESPERANDO).exists():
+        return False
+    HuecoLiberado.objects.create(barbero_id=barbero_id, fecha=fecha, hora=hora)
+    return True
+
+
+def encolar_citas(citas):
+    """Encola los huecos de un queryset de citas que se van a cancelar en bloque."""
+    filas = list(
+        citas.filter(fecha__gte=timezone.localdate()).exclude(estado="CANCELADA")
+        .order_by().values_list("barbero_id", "fecha", "hora")
+    )
+    if not filas:
+        return 0
+    esperan = set(
+        EntradaEspera.objects.filter(
+            barbero_id__in={barbero_id for barbero_id, _, _ in filas},
+            fecha__gte=min(fecha for _, fecha, _ in filas), fecha__lte=max(fecha for _, fecha, _ in filas),
+            estado=EntradaEspera.ESPERANDO,
+        ).values_list("barbero_id", "fecha")
+    )
+    huecos = HuecoLiberado.objects.bulk_create([
+        HuecoLiberado(barbero_id=barbero_id, fecha=fecha, hora=hora)
+        for barbero_id, fecha, hora in filas
+        if (barbero_id, fecha) in esperan
+    ])
+    return len(huecos)
+
+
+# --- Asignar ---
+
+def candidatas(barbero_id, fecha, hora):
+    # Las que esperan ese día con una franja que incluye la hora, por orden de llegada. El índice
+    # da las del día ya ordenadas; la franja se mira sobre la marcha (un rango sobre `desde`
+    # en el índice obligaría a ordenar aparte)
+    return (
+        EntradaEspera.objects.filter(
+            barbero_id=barbero_id, fecha=fecha, estado=EntradaEspera.ESPERANDO,
+            desde__lte=hora, hasta__gte=hora,
+        )
+        .select_related("servicio")
+        .order_by("creada", "id")
+    )
+
+
+class _YaNoEspera(Exception):
+    pass
+
+
+def _reservar(entrada, hora, ahora):
+    cita = Cita(
+        usuario_id=entrada.usuario_id, barbero_id=entrada.barbero_id, servicio=entrada.servicio,
+        fecha=entrada.fecha, hora=hora, notas=NOTA_CITA,
+    )
+    # El correo de la reserva es el de la oferta (ver notificaciones.py)
+    cita._aviso = MensajeSalida.OFERTA
+    if asignar_directamente():
+        cambios = {"estado": EntradaEspera.ATENDIDA}
+    else:
+        cambios = {"estado": EntradaEspera.OFRECIDA, "oferta_expira": ahora + timedelta(minutes=minutos_oferta())}
+
+    def operacion():
+        cita.full_clean(validate_constraints=False)
+        cita.save()
+        # Solo si sigue esperando: si se ha retirado entre medias, se deshace la cita
+        if not EntradaEspera.objects.filter(id=entrada.id, estado=EntradaEspera.ESPERANDO).update(cita=cita, **cambios):
+            raise _YaNoEspera
+        return cita
+
+    try:
+        return _en_transaccion(operacion)
+    except (ValidationError, _YaNoEspera):
+        return None
+    except IntegrityError as error:
+        if not _es_hueco_duplicado(error):
+            raise
+        return None
+
+
+def asignar(hueco, ahora=None):
+    """Reserva el hueco a la primera candidata a la que le cabe; devuelve su entrada o None."""
+    ahora = ahora or timezone.now()
+    indice = IndiceHuecos.cargar(hueco.barbero_id, hueco.fecha)
+    turnos = horarios.turnos_de(hueco.barbero_id, hueco.fecha)
+    for entrada in candidatas(hueco.barbero_id, hueco.fecha, hueco.hora):
+        duracion = entrada.servicio.duracion
+        if not (horarios.dentro_de_turnos(turnos, hueco.hora, duracion) and indice.libre(hueco.fecha, hueco.hora, duracion)):
+            continue
+        if _reservar(entrada, hueco.hora, ahora) is not None:
+            return entrada
+    return None
+
+
+# --- Respuestas del cliente y caducidad ---
+
+def liberar_oferta(entrada, estado):
+    """Cancela la cita ofrecida y deja la entrada en `estado` (CADUCADA o RETIRADA).
+
+    Al cancelar la cita, su hueco vuelve a la cola para el siguiente candidato.
+    """
+    with transaction.atomic():
+        if not EntradaEspera.objects.filter(id=entrada.id, estado=EntradaEspera.OFRECIDA).update(estado=estado):
+            return False
+        cita = Cita.objects.filter(id=entrada.cita_id).exclude(estado="CANCELADA").first()
+        if cita is not None:
+            cita.estado = "CANCELADA"
+            cita.save()
+    return True
+
+
+def aceptar_oferta(entrada, ahora=None):
+    ahora = ahora or timezone.now()
+    return bool(
+        EntradaEspera.objects.filter(
+            id=entrada.id, estado=EntradaEspera.OFRECIDA, oferta_expira__gt=ahora
+        ).update(estado=EntradaEspera.ATENDIDA)
+    )
+
+
+def caducar_ofertas(ahora=None):
+    ahora = ahora or timezone.now()
+    vencidas = EntradaEspera.objects.filter(estado=EntradaEspera.OFRECIDA, oferta_expira__lte=ahora)
+    return sum(liberar_oferta(entrada, EntradaEspera.CADUCADA) for entrada in vencidas)
+
+
+def procesar(lote=100, ahora=None):
+    """Una pasada completa; devuelve (ofertas caducadas, huecos procesados, asignados)."""
+    ahora = ahora or timezone.now()
+    caducadas = caducar_ofertas(ahora)
+    EntradaEspera.objects.filter(estado=EntradaEspera.ESPERANDO, fecha__lt=timezone.localdate(ahora)).update(
+        estado=EntradaEspera.CADUCADA
+    )
+
+    local = timezone.localtime(ahora)
+    procesados = asignados = 0
+    for hueco in HuecoLiberado.objects.order_by("id")[:lote]:
+        # Los huecos que ya han pasado mientras esperaban en la cola se descartan
+        futuro = (hueco.fecha, hueco.hora) > (local.date(), local.time())
+        if futuro and asignar(hueco, ahora) is not None:
+            asignados += 1
+        hueco.delete()
+        procesados += 1
+    return caducadas, procesados, asignados
@@ -0,0 +1,25 @@
+from contextlib import contextmanager
+from time import perf_counter
+
+from django.db import connection
+
+
+@contextmanager
+def base_de_datos_temporal():
+    # Los benchmarks trabajan sobre una base de datos de pruebas desechable,
+    # nunca sobre db.sqlite3
+    nombre_original = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False
+    )
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre_original, verbosity=0)
+
+
+def cronometrar(funcion, argumentos):
+    # Ejecuta funcion(*args) para cada elemento y devuelve el tiempo total en segundos
+    inicio = perf_counter()
+    for args in argumentos:
+        funcion(*args)
+    return perf_counter() - inicio
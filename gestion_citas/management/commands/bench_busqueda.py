@@ -0,0 +1,95 @@
+import statistics
+from functools import reduce
+from operator import and_, or_
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from gestion_citas import busqueda
+from gestion_citas.models import Cita, Usuario
+from gestion_citas.sembrado import sembrar
+
+from ._bench import base_de_datos_temporal
+
+
+# Lo que escribe el staff: un correo casi entero, un prefijo de correo, un apellido sin
+# tilde, nombre y apellido, algo de las notas y algo que no existe
+BUSQUEDAS = ["cliente12345", "cliente99", "garcia", "marta lopez", "alergia", "zzzz"]
+
+NOTAS = ["Alergia al tinte", "Prefiere máquina del 2", "Llega siempre tarde", "Cliente nuevo, trato amable"]
+
+CAMPOS_USUARIO = ("email", "first_name", "last_name")
+CAMPOS_CITA = ("usuario__email", "usuario__first_name", "usuario__last_name", "notas")
+
+# Filas por página del changelist del admin
+POR_PAGINA = 100
+
+
+def _icontains(campos, texto):
+    # Lo que hace el admin con search_fields: cada palabra en algún campo, todas a la vez
+    return reduce(and_, (
+        reduce(or_, (Q(**{f"{campo}__icontains": palabra}) for campo in campos))
+        for palabra in texto.split()
+    ))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compara la búsqueda del admin con icontains y con el índice FTS5 (busqueda.py), "
+        "sobre una BD temporal sembrada con muchos clientes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--usuarios", type=int, default=100000, help="Clientes sembrados (por defecto 100000)")
+        parser.add_argument("--repeticiones", type=int, default=5, help="Veces que se repite cada búsqueda")
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options)
+
+    def _ejecutar(self, options):
+        inicio = perf_counter()
+        sembrar(barberos=3, servicios=4, usuarios=options["usuarios"], meses=1, ocupacion=0.5, resenas=0)
+        # Notas en una de cada cinco citas (el update() también pasa por los triggers)
+        ids = list(Cita.objects.order_by("id").values_list("id", flat=True))
+        for posicion, texto in enumerate(NOTAS):
+            Cita.objects.filter(id__in=ids[posicion::5]).update(notas=texto)
+        self.stdout.write(
+            f"{Usuario.objects.count()} usuarios y {len(ids)} citas sembrados en {perf_counter() - inicio:.1f} s"
+        )
+
+        for titulo, modelo, campos, filtro in (
+            ("Clientes (UsuarioAdmin)", Usuario, CAMPOS_USUARIO, busqueda.filtro_usuarios),
+            ("Citas (CitaAdmin)", Cita, CAMPOS_CITA, busqueda.filtro_citas),
+        ):
+            self.stdout.write(f"\n{titulo}: count() + primera página de {POR_PAGINA}, mediana de "
+                              f"{options['repeticiones']} repeticiones")
+            self.stdout.write(f"  {'búsqueda':<14} {'icontains':>22} {'FTS5':>22}")
+            for texto in BUSQUEDAS:
+                antes = self._medir(modelo.objects.filter(_icontains(campos, texto)), options["repeticiones"])
+                consulta = busqueda.consulta_fts(texto)
+                ahora = self._medir(modelo.objects.filter(filtro(consulta)), options["repeticiones"])
+                self.stdout.write(
+                    f"  {texto:<14} {antes[0]:9.2f} ms {antes[1]:7d} filas {ahora[0]:9.2f} ms {ahora[1]:7d} filas"
+                )
+
+        self.stdout.write(f"\nClientes por relevancia (busqueda.clientes, {busqueda.RESULTADOS_POR_TIPO} primeros)")
+        for texto in BUSQUEDAS:
+            consulta = busqueda.consulta_fts(texto)
+            tiempos = []
+            for _ in range(options["repeticiones"]):
+                inicio = perf_counter()
+                busqueda.clientes(consulta)
+                tiempos.append(perf_counter() - inicio)
+            self.stdout.write(f"  {texto:<14} {statistics.median(tiempos) * 1000:9.2f} ms")
+
+    def _medir(self, queryset, repeticiones):
+        # Lo que pide el changelist: cuántas hay y los ids de la primera página
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = perf_counter()
+            total = queryset.count()
+            list(queryset.order_by("-pk").values_list("pk", flat=True)[:POR_PAGINA])
+            tiempos.append(perf_counter() - inicio)
+        return statistics.median(tiempos) * 1000, total
@@ -0,0 +1,80 @@
+import random
+from datetime import date, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from gestion_citas.huecos import HORARIOS_DISPONIBLES, IndiceHuecos
+from gestion_citas.models import Barbero, Cita, Servicio, Usuario
+
+from ._bench import base_de_datos_temporal, cronometrar
+
+
+class Command(BaseCommand):
+    help = "Compara el índice de huecos con la comprobación exists() por consulta, sobre una BD temporal."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--citas", type=int, default=10000, help="Citas por barbero (por defecto 10000)")
+        parser.add_argument("--consultas", type=int, default=2000, help="Comprobaciones a cronometrar")
+        parser.add_argument("--semilla", type=int, default=42)
+
+    def handle(self, *args, **options):
+        with base_de_datos_temporal():
+            self._ejecutar(options)
+
+    def _ejecutar(self, options):
+        aleatorio = random.Random(options["semilla"])
+        usuario = Usuario.objects.create_user(
+            email="bench@example.com", password=None, first_name="Bench", last_name="Huecos"
+        )
+        servicio = Servicio.objects.create(nombre="Corte", precio="15.00", duracion=30)
+        barbero = Barbero.objects.create(nombre="Bench", apellido="Barbero", experiencia=1)
+
+        # Rellenamos días consecutivos hueco a hueco (bulk_create no pasa por Cita.clean)
+        hoy = date.today()
+        citas = []
+        for n in range(options["citas"]):
+            dia, hueco = divmod(n, len(HORARIOS_DISPONIBLES))
+            citas.append(Cita(
+                usuario=usuario, barbero=barbero, servicio=servicio,
+                fecha=hoy + timedelta(days=dia), hora=HORARIOS_DISPONIBLES[hueco],
+            ))
+        Cita.objects.bulk_create(citas, batch_size=1000)
+        ultimo_dia = hoy + timedelta(days=(options["citas"] - 1) // len(HORARIOS_DISPONIBLES))
+
+        consultas = []
+        for _ in range(options["consultas"]):
+            fecha = hoy + timedelta(days=aleatorio.randint(0, (ultimo_dia - hoy).days))
+            consultas.append((fecha, aleatorio.choice(HORARIOS_DISPONIBLES)))
+
+        # 1. Lo de antes: una consulta exists() por comprobación (coincidencia exacta de hora)
+        def con_exists(fecha, hora):
+            Cita.objects.filter(barbero=barbero, fecha=fecha, hora=hora).exists()
+
+        # 2. Lo que hace Cita.clean ahora: cargar el día del barbero y preguntar al índice
+        def con_indice_dia(fecha, hora):
+            IndiceHuecos.cargar(barbero.id, fecha).libre(fecha, hora, servicio.duracion)
+
+        # 3. Un único índice con todas las citas del barbero, consultado en memoria
+        inicio = perf_counter()
+        indice = IndiceHuecos.cargar(barbero.id, hoy, ultimo_dia)
+        construccion = perf_counter() - inicio
+
+        def con_indice_global(fecha, hora):
+            indice.libre(fecha, hora, servicio.duracion)
+
+        resultados = [
+            ("exists() por consulta", cronometrar(con_exists, consultas)),
+            ("índice del día (Cita.clean)", cronometrar(con_indice_dia, consultas)),
+            ("índice global en memoria", cronometrar(con_indice_global, consultas)),
+        ]
+
+        self.stdout.write(
+            f"{Cita.objects.count()} citas, {len(consultas)} consultas; "
+            f"índice global construido en {construccion * 1000:.1f} ms ({len(indice)} intervalos)"
+        )
+        for nombre, segundos in resultados:
+            self.stdout.write(
+                f"  {nombre:<30} {segundos * 1000:9.1f} ms  "
+                f"({segundos / len(consultas) * 1e6:8.1f} µs/consulta)"
+            )
@@ -0,0 +1,94 @@
+import json
+from datetime import datetime
+from functools import partial
+
+import django
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from gestion_citas.benchmark import (
+    MEZCLA_POR_DEFECTO, ClienteHttp, ClienteLocal, cargar_mezcla, comparar, reproducir,
+)
+from gestion_citas.sembrado import ESCALAS, sembrar
+
+from ._bench import base_de_datos_temporal
+
+
+class Command(BaseCommand):
+    help = (
+        "Siembra una BD temporal y reproduce la mezcla de peticiones de gestion_citas/bench/mezcla.jsonl, "
+        "midiendo peticiones/s, latencias y consultas por tipo de petición. Con --servidor se lanza "
+        "contra un servidor ya arrancado (sembrado antes con sembrar_datos) en lugar del Client de Django."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--mezcla", default=str(MEZCLA_POR_DEFECTO))
+        parser.add_argument("--escala", choices=sorted(ESCALAS), default="pequena")
+        parser.add_argument("--peticiones", type=int, default=500)
+        parser.add_argument("--calentamiento", type=int, default=20, help="Peticiones previas que no se miden")
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--servidor", help="URL base, p. ej. http://127.0.0.1:8000")
+        parser.add_argument("--salida", help="Guarda los resultados en este JSON")
+        parser.add_argument("--comparar", help="JSON de una ejecución anterior; falla si hay regresiones")
+        parser.add_argument("--tolerancia", type=float,
+                            help="Compara también el p95 (0.25 = hasta un 25%% más lento)")
+
+    def handle(self, *args, **options):
+        mezcla = cargar_mezcla(options["mezcla"])
+        parametros = {
+            "escala": options["escala"], "peticiones": options["peticiones"],
+            "calentamiento": options["calentamiento"], "semilla": options["semilla"],
+        }
+        if options["servidor"]:
+            resultados = self._reproducir(mezcla, partial(ClienteHttp, options["servidor"]), options)
+            parametros["servidor"] = options["servidor"]
+        else:
+            # El Client de Django se presenta como "testserver"
+            hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+            with base_de_datos_temporal(), override_settings(ALLOWED_HOSTS=hosts):
+                sembrar(semilla=options["semilla"], **ESCALAS[options["escala"]])
+                cache.clear()
+                resultados = self._reproducir(mezcla, ClienteLocal, options)
+
+        resultados = {
+            "parametros": parametros,
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "django": django.get_version(),
+            **resultados,
+        }
+        self._tabla(resultados)
+
+        if options["salida"]:
+            with open(options["salida"], "w", encoding="utf-8") as fichero:
+                json.dump(resultados, fichero, indent=2, ensure_ascii=False)
+                fichero.write("\n")
+
+        if options["comparar"]:
+            with open(options["comparar"], encoding="utf-8") as fichero:
+                referencia = json.load(fichero)
+            regresiones = comparar(resultados, referencia, options["tolerancia"])
+            if regresiones:
+                raise CommandError("Regresiones frente a la referencia:\n  " + "\n  ".join(regresiones))
+            self.stdout.write(self.style.SUCCESS("Sin regresiones frente a la referencia."))
+
+    def _reproducir(self, mezcla, crear_cliente, options):
+        return reproducir(
+            mezcla, options["peticiones"], options["semilla"], crear_cliente, options["calentamiento"]
+        )
+
+    def _tabla(self, resultados):
+        self.stdout.write(
+            f"{resultados['peticiones']} peticiones en {resultados['duracion_s']} s "
+            f"({resultados['rps']} pet/s)"
+        )
+        self.stdout.write(
+            f"{'petición':<22} {'n':>5} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'consultas':>10}"
+        )
+        for nombre, datos in resultados["endpoints"].items():
+            consultas = "-" if datos["consultas_max"] is None else f"{datos['consultas_media']:.1f}/{datos['consultas_max']}"
+            self.stdout.write(
+                f"{nombre:<22} {datos['n']:>5} {datos['errores']:>4} {datos['p50_ms']:>8.1f} "
+                f"{datos['p95_ms']:>8.1f} {datos['p99_ms']:>8.1f} {consultas:>10}"
+            )
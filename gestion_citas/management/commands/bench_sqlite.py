@@ -0,0 +1,115 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+from pathlib import Path
+from time import perf_counter, sleep
+
+from django.core.management.base import BaseCommand
+
+from barber_project.basedatos import pragmas
+
+
+# Lo que hace Django con SQLite sin configurar: journal DELETE, synchronous FULL, 5 s de espera
+CONFIGURACIONES = {
+    "por defecto": {"pragmas": ["PRAGMA journal_mode=DELETE", "PRAGMA synchronous=FULL"], "timeout": 5.0},
+    "producción": {"pragmas": None, "timeout": 20.0},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide lecturas por segundo con escrituras concurrentes, con la configuración SQLite "
+        "por defecto y con la de producción (WAL, synchronous=NORMAL, caché, mmap). "
+        "Trabaja sobre un fichero temporal, no toca db.sqlite3."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lectores", type=int, default=4, help="Hilos que solo leen")
+        parser.add_argument("--segundos", type=float, default=5.0, help="Duración de cada prueba")
+        parser.add_argument("--filas", type=int, default=20000, help="Citas iniciales")
+        parser.add_argument("--escritura-ms", type=float, default=5.0,
+                            help="Tiempo que cada transacción de escritura mantiene el bloqueo")
+
+    def handle(self, *args, **options):
+        for nombre, configuracion in CONFIGURACIONES.items():
+            with tempfile.TemporaryDirectory() as carpeta:
+                resultado = self._medir(Path(carpeta) / "bench.sqlite3", configuracion, options)
+            self.stdout.write(
+                f"{nombre:<12} {resultado['lecturas_s']:9.0f} lecturas/s  "
+                f"p99 {resultado['p99_ms']:7.2f} ms  "
+                f"{resultado['escrituras']:5d} escrituras  "
+                f"{resultado['errores']:4d} errores de bloqueo"
+            )
+
+    def _conectar(self, ruta, configuracion):
+        conexion = sqlite3.connect(ruta, timeout=configuracion["timeout"], isolation_level=None,
+                                   check_same_thread=False)
+        for pragma in configuracion["pragmas"] or pragmas():
+            conexion.execute(pragma)
+        return conexion
+
+    def _medir(self, ruta, configuracion, options):
+        conexion = self._conectar(ruta, configuracion)
+        conexion.execute("CREATE TABLE cita (id INTEGER PRIMARY KEY, barbero INTEGER, fecha INTEGER, hora INTEGER)")
+        conexion.execute("CREATE INDEX cita_barbero_fecha ON cita (barbero, fecha, hora)")
+        conexion.executemany(
+            "INSERT INTO cita (barbero, fecha, hora) VALUES (?, ?, ?)",
+            ((n % 10, n // 160, n % 16) for n in range(options["filas"])),
+        )
+        conexion.close()
+
+        parar = threading.Event()
+        latencias, errores, escrituras = [], [0], [0]
+        cerrojo = threading.Lock()
+
+        def lector(semilla):
+            aleatorio = random.Random(semilla)
+            conexion = self._conectar(ruta, configuracion)
+            propias, fallos = [], 0
+            while not parar.is_set():
+                inicio = perf_counter()
+                try:
+                    conexion.execute(
+                        "SELECT hora FROM cita WHERE barbero = ? AND fecha = ?",
+                        (aleatorio.randrange(10), aleatorio.randrange(options["filas"] // 160)),
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    fallos += 1
+                    continue
+                propias.append(perf_counter() - inicio)
+            conexion.close()
+            with cerrojo:
+                latencias.extend(propias)
+                errores[0] += fallos
+
+        def escritor():
+            conexion = self._conectar(ruta, configuracion)
+            while not parar.is_set():
+                try:
+                    conexion.execute("BEGIN IMMEDIATE")
+                    conexion.execute("INSERT INTO cita (barbero, fecha, hora) VALUES (1, 0, 0)")
+                    sleep(options["escritura_ms"] / 1000)
+                    conexion.execute("COMMIT")
+                    escrituras[0] += 1
+                except sqlite3.OperationalError:
+                    with cerrojo:
+                        errores[0] += 1
+            conexion.close()
+
+        hilos = [threading.Thread(target=lector, args=(n,)) for n in range(options["lectores"])]
+        hilos.append(threading.Thread(target=escritor))
+        for hilo in hilos:
+            hilo.start()
+        sleep(options["segundos"])
+        parar.set()
+        for hilo in hilos:
+            hilo.join()
+
+        return {
+            "lecturas_s": len(latencias) / options["segundos"],
+            "p99_ms": statistics.quantiles(latencias, n=100)[98] * 1000 if len(latencias) > 1 else 0.0,
+            "escrituras": escrituras[0],
+            "errores": errores[0],
+        }
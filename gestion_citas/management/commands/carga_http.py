@@ -0,0 +1,123 @@
+import http.client
+import statistics
+import threading
+from collections import defaultdict
+from datetime import date
+from time import perf_counter, sleep
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+
+from gestion_citas.models import Barbero, Usuario
+
+
+class Command(BaseCommand):
+    help = (
+        "Prueba de carga de las vistas de lectura contra servidores ya arrancados sobre la misma BD, "
+        "p. ej. `gunicorn barber_project.wsgi -w 4 -b :8000` y "
+        "`uvicorn barber_project.asgi:application --workers 4 --port 8001`. "
+        "Muestra peticiones por segundo y latencias p50/p99 de cada despliegue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--wsgi", help="URL base del despliegue WSGI (http://127.0.0.1:8000)")
+        parser.add_argument("--asgi", help="URL base del despliegue ASGI (http://127.0.0.1:8001)")
+        parser.add_argument("--usuario", help="Email con el que iniciar sesión (si es staff, incluye la agenda)")
+        parser.add_argument("--concurrencia", type=int, default=16, help="Clientes simultáneos")
+        parser.add_argument("--segundos", type=float, default=10.0, help="Duración de cada prueba")
+
+    def handle(self, *args, **options):
+        despliegues = [(nombre, options[nombre]) for nombre in ("wsgi", "asgi") if options[nombre]]
+        if not despliegues:
+            raise CommandError("Indica al menos --wsgi o --asgi")
+
+        rutas, cookie = self._rutas(options["usuario"])
+        for nombre, url in despliegues:
+            resultado = self._medir(url, rutas, cookie, options)
+            self.stdout.write(
+                f"{nombre.upper():<5} {resultado['rps']:8.1f} pet/s  p50 {resultado['p50']:7.1f} ms  "
+                f"p99 {resultado['p99']:7.1f} ms  {resultado['errores']} errores"
+            )
+            for ruta, latencias in sorted(resultado["por_ruta"].items()):
+                self.stdout.write(f"      {ruta:<45} p99 {_percentil(latencias, 99):7.1f} ms")
+
+    def _rutas(self, email):
+        rutas = [reverse("home")]
+        if not email:
+            return rutas, ""
+        try:
+            usuario = Usuario.objects.get(email=email)
+        except Usuario.DoesNotExist:
+            raise CommandError(f"No existe el usuario {email}")
+
+        # Misma sesión para todos los clientes; se guarda en la BD que comparten los servidores
+        cliente = Client()
+        cliente.force_login(usuario)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}"
+
+        rutas.append(reverse("mis_citas"))
+        barbero = Barbero.objects.order_by("id").first()
+        if barbero:
+            rutas.append(reverse("disponibilidad_barbero", args=[barbero.id]) + f"?mes={date.today():%Y-%m}")
+        if usuario.is_staff:
+            rutas.append(reverse("agenda_profesional"))
+        return rutas, cookie
+
+    def _medir(self, url, rutas, cookie, options):
+        destino = urlsplit(url)
+        cabeceras = {"Cookie": cookie} if cookie else {}
+        parar = threading.Event()
+        por_ruta = defaultdict(list)
+        errores = [0]
+        cerrojo = threading.Lock()
+
+        def cliente(desplazamiento):
+            conexion = http.client.HTTPConnection(destino.hostname, destino.port or 80, timeout=30)
+            propias, fallos, n = defaultdict(list), 0, desplazamiento
+            while not parar.is_set():
+                ruta = rutas[n % len(rutas)]
+                n += 1
+                inicio = perf_counter()
+                try:
+                    conexion.request("GET", ruta, headers=cabeceras)
+                    respuesta = conexion.getresponse()
+                    respuesta.read()
+                except (OSError, http.client.HTTPException):
+                    fallos += 1
+                    conexion.close()
+                    continue
+                if respuesta.status != 200:
+                    fallos += 1
+                    continue
+                propias[ruta].append((perf_counter() - inicio) * 1000)
+            conexion.close()
+            with cerrojo:
+                for ruta, latencias in propias.items():
+                    por_ruta[ruta].extend(latencias)
+                errores[0] += fallos
+
+        hilos = [threading.Thread(target=cliente, args=(n,)) for n in range(options["concurrencia"])]
+        for hilo in hilos:
+            hilo.start()
+        sleep(options["segundos"])
+        parar.set()
+        for hilo in hilos:
+            hilo.join()
+
+        todas = [latencia for latencias in por_ruta.values() for latencia in latencias]
+        return {
+            "rps": len(todas) / options["segundos"],
+            "p50": _percentil(todas, 50),
+            "p99": _percentil(todas, 99),
+            "errores": errores[0],
+            "por_ruta": por_ruta,
+        }
+
+
+def _percentil(valores, percentil):
+    if len(valores) < 2:
+        return valores[0] if valores else 0.0
+    return statistics.quantiles(valores, n=100)[percentil - 1]
@@ -0,0 +1,40 @@
+import smtplib
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gestion_citas.notificaciones import enviar_pendientes
+
+
+class Command(BaseCommand):
+    help = (
+        "Envía los correos pendientes (confirmaciones, cambios, cancelaciones y recordatorios) "
+        "por una sola conexión SMTP. Una vez, o en bucle con --bucle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="Correos por pasada (por defecto 100)")
+        parser.add_argument("--bucle", action="store_true", help="Seguir ejecutándose indefinidamente")
+        parser.add_argument("--intervalo", type=float, default=30, help="Segundos entre pasadas con --bucle")
+
+    def handle(self, *args, **options):
+        if not options["bucle"]:
+            self._pasada(options["lote"])
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                try:
+                    self._pasada(options["lote"])
+                except (smtplib.SMTPException, OSError) as error:
+                    # Servidor de correo caído: los mensajes siguen pendientes para la próxima pasada
+                    self.stderr.write(f"No se ha podido conectar al servidor de correo: {error}")
+                time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
+
+    def _pasada(self, lote):
+        enviados, fallidos, descartados = enviar_pendientes(lote=lote)
+        self.stdout.write(f"{enviados} correos enviados, {fallidos} fallidos, {descartados} descartados.")
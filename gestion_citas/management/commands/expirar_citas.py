@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gestion_citas.expiracion import expirar_citas_vencidas
+
+
+class Command(BaseCommand):
+    help = "Cancela las citas pendientes cuya hora ya ha pasado. Una vez, o en bucle con --bucle."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=500, help="Filas por transacción (por defecto 500)")
+        parser.add_argument("--bucle", action="store_true", help="Seguir ejecutándose indefinidamente")
+        parser.add_argument("--intervalo", type=float, default=60, help="Segundos entre pasadas con --bucle")
+
+    def handle(self, *args, **options):
+        if not options["bucle"]:
+            self._pasada(options["lote"])
+            return
+
+        try:
+            while True:
+                # Igual que en una petición: no reutilizar conexiones rotas o caducadas
+                close_old_connections()
+                self._pasada(options["lote"])
+                time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
+
+    def _pasada(self, lote):
+        caducadas = expirar_citas_vencidas(lote=lote)
+        self.stdout.write(f"{caducadas} citas caducadas.")
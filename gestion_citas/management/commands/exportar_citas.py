@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from gestion_citas import intercambio
+from gestion_citas.models import Cita
+
+
+class Command(BaseCommand):
+    help = "Exporta citas a CSV o JSON en streaming (memoria constante, sirve para años de histórico)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--formato", choices=sorted(intercambio.EXPORTADORES), default="csv")
+        parser.add_argument("--desde", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--hasta", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--barbero", type=int)
+        parser.add_argument("--salida", help="Fichero de destino (por defecto, la salida estándar)")
+        parser.add_argument("--bloque", type=int, default=intercambio.TAMANO_BLOQUE,
+                            help="Filas que se leen de la BD de cada vez")
+
+    def handle(self, *args, **options):
+        citas = Cita.objects.all()
+        if options["desde"]:
+            citas = citas.filter(fecha__gte=options["desde"])
+        if options["hasta"]:
+            citas = citas.filter(fecha__lte=options["hasta"])
+        if options["barbero"]:
+            citas = citas.filter(barbero_id=options["barbero"])
+
+        exportador, _ = intercambio.EXPORTADORES[options["formato"]]
+        trozos = exportador(citas, options["bloque"])
+        if not options["salida"]:
+            for trozo in trozos:
+                self.stdout.write(trozo, ending="")
+            return
+        with open(options["salida"], "w", encoding="utf-8", newline="") as destino:
+            destino.writelines(trozos)
+        self.stderr.write(f"Citas exportadas a {options['salida']}")
@@ -0,0 +1,51 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from gestion_citas.cache_portada import invalidar_portada
+from gestion_citas.catalogo import invalidar_catalogo
+from gestion_citas.imagenes import generar_derivados
+from gestion_citas.models import Barbero
+
+
+class Command(BaseCommand):
+    help = "Genera (o regenera) las variantes redimensionadas de las fotos de los barberos en paralelo."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Procesos en paralelo")
+        parser.add_argument("--todas", action="store_true", help="Incluir fotos que ya tienen derivados al día")
+
+    def handle(self, *args, **options):
+        pendientes = {}
+        for barbero_id, foto, miniaturas in Barbero.objects.exclude(foto="").exclude(foto=None).values_list(
+            "id", "foto", "miniaturas"
+        ):
+            if options["todas"] or (miniaturas or {}).get("origen") != foto:
+                pendientes[barbero_id] = foto
+
+        if not pendientes:
+            self.stdout.write("No hay fotos pendientes.")
+            return
+
+        # Los procesos hijos solo tocan ficheros; la BD se actualiza desde aquí
+        connections.close_all()
+        generadas = errores = 0
+        with ProcessPoolExecutor(max_workers=options["procesos"]) as pool:
+            tareas = {pool.submit(generar_derivados, foto): barbero_id for barbero_id, foto in pendientes.items()}
+            for tarea in as_completed(tareas):
+                barbero_id = tareas[tarea]
+                try:
+                    derivados = tarea.result()
+                except OSError as error:
+                    errores += 1
+                    self.stderr.write(f"Barbero {barbero_id}: {error}")
+                    continue
+                Barbero.objects.filter(id=barbero_id).update(miniaturas=derivados)
+                generadas += 1
+
+        # update() no dispara señales: la portada y el catálogo cacheados tienen que enterarse
+        invalidar_portada()
+        invalidar_catalogo()
+        self.stdout.write(self.style.SUCCESS(f"Miniaturas generadas para {generadas} barberos ({errores} errores)."))
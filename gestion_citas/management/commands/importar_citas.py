@@ -0,0 +1,44 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_citas import intercambio
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa citas desde CSV o JSON (lista o JSON Lines) validando solapes por lotes. "
+        "Las filas con errores se saltan y se listan al final (o en --informe)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("fichero")
+        parser.add_argument("--formato", choices=["csv", "json"], help="Por defecto, según la extensión")
+        parser.add_argument("--lote", type=int, default=intercambio.TAMANO_LOTE,
+                            help="Filas por transacción")
+        parser.add_argument("--simular", action="store_true", help="Solo validar, sin guardar nada")
+        parser.add_argument("--informe", help="Guarda los errores en este CSV (fila, error)")
+
+    def handle(self, *args, **options):
+        formato = options["formato"] or ("json" if options["fichero"].lower().endswith((".json", ".jsonl")) else "csv")
+        try:
+            with open(options["fichero"], encoding="utf-8-sig", newline="") as fichero:
+                informe = intercambio.importar(
+                    intercambio.leer(fichero, formato), lote=options["lote"], simular=options["simular"]
+                )
+        except (OSError, ValueError, csv.Error) as error:
+            raise CommandError(f"No se puede leer {options['fichero']}: {error}")
+
+        if options["informe"]:
+            with open(options["informe"], "w", encoding="utf-8", newline="") as destino:
+                escritor = csv.writer(destino)
+                escritor.writerow(["fila", "error"])
+                escritor.writerows(informe.errores)
+        else:
+            for fila, mensaje in informe.errores:
+                self.stderr.write(f"fila {fila}: {mensaje}")
+
+        resumen = informe.como_dict(limite=0)
+        del resumen["errores"]
+        self.stdout.write(json.dumps(resumen, ensure_ascii=False))
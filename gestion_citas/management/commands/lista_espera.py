@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gestion_citas.lista_espera import procesar
+
+
+class Command(BaseCommand):
+    help = (
+        "Ofrece los huecos liberados a la lista de espera y caduca las ofertas sin confirmar. "
+        "Una vez, o en bucle con --bucle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=100, help="Huecos por pasada (por defecto 100)")
+        parser.add_argument("--bucle", action="store_true", help="Seguir ejecutándose indefinidamente")
+        parser.add_argument("--intervalo", type=float, default=15, help="Segundos entre pasadas con --bucle")
+
+    def handle(self, *args, **options):
+        if not options["bucle"]:
+            self._pasada(options["lote"])
+            return
+
+        try:
+            while True:
+                close_old_connections()
+                self._pasada(options["lote"])
+                time.sleep(options["intervalo"])
+        except KeyboardInterrupt:
+            self.stdout.write("Detenido.")
+
+    def _pasada(self, lote):
+        caducadas, procesados, asignados = procesar(lote=lote)
+        self.stdout.write(f"{procesados} huecos procesados, {asignados} asignados, {caducadas} ofertas caducadas.")
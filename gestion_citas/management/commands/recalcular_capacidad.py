@@ -0,0 +1,21 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+
+from gestion_citas import horarios
+
+
+class Command(BaseCommand):
+    help = (
+        "Recalcula CapacidadDiaria (turnos y huecos ocupados) de hoy en adelante. "
+        "Pensado para lanzarse cada noche y tener ya calculados los próximos días."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dias", type=int, default=62, help="Días a partir de hoy (por defecto 62)")
+        parser.add_argument("--barbero", type=int)
+
+    def handle(self, *args, **options):
+        hoy = date.today()
+        filas = horarios.recalcular(hoy, hoy + timedelta(days=options["dias"] - 1), options["barbero"])
+        self.stdout.write(self.style.SUCCESS(f"{filas} días de capacidad recalculados."))
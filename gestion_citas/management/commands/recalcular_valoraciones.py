@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from gestion_citas.models import Barbero
+
+
+class Command(BaseCommand):
+    help = "Reconstruye num_resenas y suma_puntuaciones de cada barbero a partir de sus reseñas."
+
+    def add_arguments(self, parser):
+        parser.add_argument("barberos", nargs="*", type=int, help="IDs de barbero (por defecto, todos)")
+
+    def handle(self, *args, **options):
+        barberos = Barbero.objects.all()
+        if options["barberos"]:
+            barberos = barberos.filter(id__in=options["barberos"])
+        actualizados = Barbero.recalcular_valoraciones(barberos)
+        self.stdout.write(self.style.SUCCESS(f"Valoraciones recalculadas para {actualizados} barberos."))
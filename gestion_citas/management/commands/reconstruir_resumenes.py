@@ -0,0 +1,18 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from gestion_citas import resumenes
+
+
+class Command(BaseCommand):
+    help = "Recalcula la tabla ResumenDiario a partir de las citas (todo el histórico o un rango)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--desde", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--hasta", type=date.fromisoformat, help="AAAA-MM-DD")
+        parser.add_argument("--barbero", type=int)
+
+    def handle(self, *args, **options):
+        filas = resumenes.reconstruir(options["desde"], options["hasta"], options["barbero"])
+        self.stdout.write(self.style.SUCCESS(f"{filas} resúmenes diarios reconstruidos."))
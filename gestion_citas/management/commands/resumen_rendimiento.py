@@ -0,0 +1,53 @@
+import json
+import statistics
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = (
+        "Resume los logs JSON de RendimientoMiddleware (BARBERIA_LOG_RENDIMIENTO) en una tabla "
+        "por vista con p50/p95/p99 de tiempo y las consultas por petición."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("ficheros", nargs="+", help="Ficheros de log, una línea JSON por petición")
+        parser.add_argument("--por", choices=["vista", "ruta"], default="vista",
+                            help="Agrupar por nombre de URL (por defecto) o por ruta exacta")
+
+    def handle(self, *args, **options):
+        grupos = defaultdict(list)
+        for nombre in options["ficheros"]:
+            with open(nombre, encoding="utf-8") as fichero:
+                for linea in fichero:
+                    try:
+                        registro = json.loads(linea)
+                    except ValueError:
+                        continue
+                    # Los avisos de presupuesto repiten una petición ya registrada
+                    if not isinstance(registro, dict) or "presupuesto" in registro:
+                        continue
+                    clave = registro.get(options["por"]) or registro.get("ruta") or "?"
+                    grupos[clave].append(registro)
+
+        self.stdout.write(
+            f"{options['por']:<28} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+            f"{'consultas':>10} {'máx':>5} {'bd p95':>8}"
+        )
+        filas = sorted(grupos.items(), key=lambda grupo: -_percentiles([r["ms"] for r in grupo[1]])[2])
+        for clave, registros in filas:
+            p50, p95, p99 = _percentiles([r["ms"] for r in registros])
+            consultas = [r.get("consultas", 0) for r in registros]
+            bd_p95 = _percentiles([r.get("bd_ms", 0) for r in registros])[1]
+            self.stdout.write(
+                f"{clave:<28} {len(registros):>7} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} "
+                f"{statistics.fmean(consultas):>10.1f} {max(consultas):>5} {bd_p95:>8.1f}"
+            )
+
+
+def _percentiles(valores):
+    if len(valores) < 2:
+        return (valores[0],) * 3 if valores else (0.0,) * 3
+    cortes = statistics.quantiles(valores, n=100)
+    return cortes[49], cortes[94], cortes[98]
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from gestion_citas.models import Cita
+from gestion_citas.sembrado import CONTRASENA, EMAIL_STAFF, ESCALAS, sembrar
+
+
+class Command(BaseCommand):
+    help = (
+        "Llena la base de datos con barberos, servicios, usuarios, citas y reseñas de prueba. "
+        f"Todos los usuarios tienen la contraseña '{CONTRASENA}'; el staff es {EMAIL_STAFF}."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--escala", choices=sorted(ESCALAS), default="media")
+        for campo, tipo in [("barberos", int), ("servicios", int), ("usuarios", int),
+                            ("meses", int), ("ocupacion", float), ("resenas", int)]:
+            parser.add_argument(f"--{campo}", type=tipo, help="Sustituye el valor de la escala")
+        parser.add_argument("--semilla", type=int, default=42)
+        parser.add_argument("--forzar", action="store_true", help="Sembrar aunque ya haya citas")
+
+    def handle(self, *args, **options):
+        if Cita.objects.exists() and not options["forzar"]:
+            raise CommandError("La base de datos ya tiene citas; usa --forzar para añadir más.")
+
+        parametros = dict(ESCALAS[options["escala"]])
+        for campo in parametros:
+            if options[campo] is not None:
+                parametros[campo] = options[campo]
+        creados = sembrar(semilla=options["semilla"], **parametros)
+        self.stdout.write(self.style.SUCCESS(
+            ", ".join(f"{cantidad} {tipo}" for tipo, cantidad in creados.items()) + " creados."
+        ))
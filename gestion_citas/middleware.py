@@ -0,0 +1,84 @@
+import json
+import logging
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+from . import rendimiento
+
+
+logger = logging.getLogger("gestion_citas.rendimiento")
+
+
+class RendimientoMiddleware:
+    """Mide cada petición y lo publica en la cabecera Server-Timing y en una línea JSON de log.
+
+    Va el primero de MIDDLEWARE para contar también las consultas de sesión y
+    usuario. RENDIMIENTO_PRESUPUESTO_CONSULTAS ({url_name: máximo}) avisa con
+    un WARNING cuando una vista se pasa; resumen_rendimiento agrega los logs.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion, marca = rendimiento.empezar()
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            rendimiento.terminar(marca)
+        return self._publicar(request, respuesta, medicion)
+
+    async def __acall__(self, request):
+        medicion, marca = rendimiento.empezar()
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            rendimiento.terminar(marca)
+        return self._publicar(request, respuesta, medicion)
+
+    def _publicar(self, request, respuesta, medicion):
+        total = (perf_counter() - medicion.inicio) * 1000
+        bd = medicion.tiempo_bd * 1000
+        plantillas = medicion.tiempo_plantillas * 1000
+        vista = request.resolver_match.url_name if request.resolver_match else None
+        tamano = None if respuesta.streaming else len(respuesta.content)
+
+        if getattr(settings, "RENDIMIENTO_SERVER_TIMING", True):
+            respuesta["Server-Timing"] = ", ".join([
+                f"total;dur={total:.1f}",
+                f'bd;dur={bd:.1f};desc="{medicion.consultas} consultas"',
+                f"plantilla;dur={plantillas:.1f}",
+            ])
+
+        registro = {
+            "fecha": timezone.now().isoformat(timespec="seconds"),
+            "metodo": request.method,
+            "ruta": request.path,
+            "vista": vista,
+            "estado": respuesta.status_code,
+            "ms": round(total, 2),
+            "consultas": medicion.consultas,
+            "bd_ms": round(bd, 2),
+            "plantilla_ms": round(plantillas, 2),
+            "bytes": tamano,
+        }
+        logger.info(json.dumps(registro, ensure_ascii=False))
+
+        presupuesto = getattr(settings, "RENDIMIENTO_PRESUPUESTO_CONSULTAS", {}).get(vista)
+        if presupuesto is not None and medicion.consultas > presupuesto:
+            logger.warning(json.dumps({
+                **registro,
+                "presupuesto": presupuesto,
+                "repetidas": [{"sql": sql, "veces": veces} for sql, veces in medicion.repetidas()],
+            }, ensure_ascii=False))
+        return respuesta
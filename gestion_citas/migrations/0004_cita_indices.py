@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:02
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def cancelar_duplicadas(apps, schema_editor):
+    # La restricción no se puede crear si ya hay dos citas activas en el mismo hueco:
+    # se queda la más antigua y las demás pasan a canceladas, con una nota para el staff
+    Cita = apps.get_model('gestion_citas', 'Cita')
+    activas = Cita.objects.exclude(estado='CANCELADA')
+    repetidas = (
+        activas.values('barbero_id', 'fecha', 'hora')
+        .annotate(total=Count('id'), primera=Min('id'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for hueco in repetidas:
+        sobran = activas.filter(
+            barbero_id=hueco['barbero_id'], fecha=hueco['fecha'], hora=hueco['hora']
+        ).exclude(id=hueco['primera'])
+        for cita in sobran:
+            nota = f"Cancelada al migrar: duplicaba la cita {hueco['primera']}."
+            cita.notas = f"{cita.notas}\n{nota}" if cita.notas else nota
+            cita.estado = 'CANCELADA'
+            cita.save(update_fields=['estado', 'notas'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0003_alter_barbero_id_alter_cita_id_alter_servicio_id_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['barbero', 'fecha', 'hora'], name='cita_barbero_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['fecha', 'estado'], name='cita_fecha_estado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['usuario', 'fecha', 'hora'], name='cita_usuario_fecha_hora_idx'),
+        ),
+        migrations.RunPython(cancelar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cita',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'CANCELADA'), _negated=True), fields=('barbero', 'fecha', 'hora'), name='cita_unica_barbero_fecha_hora'),
+        ),
+    ]
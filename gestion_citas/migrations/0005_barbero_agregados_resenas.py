@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:03
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_agregados(apps, schema_editor):
+    Barbero = apps.get_model('gestion_citas', 'Barbero')
+    totales = Barbero.objects.annotate(
+        total=Count('resenas'), suma=Coalesce(Sum('resenas__puntuacion'), 0)
+    ).values_list('id', 'total', 'suma')
+    for barbero_id, total, suma in totales:
+        Barbero.objects.filter(id=barbero_id).update(num_resenas=total, suma_puntuaciones=suma)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0004_cita_indices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='barbero',
+            name='num_resenas',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='barbero',
+            name='suma_puntuaciones',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(calcular_agregados, migrations.RunPython.noop),
+    ]
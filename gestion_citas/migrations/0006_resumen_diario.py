@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def rellenar_resumenes(apps, schema_editor):
+    Cita = apps.get_model('gestion_citas', 'Cita')
+    ResumenDiario = apps.get_model('gestion_citas', 'ResumenDiario')
+    totales = Cita.objects.order_by().values('barbero_id', 'fecha').annotate(
+        total=Count('id'),
+        canceladas=Count('id', filter=Q(estado='CANCELADA')),
+        suma=Sum('servicio__precio', filter=~Q(estado='CANCELADA')),
+    )
+    ResumenDiario.objects.bulk_create(
+        [
+            ResumenDiario(
+                barbero_id=fila['barbero_id'], fecha=fila['fecha'], citas=fila['total'],
+                cancelaciones=fila['canceladas'], ingresos=fila['suma'] or 0,
+            )
+            for fila in totales
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0005_barbero_agregados_resenas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenDiario',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('citas', models.IntegerField(default=0)),
+                ('cancelaciones', models.IntegerField(default=0)),
+                ('ingresos', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumenes', to='gestion_citas.barbero')),
+            ],
+            options={
+                'ordering': ['fecha', 'barbero'],
+                'indexes': [models.Index(fields=['fecha', 'barbero'], name='resumen_fecha_barbero_idx')],
+                'constraints': [models.UniqueConstraint(fields=('barbero', 'fecha'), name='resumen_unico_barbero_fecha')],
+            },
+        ),
+        migrations.RunPython(rellenar_resumenes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:29
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0007_barbero_miniaturas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SerieCita',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.TimeField()),
+                ('fecha_inicio', models.DateField()),
+                ('fecha_fin', models.DateField()),
+                ('cada_semanas', models.PositiveSmallIntegerField(default=2, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(8)])),
+                ('notas', models.TextField(blank=True, null=True)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gestion_citas.barbero')),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gestion_citas.servicio')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='series', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='serie',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='citas', to='gestion_citas.seriecita'),
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def horario_de_siempre(apps, schema_editor):
+    # Los barberos que ya existen mantienen lo que enseñaba el calendario:
+    # de lunes a sábado, 10:00-14:00 y 16:00-20:00; los domingos cerrado
+    Barbero = apps.get_model('gestion_citas', 'Barbero')
+    HorarioSemanal = apps.get_model('gestion_citas', 'HorarioSemanal')
+    HorarioSemanal.objects.bulk_create([
+        HorarioSemanal(barbero_id=barbero_id, dia_semana=dia, inicio=inicio, fin=fin)
+        for barbero_id in Barbero.objects.values_list('id', flat=True)
+        for dia in range(6)
+        for inicio, fin in (('10:00', '14:00'), ('16:00', '20:00'))
+    ])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0008_serie_cita'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CierreTienda',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(unique=True)),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'cierre de la barbería',
+                'verbose_name_plural': 'cierres de la barbería',
+                'ordering': ['fecha'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CapacidadDiaria',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('turnos', models.CharField(blank=True, max_length=100)),
+                ('huecos', models.PositiveSmallIntegerField(default=0)),
+                ('ocupados', models.PositiveSmallIntegerField(default=0)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='capacidades', to='gestion_citas.barbero')),
+            ],
+            options={
+                'verbose_name_plural': 'capacidades diarias',
+                'ordering': ['fecha', 'barbero'],
+                'constraints': [models.UniqueConstraint(fields=('barbero', 'fecha'), name='capacidad_unica_barbero_fecha')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ExcepcionHorario',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('inicio', models.TimeField(blank=True, null=True)),
+                ('fin', models.TimeField(blank=True, null=True)),
+                ('motivo', models.CharField(blank=True, max_length=100)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='excepciones', to='gestion_citas.barbero')),
+            ],
+            options={
+                'verbose_name': 'excepción de horario',
+                'verbose_name_plural': 'excepciones de horario',
+                'ordering': ['fecha', 'inicio'],
+                'indexes': [models.Index(fields=['barbero', 'fecha'], name='excepcion_barbero_fecha_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HorarioSemanal',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia_semana', models.PositiveSmallIntegerField(choices=[(0, 'Lunes'), (1, 'Martes'), (2, 'Miércoles'), (3, 'Jueves'), (4, 'Viernes'), (5, 'Sábado'), (6, 'Domingo')])),
+                ('inicio', models.TimeField()),
+                ('fin', models.TimeField()),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='horarios', to='gestion_citas.barbero')),
+            ],
+            options={
+                'verbose_name_plural': 'horarios semanales',
+                'ordering': ['barbero', 'dia_semana', 'inicio'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('fin__gt', models.F('inicio'))), name='horario_fin_posterior')],
+            },
+        ),
+        migrations.RunPython(horario_de_siempre, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0009_horarios_capacidad'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HuecoLiberado',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('hora', models.TimeField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_citas.barbero')),
+            ],
+            options={
+                'verbose_name_plural': 'huecos liberados',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='EntradaEspera',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('desde', models.TimeField(help_text='Primera hora de inicio que le vale')),
+                ('hasta', models.TimeField(help_text='Última hora de inicio que le vale')),
+                ('estado', models.CharField(choices=[('ESPERANDO', 'Esperando'), ('OFRECIDA', 'Hueco ofrecido'), ('ATENDIDA', 'Con cita'), ('CADUCADA', 'Caducada'), ('RETIRADA', 'Retirada')], default='ESPERANDO', max_length=10)),
+                ('creada', models.DateTimeField(auto_now_add=True)),
+                ('oferta_expira', models.DateTimeField(blank=True, null=True)),
+                ('barbero', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to='gestion_citas.barbero')),
+                ('cita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='gestion_citas.cita')),
+                ('servicio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='gestion_citas.servicio')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='esperas', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'entradas de la lista de espera',
+                'ordering': ['fecha', 'desde', 'creada'],
+                'indexes': [models.Index(fields=['barbero', 'fecha', 'estado', 'desde', 'creada'], name='espera_candidatas_idx'), models.Index(fields=['estado', 'oferta_expira'], name='espera_estado_expira_idx'), models.Index(fields=['usuario', 'fecha'], name='espera_usuario_fecha_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('hasta__gte', models.F('desde'))), name='espera_franja_valida')],
+            },
+        ),
+    ]
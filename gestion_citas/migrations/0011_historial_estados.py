@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:48
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def historial_inicial(apps, schema_editor):
+    # Las citas que ya existen entran en el historial con su estado actual;
+    # de cuándo cambiaron no sabemos nada
+    Cita = apps.get_model('gestion_citas', 'Cita')
+    HistorialEstadoCita = apps.get_model('gestion_citas', 'HistorialEstadoCita')
+    HistorialEstadoCita.objects.bulk_create(
+        (
+            HistorialEstadoCita(cita_id=cita_id, barbero_id=barbero_id, fecha=fecha, estado=estado)
+            for cita_id, barbero_id, fecha, estado in
+            Cita.objects.order_by('id').values_list('id', 'barbero_id', 'fecha', 'estado').iterator()
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0010_lista_espera'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistorialEstadoCita',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('estado_anterior', models.CharField(blank=True, choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No se presentó')], max_length=20, null=True)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No se presentó')], max_length=20)),
+                ('momento', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'cambio de estado de cita',
+                'verbose_name_plural': 'historial de estados de citas',
+                'ordering': ['momento', 'id'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='cita',
+            name='estado',
+            field=models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('CONFIRMADA', 'Confirmada'), ('CANCELADA', 'Cancelada'), ('NO_PRESENTADO', 'No se presentó')], default='PENDIENTE', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(condition=models.Q(('estado', 'CANCELADA'), _negated=True), fields=['barbero', 'fecha', 'hora', 'servicio', 'estado'], name='cita_activa_barbero_fecha_idx'),
+        ),
+        migrations.AddField(
+            model_name='historialestadocita',
+            name='autor',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='historialestadocita',
+            name='barbero',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='gestion_citas.barbero'),
+        ),
+        migrations.AddField(
+            model_name='historialestadocita',
+            name='cita',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='historial', to='gestion_citas.cita'),
+        ),
+        migrations.AddIndex(
+            model_name='historialestadocita',
+            index=models.Index(fields=['barbero', 'fecha', 'estado', 'cita'], name='historial_analitica_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialestadocita',
+            index=models.Index(fields=['cita', 'momento'], name='historial_cita_momento_idx'),
+        ),
+        migrations.RunPython(historial_inicial, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:57
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0011_historial_estados'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MensajeSalida',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('BIENVENIDA', 'Bienvenida'), ('RESERVA', 'Cita reservada'), ('CAMBIO', 'Cita modificada'), ('CANCELACION', 'Cita cancelada'), ('RECORDATORIO', 'Recordatorio'), ('OFERTA', 'Hueco de la lista de espera')], max_length=15)),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('ENVIADO', 'Enviado'), ('DESCARTADO', 'Descartado'), ('FALLIDO', 'Fallido')], default='PENDIENTE', max_length=10)),
+                ('enviar_desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+                ('enviado', models.DateTimeField(blank=True, null=True)),
+                ('cita', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mensajes', to='gestion_citas.cita')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mensajes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'correo pendiente',
+                'verbose_name_plural': 'correos pendientes',
+                'ordering': ['enviar_desde', 'id'],
+                'indexes': [models.Index(condition=models.Q(('estado', 'PENDIENTE')), fields=['enviar_desde', 'id'], name='mensaje_pendiente_idx')],
+            },
+        ),
+    ]
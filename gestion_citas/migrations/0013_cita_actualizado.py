@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0012_mensajes_salida'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='cita',
+            name='cita_barbero_fecha_hora_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='cita',
+            name='cita_usuario_fecha_hora_idx',
+        ),
+        migrations.AddField(
+            model_name='cita',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['barbero', 'fecha', 'hora', 'actualizado'], name='cita_barbero_fecha_hora_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='cita',
+            index=models.Index(fields=['usuario', 'fecha', 'hora', 'actualizado'], name='cita_usuario_fecha_hora_idx'),
+        ),
+    ]
@@ -0,0 +1,80 @@
+from django.db import migrations
+
+
+# Tablas FTS5 de contenido externo para la búsqueda del staff (ver busqueda.py).
+# Guardan solo el índice; el texto se sigue leyendo de las tablas de Django.
+TOKENIZADOR = "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'"
+
+USUARIOS = [
+    f"""CREATE VIRTUAL TABLE busqueda_usuario USING fts5(
+        email, first_name, last_name,
+        content = 'gestion_citas_usuario', content_rowid = 'id', {TOKENIZADOR}
+    )""",
+    """INSERT INTO busqueda_usuario (rowid, email, first_name, last_name)
+        SELECT id, email, first_name, last_name FROM gestion_citas_usuario""",
+    """CREATE TRIGGER busqueda_usuario_alta AFTER INSERT ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (rowid, email, first_name, last_name)
+        VALUES (new.id, new.email, new.first_name, new.last_name);
+    END""",
+    """CREATE TRIGGER busqueda_usuario_baja AFTER DELETE ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (busqueda_usuario, rowid, email, first_name, last_name)
+        VALUES ('delete', old.id, old.email, old.first_name, old.last_name);
+    END""",
+    # Solo si cambia algo de lo indexado: el last_login de cada inicio de sesión no toca el índice
+    """CREATE TRIGGER busqueda_usuario_cambio AFTER UPDATE OF email, first_name, last_name ON gestion_citas_usuario BEGIN
+        INSERT INTO busqueda_usuario (busqueda_usuario, rowid, email, first_name, last_name)
+        VALUES ('delete', old.id, old.email, old.first_name, old.last_name);
+        INSERT INTO busqueda_usuario (rowid, email, first_name, last_name)
+        VALUES (new.id, new.email, new.first_name, new.last_name);
+    END""",
+]
+
+# Solo las citas con notas: el alta y la baja miran la misma condición para que
+# el índice nunca reciba un 'delete' de algo que no tiene
+CITAS = [
+    f"""CREATE VIRTUAL TABLE busqueda_cita USING fts5(
+        notas, content = 'gestion_citas_cita', content_rowid = 'id', {TOKENIZADOR}
+    )""",
+    """INSERT INTO busqueda_cita (rowid, notas)
+        SELECT id, notas FROM gestion_citas_cita WHERE notas <> ''""",
+    """CREATE TRIGGER busqueda_cita_alta AFTER INSERT ON gestion_citas_cita WHEN new.notas <> '' BEGIN
+        INSERT INTO busqueda_cita (rowid, notas) VALUES (new.id, new.notas);
+    END""",
+    """CREATE TRIGGER busqueda_cita_baja AFTER DELETE ON gestion_citas_cita WHEN old.notas <> '' BEGIN
+        INSERT INTO busqueda_cita (busqueda_cita, rowid, notas) VALUES ('delete', old.id, old.notas);
+    END""",
+    """CREATE TRIGGER busqueda_cita_cambio AFTER UPDATE OF notas ON gestion_citas_cita BEGIN
+        INSERT INTO busqueda_cita (busqueda_cita, rowid, notas)
+        SELECT 'delete', old.id, old.notas WHERE old.notas <> '';
+        INSERT INTO busqueda_cita (rowid, notas)
+        SELECT new.id, new.notas WHERE new.notas <> '';
+    END""",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0013_cita_actualizado'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            USUARIOS,
+            reverse_sql=[
+                "DROP TRIGGER busqueda_usuario_cambio",
+                "DROP TRIGGER busqueda_usuario_baja",
+                "DROP TRIGGER busqueda_usuario_alta",
+                "DROP TABLE busqueda_usuario",
+            ],
+        ),
+        migrations.RunSQL(
+            CITAS,
+            reverse_sql=[
+                "DROP TRIGGER busqueda_cita_cambio",
+                "DROP TRIGGER busqueda_cita_baja",
+                "DROP TRIGGER busqueda_cita_alta",
+                "DROP TABLE busqueda_cita",
+            ],
+        ),
+    ]
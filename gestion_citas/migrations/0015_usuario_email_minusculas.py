@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:29
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('gestion_citas', '0014_busqueda_texto'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usuario',
+            index=models.Index(django.db.models.functions.text.Lower('email'), models.F('email'), name='usuario_email_minusculas_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gestion_citas', '0015_usuario_email_minusculas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='entradaespera',
+            name='espera_candidatas_idx',
+        ),
+        migrations.AddIndex(
+            model_name='entradaespera',
+            index=models.Index(fields=['barbero', 'fecha', 'estado', 'creada'], name='espera_candidatas_idx'),
+        ),
+    ]
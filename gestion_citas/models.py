@@ -1,7 +1,12 @@
 from django.db import models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, Lower
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
 from datetime import datetime
+from .huecos import IndiceHuecos
 
 
 # 1. GESTOR DE USUARIOS PERSONALIZADO (Esto arregla el error de createsuperuser)
@@ -29,6 +34,13 @@ class UsuarioManager(BaseUserManager):
 
 # 2. MODELO DE USUARIO (Login con Email)
 class Usuario(AbstractUser):
+    """Cliente o miembro del staff; entra con el correo.
+
+    Los triggers del índice de texto (busqueda.py) cuelgan de esta tabla. Si una
+    migración la rehace en SQLite (AlterField, RemoveField...), se pierden: esa
+    migración tiene que acabar con RunPython(busqueda.reconstruir).
+    """
+
     username = None
     email = models.EmailField("Correo Electrónico", unique=True)
     first_name = models.CharField("Nombre", max_length=150)
@@ -40,6 +52,14 @@ class Usuario(AbstractUser):
     # Conectamos el gestor nuevo aquí:
     objects = UsuarioManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Buscador de clientes por prefijo del correo sin distinguir mayúsculas
+            # (normalize_email solo pasa a minúsculas el dominio); con el correo detrás,
+            # el orden de la página y el cursor salen del índice
+            models.Index(Lower("email"), F("email"), name="usuario_email_minusculas_idx"),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} ({self.email})"
 
@@ -63,23 +83,79 @@ class Barbero(models.Model):
     experiencia = models.PositiveIntegerField(help_text="Años de experiencia")
     especialidades = models.ManyToManyField(Servicio, related_name="barberos")
 
+    # Agregados de reseñas mantenidos por señales (ver signals.py), para no leer
+    # todas las reseñas cada vez que se pinta la portada
+    num_resenas = models.PositiveIntegerField(default=0, editable=False)
+    suma_puntuaciones = models.PositiveIntegerField(default=0, editable=False)
+
+    # Variantes redimensionadas de la foto (ver imagenes.py y la etiqueta {% foto_barbero %})
+    miniaturas = models.JSONField(default=dict, blank=True, editable=False)
+
     def __str__(self):
         return f"{self.nombre} {self.apellido}"
 
     def promedio_estrellas(self):
-        resenas = self.resenas.all()
-        if resenas:
-            # Suma todas las puntuaciones y divide por la cantidad
-            return round(sum([r.puntuacion for r in resenas]) / len(resenas), 1)
+        if self.num_resenas:
+            return round(self.suma_puntuaciones / self.num_resenas, 1)
         return 0
 
+    @classmethod
+    def recalcular_valoraciones(cls, barberos=None):
+        # Reconstruye los agregados desde cero con una sola consulta por barbero
+        barberos = barberos if barberos is not None else cls.objects.all()
+        totales = barberos.annotate(
+            total=Count("resenas"), suma=Coalesce(Sum("resenas__puntuacion"), 0)
+        ).values_list("id", "total", "suma")
+        actualizados = 0
+        for barbero_id, total, suma in totales:
+            actualizados += cls.objects.filter(id=barbero_id).update(
+                num_resenas=total, suma_puntuaciones=suma
+            )
+        return actualizados
+
+
+# 5. SERIE DE CITAS (clientes que repiten cada N semanas)
+class SerieCita(models.Model):
+    """Patrón de una reserva periódica: mismo barbero, servicio y hora cada N semanas.
+
+    Las citas de la serie son Citas normales con `serie` apuntando aquí; las
+    crea y modifica en bloque series.py.
+    """
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="series")
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE)
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE)
+    hora = models.TimeField()
+    fecha_inicio = models.DateField()
+    fecha_fin = models.DateField()
+    cada_semanas = models.PositiveSmallIntegerField(
+        default=2, validators=[MinValueValidator(1), MaxValueValidator(8)]
+    )
+    notas = models.TextField(blank=True, null=True)
+    creada = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.usuario} con {self.barbero} cada {self.cada_semanas} semanas"
+
+    def clean(self):
+        if self.fecha_inicio and self.fecha_fin and self.fecha_fin < self.fecha_inicio:
+            raise ValidationError("La fecha de fin no puede ser anterior a la de inicio.")
+
 
-# 5. MODELO CITA
+# 6. MODELO CITA
 class Cita(models.Model):
+    """Una reserva de un cliente con un barbero.
+
+    Los triggers del índice de las notas (busqueda.py) cuelgan de esta tabla. Si
+    una migración la rehace en SQLite (AlterField, RemoveField...), se pierden:
+    esa migración tiene que acabar con RunPython(busqueda.reconstruir).
+    """
+
     ESTADOS = [
         ("PENDIENTE", "Pendiente"),
         ("CONFIRMADA", "Confirmada"),
         ("CANCELADA", "Cancelada"),
+        ("NO_PRESENTADO", "No se presentó"),
     ]
 
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="citas")
@@ -90,26 +166,94 @@ class Cita(models.Model):
     hora = models.TimeField()
     estado = models.CharField(max_length=20, choices=ESTADOS, default="PENDIENTE")
     notas = models.TextField(blank=True, null=True)
+    serie = models.ForeignKey(
+        SerieCita, on_delete=models.SET_NULL, null=True, blank=True, related_name="citas"
+    )
+    # Última modificación: versión de los calendarios .ics (ver calendario.py). Los
+    # update() masivos no pasan por auto_now y lo ponen a mano
+    actualizado = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ["fecha", "hora"]
+        indexes = [
+            # Cita.clean, disponibilidad y agenda por barbero; con `actualizado`, la
+            # versión del calendario del barbero sale del índice sin ir a la tabla
+            models.Index(fields=["barbero", "fecha", "hora", "actualizado"], name="cita_barbero_fecha_hora_idx"),
+            # Caducidad de pendientes y listados por fecha
+            models.Index(fields=["fecha", "estado"], name="cita_fecha_estado_idx"),
+            # mis_citas y el calendario del cliente (igual que el del barbero)
+            models.Index(fields=["usuario", "fecha", "hora", "actualizado"], name="cita_usuario_fecha_hora_idx"),
+            # Solapes y disponibilidad: solo las activas, con servicio y estado para no ir
+            # a la tabla (las canceladas se quedan en la tabla, pero no en este índice)
+            models.Index(
+                fields=["barbero", "fecha", "hora", "servicio", "estado"],
+                condition=~models.Q(estado="CANCELADA"),
+                name="cita_activa_barbero_fecha_idx",
+            ),
+        ]
+        constraints = [
+            # Última barrera contra reservas duplicadas: dos peticiones a la vez pueden pasar clean()
+            models.UniqueConstraint(
+                fields=["barbero", "fecha", "hora"],
+                condition=~models.Q(estado="CANCELADA"),
+                name="cita_unica_barbero_fecha_hora",
+            ),
+        ]
 
     def clean(self):
-        cita_existente = Cita.objects.filter(
-            barbero=self.barbero, fecha=self.fecha, hora=self.hora
-        ).exclude(id=self.id)
+        # Si falta algún campo, ya lo señala la validación de campos
+        if not (self.barbero_id and self.servicio_id and self.fecha and self.hora):
+            return
+
+        # Una cita cancelada no ocupa hueco: no hay nada que comprobar
+        if self.estado == "CANCELADA":
+            return
 
-        if cita_existente.exists():
+        # La cita tiene que caber entera en los turnos del barbero ese día
+        from .horarios import dentro_de_turnos, turnos_de
+
+        if not dentro_de_turnos(turnos_de(self.barbero_id, self.fecha), self.hora, self.servicio.duracion):
+            raise ValidationError(
+                f"{self.barbero.nombre} no trabaja ese día a esa hora."
+            )
+
+        # Comprobamos solape real teniendo en cuenta la duración de cada servicio
+        indice = IndiceHuecos.cargar(self.barbero_id, self.fecha, excluir=self.id)
+        if not indice.libre(self.fecha, self.hora, self.servicio.duracion):
             raise ValidationError(
                 f"El barbero {self.barbero.nombre} ya tiene una cita a esa hora."
             )
 
         # Validación: evitar fechas pasadas, etc. se puede añadir aquí
 
+    def _datos_validados(self):
+        # Lo que mira clean(): si algo de esto cambia, la validación anterior ya no vale
+        return (self.id, self.barbero_id, self.servicio_id, self.fecha, self.hora, self.estado)
+
+    def full_clean(self, *args, **kwargs):
+        super().full_clean(*args, **kwargs)
+        # Recién validada (p. ej. por un ModelForm): save() no repite la consulta de solapes
+        # mientras no cambie nada de lo validado
+        self._validada = self._datos_validados()
+
     def save(self, *args, **kwargs):
-        self.full_clean()
+        if getattr(self, "_validada", None) != self._datos_validados():
+            self.full_clean()
+        self._validada = None
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Foto de los campos que cuentan para los resúmenes diarios (ver resumenes.py)
+        # y, al final, la hora, que solo mira el aviso de cambios (ver notificaciones.py)
+        instancia = super().from_db(db, field_names, values)
+        datos = instancia.__dict__
+        instancia._original = (
+            datos.get("barbero_id"), datos.get("fecha"), datos.get("servicio_id"), datos.get("estado"),
+            datos.get("hora"),
+        )
+        return instancia
+
 
 class Resena(models.Model):
     barbero = models.ForeignKey(
@@ -122,3 +266,319 @@ class Resena(models.Model):
 
     def __str__(self):
         return f"{self.puntuacion}★ para {self.barbero.nombre}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Guardamos los valores leídos para que las señales sepan cuánto ha cambiado
+        instancia = super().from_db(db, field_names, values)
+        instancia._original = (instancia.__dict__.get("barbero_id"), instancia.__dict__.get("puntuacion"))
+        return instancia
+
+
+# 7. RESUMEN DIARIO (para el dashboard)
+class ResumenDiario(models.Model):
+    """Citas, cancelaciones e ingresos de un barbero en un día.
+
+    Lo mantiene resumenes.py cada vez que cambia una cita; el dashboard solo lee
+    esta tabla.
+    """
+
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="resumenes")
+    fecha = models.DateField()
+    citas = models.IntegerField(default=0)
+    cancelaciones = models.IntegerField(default=0)
+    ingresos = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ["fecha", "barbero"]
+        constraints = [
+            models.UniqueConstraint(fields=["barbero", "fecha"], name="resumen_unico_barbero_fecha"),
+        ]
+        indexes = [
+            models.Index(fields=["fecha", "barbero"], name="resumen_fecha_barbero_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.barbero} {self.fecha}: {self.citas} citas"
+
+
+# 8. HORARIOS DE TRABAJO (ver horarios.py)
+class HorarioSemanal(models.Model):
+    """Un turno de trabajo de un barbero un día de la semana; puede haber varios el mismo día.
+
+    Un barbero sin ningún turno trabaja en los TURNOS de siempre todos los días.
+    """
+
+    DIAS = [
+        (0, "Lunes"), (1, "Martes"), (2, "Miércoles"), (3, "Jueves"),
+        (4, "Viernes"), (5, "Sábado"), (6, "Domingo"),
+    ]
+
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="horarios")
+    dia_semana = models.PositiveSmallIntegerField(choices=DIAS)
+    inicio = models.TimeField()
+    fin = models.TimeField()
+
+    class Meta:
+        ordering = ["barbero", "dia_semana", "inicio"]
+        verbose_name_plural = "horarios semanales"
+        constraints = [
+            models.CheckConstraint(condition=models.Q(fin__gt=models.F("inicio")), name="horario_fin_posterior"),
+        ]
+
+    def __str__(self):
+        return f"{self.barbero} {self.get_dia_semana_display()} {self.inicio:%H:%M}-{self.fin:%H:%M}"
+
+
+class ExcepcionHorario(models.Model):
+    """Cambia el horario de un barbero en una fecha concreta.
+
+    Sin horas es un día libre (vacaciones, baja...); con horas, ese día trabaja
+    en esos turnos en lugar de los de su horario semanal.
+    """
+
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="excepciones")
+    fecha = models.DateField()
+    inicio = models.TimeField(blank=True, null=True)
+    fin = models.TimeField(blank=True, null=True)
+    motivo = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ["fecha", "inicio"]
+        verbose_name = "excepción de horario"
+        verbose_name_plural = "excepciones de horario"
+        indexes = [
+            models.Index(fields=["barbero", "fecha"], name="excepcion_barbero_fecha_idx"),
+        ]
+
+    def __str__(self):
+        if self.inicio is None:
+            return f"{self.barbero} libre el {self.fecha}"
+        return f"{self.barbero} el {self.fecha} de {self.inicio:%H:%M} a {self.fin:%H:%M}"
+
+    def clean(self):
+        if (self.inicio is None) != (self.fin is None):
+            raise ValidationError("Indica hora de inicio y de fin, o ninguna para un día libre.")
+        if self.inicio is not None and self.fin <= self.inicio:
+            raise ValidationError("La hora de fin tiene que ser posterior a la de inicio.")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Si cambia la fecha hay que recalcular también el día de antes (ver signals.py)
+        instancia = super().from_db(db, field_names, values)
+        instancia._original = (instancia.__dict__.get("barbero_id"), instancia.__dict__.get("fecha"))
+        return instancia
+
+
+class CierreTienda(models.Model):
+    """Día en que la barbería cierra para todos (festivos, obras...)."""
+
+    fecha = models.DateField(unique=True)
+    motivo = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ["fecha"]
+        verbose_name = "cierre de la barbería"
+        verbose_name_plural = "cierres de la barbería"
+
+    def __str__(self):
+        return f"Cerrado el {self.fecha}" + (f" ({self.motivo})" if self.motivo else "")
+
+
+# 9. CAPACIDAD DIARIA (para el calendario de reservas)
+class CapacidadDiaria(models.Model):
+    """Turnos de un barbero en un día, cuántos huecos tiene y cuántos están ocupados.
+
+    La mantiene horarios.py cuando cambia un horario o una cita; el calendario
+    solo lee esta tabla.
+    """
+
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="capacidades")
+    fecha = models.DateField()
+    # "10:00-14:00 16:00-20:00"; vacío si ese día no trabaja
+    turnos = models.CharField(max_length=100, blank=True)
+    huecos = models.PositiveSmallIntegerField(default=0)
+    ocupados = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ["fecha", "barbero"]
+        verbose_name_plural = "capacidades diarias"
+        constraints = [
+            # También es el índice del calendario (barbero, rango de fechas)
+            models.UniqueConstraint(fields=["barbero", "fecha"], name="capacidad_unica_barbero_fecha"),
+        ]
+
+    def __str__(self):
+        return f"{self.barbero} {self.fecha}: {self.ocupados}/{self.huecos}"
+
+    @property
+    def completo(self):
+        # También los días sin turnos: no se puede reservar nada
+        return self.ocupados >= self.huecos
+
+
+# 10. LISTA DE ESPERA (ver lista_espera.py)
+class EntradaEspera(models.Model):
+    """Un cliente que quiere cita con un barbero un día, empezando dentro de una franja.
+
+    Cuando se libera un hueco que encaja, el proceso de la lista de espera le
+    reserva la cita (`cita`) y le da hasta `oferta_expira` para confirmarla.
+    """
+
+    ESPERANDO = "ESPERANDO"
+    OFRECIDA = "OFRECIDA"
+    ATENDIDA = "ATENDIDA"
+    CADUCADA = "CADUCADA"
+    RETIRADA = "RETIRADA"
+    ESTADOS = [
+        (ESPERANDO, "Esperando"),
+        (OFRECIDA, "Hueco ofrecido"),
+        (ATENDIDA, "Con cita"),
+        (CADUCADA, "Caducada"),
+        (RETIRADA, "Retirada"),
+    ]
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="esperas")
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="esperas")
+    servicio = models.ForeignKey(Servicio, on_delete=models.CASCADE)
+    fecha = models.DateField()
+    desde = models.TimeField(help_text="Primera hora de inicio que le vale")
+    hasta = models.TimeField(help_text="Última hora de inicio que le vale")
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=ESPERANDO)
+    creada = models.DateTimeField(auto_now_add=True)
+    cita = models.ForeignKey("Cita", on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    oferta_expira = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["fecha", "desde", "creada"]
+        verbose_name_plural = "entradas de la lista de espera"
+        indexes = [
+            # Candidatas para un hueco: las que esperan ese día, por orden de llegada (la franja se
+            # filtra al recorrerlas; ver lista_espera.candidatas)
+            models.Index(fields=["barbero", "fecha", "estado", "creada"], name="espera_candidatas_idx"),
+            # Ofertas vencidas
+            models.Index(fields=["estado", "oferta_expira"], name="espera_estado_expira_idx"),
+            models.Index(fields=["usuario", "fecha"], name="espera_usuario_fecha_idx"),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(hasta__gte=models.F("desde")), name="espera_franja_valida"),
+        ]
+
+    def __str__(self):
+        return f"{self.usuario} espera a {self.barbero} el {self.fecha} ({self.desde:%H:%M}-{self.hasta:%H:%M})"
+
+
+class HuecoLiberado(models.Model):
+    """Cola de huecos que se han quedado libres y hay que ofrecer a la lista de espera.
+
+    Se escribe al cancelar (una fila, nada más) y la vacía el proceso lista_espera.
+    """
+
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="+")
+    fecha = models.DateField()
+    hora = models.TimeField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name_plural = "huecos liberados"
+
+    def __str__(self):
+        return f"{self.barbero} {self.fecha} {self.hora:%H:%M}"
+
+
+# 11. HISTORIAL DE ESTADOS DE LAS CITAS (ver historial.py)
+class HistorialEstadoCita(models.Model):
+    """Un cambio de estado de una cita. Solo se insertan filas, nunca se cambian.
+
+    Barbero y fecha son los de la cita en ese momento, copiados para que las
+    analíticas agrupen sobre esta tabla sin tocar Cita.
+    """
+
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, related_name="historial")
+    # Sin índice propio: lo cubre historial_analitica_idx
+    barbero = models.ForeignKey(Barbero, on_delete=models.CASCADE, related_name="+", db_index=False)
+    fecha = models.DateField()
+    # Vacío en la fila de la creación
+    estado_anterior = models.CharField(max_length=20, choices=Cita.ESTADOS, null=True, blank=True)
+    estado = models.CharField(max_length=20, choices=Cita.ESTADOS)
+    momento = models.DateTimeField(default=timezone.now)
+    autor = models.ForeignKey(Usuario, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+
+    class Meta:
+        ordering = ["momento", "id"]
+        verbose_name = "cambio de estado de cita"
+        verbose_name_plural = "historial de estados de citas"
+        indexes = [
+            # Analíticas agrupadas por barbero y filtradas por fecha, sin salir del índice
+            models.Index(fields=["barbero", "fecha", "estado", "cita"], name="historial_analitica_idx"),
+            models.Index(fields=["cita", "momento"], name="historial_cita_momento_idx"),
+        ]
+
+    def __str__(self):
+        return f"Cita {self.cita_id}: {self.estado_anterior or '-'} -> {self.estado}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("El historial de estados no se modifica: añade una fila nueva.")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValueError("El historial de estados no se borra.")
+
+
+# 12. CORREOS PENDIENTES DE ENVIAR (ver notificaciones.py)
+class MensajeSalida(models.Model):
+    """Un correo en cola. Se escribe en la misma transacción que la cita y lo envía
+    el comando enviar_correos a partir de `enviar_desde`; el texto se compone al enviarlo.
+    """
+
+    BIENVENIDA = "BIENVENIDA"
+    RESERVA = "RESERVA"
+    CAMBIO = "CAMBIO"
+    CANCELACION = "CANCELACION"
+    RECORDATORIO = "RECORDATORIO"
+    OFERTA = "OFERTA"
+    TIPOS = [
+        (BIENVENIDA, "Bienvenida"),
+        (RESERVA, "Cita reservada"),
+        (CAMBIO, "Cita modificada"),
+        (CANCELACION, "Cita cancelada"),
+        (RECORDATORIO, "Recordatorio"),
+        (OFERTA, "Hueco de la lista de espera"),
+    ]
+
+    PENDIENTE = "PENDIENTE"
+    ENVIADO = "ENVIADO"
+    DESCARTADO = "DESCARTADO"
+    FALLIDO = "FALLIDO"
+    ESTADOS = [
+        (PENDIENTE, "Pendiente"),
+        (ENVIADO, "Enviado"),
+        (DESCARTADO, "Descartado"),
+        (FALLIDO, "Fallido"),
+    ]
+
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="mensajes")
+    cita = models.ForeignKey(Cita, on_delete=models.CASCADE, null=True, blank=True, related_name="mensajes")
+    tipo = models.CharField(max_length=15, choices=TIPOS)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    enviar_desde = models.DateTimeField(default=timezone.now)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    enviado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["enviar_desde", "id"]
+        verbose_name = "correo pendiente"
+        verbose_name_plural = "correos pendientes"
+        indexes = [
+            # Los que ya toca enviar: solo las pendientes, por hora de envío
+            models.Index(
+                fields=["enviar_desde", "id"], condition=models.Q(estado="PENDIENTE"), name="mensaje_pendiente_idx"
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_tipo_display()} para {self.usuario_id} ({self.get_estado_display()})"
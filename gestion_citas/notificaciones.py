@@ -0,0 +1,175 @@
+"""
+Correos a los clientes, fuera del camino de la petición.
+
+Reservar, cambiar o cancelar una cita solo inserta filas en MensajeSalida, en
+la misma transacción que la cita (por señal, o a mano en los caminos masivos):
+si la reserva se deshace, su correo también. El comando enviar_correos llama
+a enviar_pendientes(), que:
+
+1. Lee los mensajes cuyo `enviar_desde` ya ha llegado, por el índice parcial
+   de pendientes, con su usuario y su cita en la misma consulta.
+2. Compone cada correo con la cita tal como está en ese momento (plantillas
+   gestion_citas/correos/) y los manda todos por una única conexión SMTP.
+3. Si uno falla se reintenta más tarde, hasta MAX_INTENTOS.
+
+El recordatorio de cada cita se encola al reservarla para que salga
+NOTIFICACIONES_HORAS_RECORDATORIO horas antes; si la cita cambia de día u
+hora se reprograma, y si se cancela se descarta. Se supone un solo proceso
+enviando a la vez.
+"""
+
+import smtplib
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import MensajeSalida
+
+
+MAX_INTENTOS = 5
+
+ASUNTOS = {
+    MensajeSalida.BIENVENIDA: "Bienvenido a la barbería",
+    MensajeSalida.RESERVA: "Cita reservada para el {fecha}",
+    MensajeSalida.CAMBIO: "Tu cita ha cambiado: {fecha}",
+    MensajeSalida.CANCELACION: "Cita cancelada del {fecha}",
+    MensajeSalida.RECORDATORIO: "Recordatorio: mañana tienes cita a las {hora}",
+    MensajeSalida.OFERTA: "Hay un hueco para ti el {fecha}",
+}
+
+# Citas que ya no necesitan recordatorio
+SIN_RECORDATORIO = ("CANCELADA", "NO_PRESENTADO")
+
+
+def antelacion_recordatorio():
+    return timedelta(hours=getattr(settings, "NOTIFICACIONES_HORAS_RECORDATORIO", 24))
+
+
+def _momento(cita):
+    return timezone.make_aware(datetime.combine(cita.fecha, cita.hora))
+
+
+# --- Encolar (dentro de la transacción de la cita) ---
+
+def encolar(usuario_id, tipo, cita=None, enviar_desde=None):
+    return MensajeSalida.objects.create(
+        usuario_id=usuario_id, tipo=tipo, cita=cita, enviar_desde=enviar_desde or timezone.now()
+    )
+
+
+def _recordatorio(cita, ahora):
+    # None si la cita está tan cerca que ya no toca recordarla
+    cuando = _momento(cita) - antelacion_recordatorio()
+    if cuando <= ahora:
+        return None
+    return MensajeSalida(usuario_id=cita.usuario_id, cita_id=cita.id, tipo=MensajeSalida.RECORDATORIO, enviar_desde=cuando)
+
+
+def programar_recordatorios(citas, ahora=None):
+    ahora = ahora or timezone.now()
+    nuevos = [mensaje for mensaje in (_recordatorio(cita, ahora) for cita in citas) if mensaje is not None]
+    return MensajeSalida.objects.bulk_create(nuevos, batch_size=500)
+
+
+def descartar_recordatorios(citas):
+    # citas: queryset o lista de ids
+    return MensajeSalida.objects.filter(
+        cita__in=citas, tipo=MensajeSalida.RECORDATORIO, estado=MensajeSalida.PENDIENTE
+    ).update(estado=MensajeSalida.DESCARTADO)
+
+
+def reprogramar_recordatorios(citas, ahora=None):
+    citas = list(citas)
+    descartar_recordatorios([cita.id for cita in citas])
+    return programar_recordatorios(citas, ahora)
+
+
+def cita_guardada(cita, created):
+    """Lo que se avisa al guardar una cita suelta (lo llama la señal post_save)."""
+    if created:
+        # La lista de espera lo marca como OFERTA; None para no avisar
+        tipo = getattr(cita, "_aviso", MensajeSalida.RESERVA)
+        if tipo is not None:
+            encolar(cita.usuario_id, tipo, cita)
+            programar_recordatorios([cita])
+        return
+
+    original = getattr(cita, "_original", None)
+    if original is None or None in original:
+        return
+    barbero_id, fecha, servicio_id, estado, hora = original
+    if cita.estado == "CANCELADA":
+        if estado != "CANCELADA":
+            encolar(cita.usuario_id, MensajeSalida.CANCELACION, cita)
+            descartar_recordatorios([cita.id])
+        return
+
+    movida = (fecha, hora) != (cita.fecha, cita.hora) or estado == "CANCELADA"
+    if movida or (barbero_id, servicio_id) != (cita.barbero_id, cita.servicio_id):
+        encolar(cita.usuario_id, MensajeSalida.CAMBIO, cita)
+    if movida:
+        reprogramar_recordatorios([cita])
+
+
+# --- Enviar (comando enviar_correos) ---
+
+def pendientes(ahora, lote):
+    return (
+        MensajeSalida.objects.filter(estado=MensajeSalida.PENDIENTE, enviar_desde__lte=ahora)
+        .select_related("usuario", "cita__barbero", "cita__servicio", "cita__serie")
+        .order_by("enviar_desde", "id")[:lote]
+    )
+
+
+def componer(mensaje, ahora):
+    """El EmailMessage de un mensaje, o None si ya no tiene sentido mandarlo."""
+    cita = mensaje.cita
+    if mensaje.tipo != MensajeSalida.BIENVENIDA and cita is None:
+        return None
+    if mensaje.tipo == MensajeSalida.RECORDATORIO and (cita.estado in SIN_RECORDATORIO or _momento(cita) <= ahora):
+        return None
+
+    contexto = {"usuario": mensaje.usuario, "cita": cita}
+    asunto = ASUNTOS[mensaje.tipo]
+    if cita is not None:
+        asunto = asunto.format(fecha=cita.fecha.strftime("%d/%m/%Y"), hora=cita.hora.strftime("%H:%M"))
+    cuerpo = render_to_string(f"gestion_citas/correos/{mensaje.tipo.lower()}.txt", contexto)
+    return EmailMessage(asunto, cuerpo, to=[mensaje.usuario.email])
+
+
+def enviar_pendientes(lote=100, ahora=None):
+    """Manda los mensajes que ya tocan por una sola conexión; devuelve (enviados, fallidos, descartados)."""
+    ahora = ahora or timezone.now()
+    mensajes = list(pendientes(ahora, lote))
+    if not mensajes:
+        return 0, 0, 0
+
+    enviados = fallidos = descartados = 0
+    with get_connection() as conexion:
+        for mensaje in mensajes:
+            correo = componer(mensaje, ahora)
+            if correo is None:
+                mensaje.estado = MensajeSalida.DESCARTADO
+                descartados += 1
+                continue
+            try:
+                conexion.send_messages([correo])
+            except (smtplib.SMTPException, OSError) as error:
+                mensaje.intentos += 1
+                mensaje.error = str(error)
+                if mensaje.intentos >= MAX_INTENTOS:
+                    mensaje.estado = MensajeSalida.FALLIDO
+                else:
+                    # Cada reintento espera el doble: 10, 20, 40... minutos
+                    mensaje.enviar_desde = ahora + timedelta(minutes=5 * 2 ** mensaje.intentos)
+                fallidos += 1
+            else:
+                mensaje.estado = MensajeSalida.ENVIADO
+                mensaje.enviado = ahora
+                enviados += 1
+
+    MensajeSalida.objects.bulk_update(mensajes, ["estado", "enviar_desde", "intentos", "error", "enviado"])
+    return enviados, fallidos, descartados
@@ -0,0 +1,92 @@
+"""
+Mediciones por petición: consultas, tiempo de BD y tiempo de plantillas.
+
+RendimientoMiddleware (middleware.py) abre una Medicion al empezar cada
+petición y la deja en una ContextVar; el contador de consultas (un
+execute_wrapper que se instala en cada conexión) y el backend de plantillas
+de este módulo suman en ella. Fuera de una petición no hacen nada.
+"""
+
+from collections import Counter
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+
+_medicion = ContextVar("medicion_rendimiento", default=None)
+
+
+class Medicion:
+    def __init__(self):
+        self.inicio = perf_counter()
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tiempo_plantillas = 0.0
+        self.sql = Counter()
+        self._profundidad_plantillas = 0
+
+    def repetidas(self, minimo=2, limite=3):
+        # Las consultas que más se repiten: la pista de un N+1
+        return [(sql, veces) for sql, veces in self.sql.most_common(limite) if veces >= minimo]
+
+
+def empezar():
+    medicion = Medicion()
+    return medicion, _medicion.set(medicion)
+
+
+def terminar(marca):
+    _medicion.reset(marca)
+
+
+def contar_consulta(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.tiempo_bd += perf_counter() - inicio
+        medicion.consultas += 1
+        medicion.sql[sql] += 1
+
+
+def instalar_contador(connection, **kwargs):
+    # Receptor de connection_created; también vale para conexiones ya abiertas
+    if contar_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(contar_consulta)
+
+
+class PlantillaMedida(Template):
+    def render(self, context=None, request=None):
+        medicion = _medicion.get()
+        if medicion is None:
+            return super().render(context, request)
+        # Solo cuenta la plantilla exterior (las incluidas ya están dentro de su tiempo)
+        medicion._profundidad_plantillas += 1
+        inicio = perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            medicion._profundidad_plantillas -= 1
+            if not medicion._profundidad_plantillas:
+                medicion.tiempo_plantillas += perf_counter() - inicio
+
+
+class PlantillasMedidas(DjangoTemplates):
+    """DjangoTemplates que anota en la petición cuánto tarda cada render().
+
+    El tiempo incluye las consultas perezosas que se ejecutan al pintar.
+    """
+
+    def from_string(self, template_code):
+        return PlantillaMedida(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return PlantillaMedida(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,93 @@
+import random
+import time
+from collections import namedtuple
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, OperationalError, transaction
+
+
+MENSAJE_HUECO_OCUPADO = "Ese hueco se acaba de ocupar. Elige otra hora, por favor."
+
+# Reintentos ante "database is locked" de SQLite: 5 intentos, esperando 50 ms, 100 ms, 200 ms...
+MAX_INTENTOS = 5
+ESPERA_INICIAL = 0.05
+
+
+class ResultadoReserva(namedtuple("ResultadoReserva", ["cita", "error"])):
+    @property
+    def ok(self):
+        return self.cita is not None
+
+
+def _es_bloqueo(error):
+    # "database is locked" (otro proceso escribe) o "database table is locked" (caché compartida)
+    return "locked" in str(error)
+
+
+def _es_hueco_duplicado(error):
+    return "UNIQUE" in str(error) or "cita_unica_barbero_fecha_hora" in str(error)
+
+
+def _en_transaccion(operacion, intentos=MAX_INTENTOS, espera=ESPERA_INICIAL):
+    # Ejecuta operacion() en una transacción, repitiéndola si SQLite está bloqueada
+    for intento in range(intentos):
+        try:
+            with transaction.atomic():
+                return operacion()
+        except OperationalError as error:
+            if not _es_bloqueo(error) or intento == intentos - 1:
+                raise
+            time.sleep(espera * 2 ** intento * random.uniform(1, 1.5))
+
+
+def reservar_cita(cita, **opciones):
+    """Valida y guarda `cita` dentro de una única transacción.
+
+    La comprobación de solapes y el INSERT van juntos; si aun así otra petición
+    se cuela, la restricción única de la BD lo detecta y se devuelve un
+    resultado fallido en lugar de una excepción.
+    """
+    def operacion():
+        # La restricción única ya la comprueba la BD al insertar: no la consultamos dos veces
+        cita.full_clean(validate_constraints=False)
+        cita.save()
+        return cita
+
+    try:
+        return ResultadoReserva(_en_transaccion(operacion, **opciones), None)
+    except ValidationError as error:
+        return ResultadoReserva(None, error)
+    except IntegrityError as error:
+        if not _es_hueco_duplicado(error):
+            raise
+        return ResultadoReserva(None, ValidationError(MENSAJE_HUECO_OCUPADO))
+
+
+def guardar_formulario(form, **campos):
+    """Lo mismo que reservar_cita, pero a partir de un CitaForm/CitaStaffForm.
+
+    La validación del formulario (que ya incluye Cita.clean) se hace dentro de la
+    transacción, así que la consulta de solapes se ejecuta una sola vez. `campos`
+    son valores que pone la vista y no vienen en el formulario (p. ej. usuario).
+    Si falla, los errores quedan en el formulario.
+    """
+    def operacion():
+        form.full_clean()
+        if form.errors:
+            return None
+        cita = form.save(commit=False)
+        for nombre, valor in campos.items():
+            setattr(cita, nombre, valor)
+        cita.save()
+        return cita
+
+    try:
+        cita = _en_transaccion(operacion)
+    except IntegrityError as error:
+        if not _es_hueco_duplicado(error):
+            raise
+        form.add_error(None, MENSAJE_HUECO_OCUPADO)
+        return ResultadoReserva(None, ValidationError(MENSAJE_HUECO_OCUPADO))
+    if cita is None:
+        return ResultadoReserva(None, ValidationError(form.non_field_errors() or "Formulario no válido"))
+    return ResultadoReserva(cita, None)
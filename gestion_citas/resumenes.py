@@ -0,0 +1,127 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from . import historial
+from .models import Cita, ResumenDiario, Servicio
+
+
+CANCELADA = "CANCELADA"
+NO_PRESENTADO = "NO_PRESENTADO"
+
+
+def _aportacion(estado, precio):
+    # Lo que suma una cita a su día: (citas, cancelaciones, ingresos)
+    if estado == CANCELADA:
+        return 1, 1, Decimal(0)
+    if estado == NO_PRESENTADO:
+        return 1, 0, Decimal(0)
+    return 1, 0, Decimal(precio)
+
+
+def aplicar(barbero_id, fecha, citas=0, cancelaciones=0, ingresos=0):
+    if not (citas or cancelaciones or ingresos):
+        return
+    cambios = dict(
+        citas=F("citas") + citas,
+        cancelaciones=F("cancelaciones") + cancelaciones,
+        ingresos=F("ingresos") + ingresos,
+    )
+    filas = ResumenDiario.objects.filter(barbero_id=barbero_id, fecha=fecha)
+    if citas < 0:
+        # Al restar nunca creamos filas: si el barbero se está borrando en cascada,
+        # su resumen puede haber desaparecido ya
+        filas.update(**cambios)
+        return
+    ResumenDiario.objects.get_or_create(barbero_id=barbero_id, fecha=fecha)
+    filas.update(**cambios)
+
+
+def registrar_guardado(cita, created):
+    nuevo = (cita.barbero_id, cita.fecha, *_aportacion(cita.estado, cita.servicio.precio))
+    original = None if created else getattr(cita, "_original", None)
+
+    with transaction.atomic():
+        if original is not None and None in original[:4]:
+            # Se leyó con only()/defer(): no sabemos de dónde venía, recontamos su día
+            reconstruir(cita.fecha, cita.fecha, barbero_id=cita.barbero_id)
+        elif original is not None:
+            barbero_id, fecha, servicio_id, estado, _ = original
+            precio = cita.servicio.precio
+            if servicio_id != cita.servicio_id:
+                precio = Servicio.objects.filter(id=servicio_id).values_list("precio", flat=True).first() or 0
+            antes = (barbero_id, fecha, *_aportacion(estado, precio))
+            if antes != nuevo:
+                aplicar(barbero_id, fecha, *(-valor for valor in antes[2:]))
+                aplicar(*nuevo)
+        elif created:
+            aplicar(*nuevo)
+
+    cita._original = (cita.barbero_id, cita.fecha, cita.servicio_id, cita.estado, cita.hora)
+
+
+def registrar_borrado(cita):
+    barbero_id, fecha, _, estado, _ = getattr(cita, "_original", None) or (
+        cita.barbero_id, cita.fecha, cita.servicio_id, cita.estado, cita.hora
+    )
+    precio = Servicio.objects.filter(id=cita.servicio_id).values_list("precio", flat=True).first() or 0
+    aplicar(barbero_id, fecha, *(-valor for valor in _aportacion(estado, precio)))
+
+
+def cambiar_estado(citas, nuevo_estado):
+    """update(estado=...) masivo que mantiene los resúmenes y el historial al día.
+
+    Las señales no se disparan con update(), así que primero agrupamos lo que
+    cambia por barbero y día y luego aplicamos las diferencias.
+    """
+    with transaction.atomic():
+        afectadas = citas.exclude(estado=nuevo_estado)
+        deltas = defaultdict(lambda: [0, 0, Decimal(0)])
+        filas = list(afectadas.order_by().values_list("id", "barbero_id", "fecha", "estado", "servicio__precio"))
+        for _, barbero_id, fecha, estado, precio in filas:
+            antes = _aportacion(estado, precio)
+            despues = _aportacion(nuevo_estado, precio)
+            delta = deltas[(barbero_id, fecha)]
+            for posicion in range(3):
+                delta[posicion] += despues[posicion] - antes[posicion]
+
+        # update() no toca auto_now: sin `actualizado` los calendarios no verían el cambio
+        actualizadas = afectadas.update(estado=nuevo_estado, actualizado=timezone.now())
+        historial.registrar_cambios([fila[:4] for fila in filas], nuevo_estado)
+        for (barbero_id, fecha), (citas_delta, cancelaciones, ingresos) in deltas.items():
+            aplicar(barbero_id, fecha, citas_delta, cancelaciones, ingresos)
+    return actualizadas
+
+
+def reconstruir(desde=None, hasta=None, barbero_id=None):
+    # Recalcula los resúmenes desde Cita con un único GROUP BY (para el histórico o si se desvían)
+    citas = Cita.objects.all()
+    resumenes = ResumenDiario.objects.all()
+    if desde:
+        citas, resumenes = citas.filter(fecha__gte=desde), resumenes.filter(fecha__gte=desde)
+    if hasta:
+        citas, resumenes = citas.filter(fecha__lte=hasta), resumenes.filter(fecha__lte=hasta)
+    if barbero_id:
+        citas, resumenes = citas.filter(barbero_id=barbero_id), resumenes.filter(barbero_id=barbero_id)
+
+    totales = citas.order_by().values("barbero_id", "fecha").annotate(
+        total=Count("id"),
+        canceladas=Count("id", filter=Q(estado=CANCELADA)),
+        suma=Sum("servicio__precio", filter=~Q(estado__in=[CANCELADA, NO_PRESENTADO])),
+    )
+    with transaction.atomic():
+        resumenes.delete()
+        nuevos = ResumenDiario.objects.bulk_create(
+            (
+                ResumenDiario(
+                    barbero_id=fila["barbero_id"], fecha=fila["fecha"], citas=fila["total"],
+                    cancelaciones=fila["canceladas"], ingresos=fila["suma"] or 0,
+                )
+                for fila in totales.iterator()
+            ),
+            batch_size=500,
+        )
+    return len(nuevos)
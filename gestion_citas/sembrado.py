@@ -0,0 +1,139 @@
+"""
+Datos de prueba realistas a escala configurable (para benchmarks y pruebas de carga).
+
+Todo se inserta con bulk_create, así que no pasan señales ni Cita.clean: al
+final se registra su creación en el historial y se reconstruyen los resúmenes
+diarios, la capacidad del próximo mes y las valoraciones de golpe. Los
+barberos sembrados no tienen horario propio y trabajan en los TURNOS de siempre.
+"""
+
+import random
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+
+from . import historial, horarios, resumenes
+from .huecos import PASO_MINUTOS, TURNOS, a_hora, a_minutos
+from .models import Barbero, Cita, Resena, Servicio, Usuario
+
+
+# Contraseña de todos los usuarios sembrados (se calcula el hash una sola vez)
+CONTRASENA = "barberia-bench"
+
+EMAIL_STAFF = "staff@bench.example.com"
+
+ESCALAS = {
+    "pequena": {"barberos": 3, "servicios": 4, "usuarios": 20, "meses": 1, "ocupacion": 0.5, "resenas": 30},
+    "media": {"barberos": 8, "servicios": 6, "usuarios": 500, "meses": 6, "ocupacion": 0.6, "resenas": 400},
+    "grande": {"barberos": 20, "servicios": 8, "usuarios": 5000, "meses": 24, "ocupacion": 0.7, "resenas": 5000},
+}
+
+SERVICIOS = [
+    ("Corte", 15, 30), ("Barba", 10, 30), ("Corte y barba", 22, 60), ("Afeitado a navaja", 14, 30),
+    ("Tinte", 25, 60), ("Corte infantil", 12, 30), ("Diseño de cejas", 8, 30), ("Tratamiento capilar", 30, 60),
+]
+
+NOMBRES = ["Juan", "Carlos", "Luis", "Marta", "Pablo", "Lucía", "Diego", "Sara", "Iván", "Elena"]
+APELLIDOS = ["Pérez", "García", "López", "Martín", "Sánchez", "Romero", "Navarro", "Torres", "Gil", "Ruiz"]
+COMENTARIOS = ["Muy buen corte", "Rápido y amable", "Repetiré", "Normal", "Llegó tarde", "Genial, como siempre"]
+
+
+def sembrar(barberos, servicios, usuarios, meses, ocupacion, resenas, semilla=42, hoy=None):
+    """Crea el catálogo, los usuarios, las citas de los últimos `meses` (y del mes que viene) y reseñas.
+
+    Devuelve un diccionario con cuántas filas se han creado de cada tipo.
+    """
+    aleatorio = random.Random(semilla)
+    hoy = hoy or date.today()
+
+    catalogo = Servicio.objects.bulk_create([
+        Servicio(nombre=nombre, precio=precio, duracion=duracion)
+        for nombre, precio, duracion in SERVICIOS[:servicios]
+    ])
+    plantilla = Barbero.objects.bulk_create([
+        Barbero(
+            nombre=aleatorio.choice(NOMBRES), apellido=aleatorio.choice(APELLIDOS),
+            experiencia=aleatorio.randint(1, 25),
+        )
+        for _ in range(barberos)
+    ])
+    Barbero.especialidades.through.objects.bulk_create([
+        Barbero.especialidades.through(barbero_id=barbero.id, servicio_id=servicio.id)
+        for barbero in plantilla
+        for servicio in aleatorio.sample(catalogo, aleatorio.randint(1, len(catalogo)))
+    ])
+
+    clave = make_password(CONTRASENA)
+    # Numeramos a partir de los que ya haya, por si se siembra dos veces
+    primero = Usuario.objects.count()
+    clientes = Usuario.objects.bulk_create(
+        [
+            Usuario(
+                email=f"cliente{n}@bench.example.com", password=clave,
+                first_name=aleatorio.choice(NOMBRES), last_name=aleatorio.choice(APELLIDOS),
+            )
+            for n in range(primero, primero + usuarios)
+        ],
+        batch_size=1000,
+    )
+    Usuario.objects.get_or_create(
+        email=EMAIL_STAFF,
+        defaults={"password": clave, "first_name": "Staff", "last_name": "Bench", "is_staff": True},
+    )
+
+    citas = Cita.objects.bulk_create(
+        _citas(aleatorio, hoy, meses, ocupacion, plantilla, catalogo, clientes),
+        batch_size=1000,
+    )
+    historial.registrar_creadas(citas)
+    Resena.objects.bulk_create(
+        [
+            Resena(
+                barbero=aleatorio.choice(plantilla), usuario=aleatorio.choice(clientes),
+                puntuacion=aleatorio.choices(range(1, 6), weights=[1, 1, 3, 6, 8])[0],
+                comentario=aleatorio.choice(COMENTARIOS),
+            )
+            for _ in range(resenas if clientes else 0)
+        ],
+        batch_size=1000,
+    )
+
+    resumenes.reconstruir()
+    horarios.recalcular(hoy, hoy + timedelta(days=30))
+    Barbero.recalcular_valoraciones()
+    return {
+        "servicios": len(catalogo), "barberos": len(plantilla), "usuarios": len(clientes),
+        "citas": len(citas), "resenas": resenas if clientes else 0,
+    }
+
+
+def _citas(aleatorio, hoy, meses, ocupacion, barberos, servicios, clientes):
+    # Recorre cada turno hueco a hueco; un servicio largo ocupa los huecos siguientes
+    if not clientes:
+        return
+    dia = hoy - timedelta(days=30 * meses)
+    fin = hoy + timedelta(days=30)
+    while dia <= fin:
+        for barbero in barberos:
+            for inicio, cierre in TURNOS:
+                minuto, cierre = a_minutos(inicio), a_minutos(cierre)
+                while minuto < cierre:
+                    caben = [s for s in servicios if minuto + s.duracion <= cierre]
+                    if not caben or aleatorio.random() >= ocupacion:
+                        minuto += PASO_MINUTOS
+                        continue
+                    servicio = aleatorio.choice(caben)
+                    yield Cita(
+                        usuario=aleatorio.choice(clientes), barbero=barbero, servicio=servicio,
+                        fecha=dia, hora=a_hora(minuto), estado=_estado(aleatorio, dia, hoy),
+                    )
+                    minuto += max(servicio.duracion, PASO_MINUTOS)
+        dia += timedelta(days=1)
+
+
+def _estado(aleatorio, dia, hoy):
+    if aleatorio.random() < 0.08:
+        return "CANCELADA"
+    if dia < hoy:
+        return "CONFIRMADA"
+    return aleatorio.choice(["PENDIENTE", "CONFIRMADA"])
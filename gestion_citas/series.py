@@ -0,0 +1,174 @@
+"""
+Reservas periódicas: crear todas las citas de una serie y cambiarlas "desde esta en adelante".
+
+Todo va en bloque: una consulta para cargar la agenda del barbero en todo el
+rango (y otras tres para su horario), las comprobaciones en memoria con
+IndiceHuecos, un bulk_create para crear y un update() para modificar o cancelar.
+"""
+
+from collections import namedtuple
+from datetime import date, timedelta
+
+from django.db import IntegrityError
+from django.utils import timezone
+
+from . import historial, horarios, lista_espera, notificaciones, resumenes
+from .huecos import IndiceHuecos
+from .models import Cita, MensajeSalida, SerieCita
+from .reservas import MENSAJE_HUECO_OCUPADO, _en_transaccion, _es_hueco_duplicado
+
+
+CANCELADA = "CANCELADA"
+
+# Límite de citas por serie (un año cada semana)
+MAX_CITAS_SERIE = 52
+
+
+class ResultadoSerie(namedtuple("ResultadoSerie", ["serie", "creadas", "omitidas", "error"])):
+    """`omitidas` es una lista de (fecha, motivo) con las fechas que no se han podido reservar."""
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def fechas_serie(inicio, fin, cada_semanas):
+    fechas = []
+    fecha = inicio
+    while fecha <= fin and len(fechas) < MAX_CITAS_SERIE:
+        fechas.append(fecha)
+        fecha += timedelta(weeks=cada_semanas)
+    return fechas
+
+
+def crear_serie(serie):
+    """Guarda `serie` (sin guardar aún) y crea todas sus citas en una transacción.
+
+    Las fechas pasadas u ocupadas se saltan y se devuelven en `omitidas`; el
+    resto se crea con un único bulk_create.
+    """
+    hoy = date.today()
+    fechas = fechas_serie(serie.fecha_inicio, serie.fecha_fin, serie.cada_semanas)
+    duracion = serie.servicio.duracion
+
+    def operacion():
+        # Toda la agenda y el horario del barbero en el rango de la serie, de una vez
+        indice = IndiceHuecos.cargar(serie.barbero_id, fechas[0], fechas[-1])
+        turnos = horarios.turnos_por_dia([serie.barbero_id], fechas[0], fechas[-1])
+        omitidas, libres = [], []
+        for fecha in fechas:
+            if fecha < hoy:
+                omitidas.append((fecha, "La fecha ya ha pasado"))
+            elif not horarios.dentro_de_turnos(turnos[(serie.barbero_id, fecha)], serie.hora, duracion):
+                omitidas.append((fecha, "El barbero no trabaja ese día a esa hora"))
+            elif not indice.libre(fecha, serie.hora, duracion):
+                omitidas.append((fecha, "El barbero ya tiene una cita a esa hora"))
+            else:
+                libres.append(fecha)
+        if not libres:
+            return [], omitidas
+
+        serie.save()
+        citas = Cita.objects.bulk_create([
+            Cita(
+                usuario_id=serie.usuario_id, barbero_id=serie.barbero_id, servicio_id=serie.servicio_id,
+                fecha=fecha, hora=serie.hora, notas=serie.notas, serie=serie,
+            )
+            for fecha in libres
+        ])
+        # bulk_create no dispara las señales: historial y días de la serie a mano
+        historial.registrar_creadas(citas)
+        # Un solo correo para toda la serie y un recordatorio por cita
+        notificaciones.encolar(serie.usuario_id, MensajeSalida.RESERVA, citas[0])
+        notificaciones.programar_recordatorios(citas)
+        resumenes.reconstruir(libres[0], libres[-1], barbero_id=serie.barbero_id)
+        horarios.actualizar_ocupacion(libres[0], libres[-1], barbero_id=serie.barbero_id)
+        return citas, omitidas
+
+    try:
+        citas, omitidas = _en_transaccion(operacion)
+    except IntegrityError as error:
+        if not _es_hueco_duplicado(error):
+            raise
+        serie.pk = None
+        return ResultadoSerie(None, [], [], MENSAJE_HUECO_OCUPADO)
+    if not citas:
+        return ResultadoSerie(None, [], omitidas, "No queda ninguna fecha libre en la serie.")
+    return ResultadoSerie(serie, citas, omitidas, None)
+
+
+def siguientes(cita):
+    # Esta cita y las posteriores de su serie que siguen activas
+    return Cita.objects.filter(serie_id=cita.serie_id, fecha__gte=cita.fecha).exclude(estado=CANCELADA)
+
+
+def cancelar_desde(cita):
+    """Cancela esta cita y las siguientes de la serie con un único UPDATE; devuelve cuántas."""
+    def operacion():
+        lista_espera.encolar_citas(siguientes(cita))
+        notificaciones.descartar_recordatorios(siguientes(cita))
+        canceladas = resumenes.cambiar_estado(siguientes(cita), CANCELADA)
+        if canceladas:
+            notificaciones.encolar(cita.usuario_id, MensajeSalida.CANCELACION, cita)
+        horarios.actualizar_ocupacion(cita.fecha, date.max, barbero_id=cita.barbero_id)
+        # La serie termina justo antes de esta cita
+        SerieCita.objects.filter(id=cita.serie_id).update(fecha_fin=cita.fecha - timedelta(days=1))
+        return canceladas
+
+    return _en_transaccion(operacion)
+
+
+def modificar_desde(cita, hora=None, servicio=None):
+    """Cambia hora y/o servicio de esta cita y de las siguientes de la serie.
+
+    Comprueba todas las fechas contra la agenda del barbero de una vez (sin
+    contar las propias citas que se mueven). Si alguna choca no se cambia
+    ninguna y se devuelve la lista de (fecha, motivo); si no, un solo
+    UPDATE y una lista vacía.
+    """
+    hora = hora or cita.hora
+    servicio = servicio or cita.servicio
+    cambios = {"hora": hora, "servicio_id": servicio.id}
+
+    def operacion():
+        afectadas = siguientes(cita)
+        propias = list(afectadas.order_by("fecha").values_list("id", "fecha"))
+        if not propias:
+            return []
+        ids = {cita_id for cita_id, _ in propias}
+        ocupadas = (
+            Cita.objects.filter(barbero_id=cita.barbero_id, fecha__gte=propias[0][1], fecha__lte=propias[-1][1])
+            .exclude(estado=CANCELADA).exclude(id__in=ids)
+            .order_by().values_list("fecha", "hora", "servicio__duracion")
+        )
+        indice = IndiceHuecos.desde_citas(ocupadas)
+        turnos = horarios.turnos_por_dia([cita.barbero_id], propias[0][1], propias[-1][1])
+        conflictos = []
+        for _, fecha in propias:
+            if not horarios.dentro_de_turnos(turnos[(cita.barbero_id, fecha)], hora, servicio.duracion):
+                conflictos.append((fecha, "El barbero no trabaja ese día a esa hora"))
+            elif not indice.libre(fecha, hora, servicio.duracion):
+                conflictos.append((fecha, "El barbero ya tiene una cita a esa hora"))
+        if conflictos:
+            return conflictos
+
+        afectadas.update(**cambios, actualizado=timezone.now())
+        SerieCita.objects.filter(id=cita.serie_id).update(**cambios)
+        notificaciones.encolar(cita.usuario_id, MensajeSalida.CAMBIO, cita)
+        if hora != cita.hora:
+            # Sin volver a leerlas: ya sabemos su id, su fecha y la hora nueva
+            notificaciones.reprogramar_recordatorios(
+                Cita(id=cita_id, usuario_id=cita.usuario_id, fecha=fecha, hora=hora) for cita_id, fecha in propias
+            )
+        if servicio.id != cita.servicio_id:
+            # Cambia el precio: los ingresos de esos días se recalculan de una vez
+            resumenes.reconstruir(propias[0][1], propias[-1][1], barbero_id=cita.barbero_id)
+        horarios.actualizar_ocupacion(propias[0][1], propias[-1][1], barbero_id=cita.barbero_id)
+        return []
+
+    try:
+        return _en_transaccion(operacion)
+    except IntegrityError as error:
+        if not _es_hueco_duplicado(error):
+            raise
+        return [(cita.fecha, MENSAJE_HUECO_OCUPADO)]
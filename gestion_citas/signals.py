@@ -0,0 +1,185 @@
+from django.db import connections, transaction
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import historial, horarios, imagenes, lista_espera, notificaciones, rendimiento, resumenes
+from .cache_portada import invalidar_portada
+from .catalogo import invalidar_catalogo
+from .models import Barbero, CierreTienda, Cita, ExcepcionHorario, HorarioSemanal, Resena, Servicio
+
+
+def _sumar_valoracion(barbero_id, resenas, puntos):
+    # Actualización atómica en la BD: sin leer ni reescribir el barbero entero
+    Barbero.objects.filter(id=barbero_id).update(
+        num_resenas=F("num_resenas") + resenas,
+        suma_puntuaciones=F("suma_puntuaciones") + puntos,
+    )
+
+
+@receiver(post_save, sender=Resena)
+def resena_guardada(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    original = getattr(instance, "_original", None)
+    if created:
+        _sumar_valoracion(instance.barbero_id, 1, instance.puntuacion)
+    elif original is not None:
+        barbero_anterior, puntuacion_anterior = original
+        if barbero_anterior != instance.barbero_id:
+            _sumar_valoracion(barbero_anterior, -1, -puntuacion_anterior)
+            _sumar_valoracion(instance.barbero_id, 1, instance.puntuacion)
+        elif puntuacion_anterior != instance.puntuacion:
+            _sumar_valoracion(instance.barbero_id, 0, instance.puntuacion - puntuacion_anterior)
+    instance._original = (instance.barbero_id, instance.puntuacion)
+
+
+@receiver(post_delete, sender=Resena)
+def resena_borrada(sender, instance, **kwargs):
+    _sumar_valoracion(instance.barbero_id, -1, -instance.puntuacion)
+
+
+# --- Caché de la portada ---
+# Se invalida al confirmar la transacción, para que nadie vuelva a cachear datos viejos
+# entre el borrado de la caché y el commit
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+@receiver(post_save, sender=Barbero)
+@receiver(post_delete, sender=Barbero)
+@receiver(post_save, sender=Resena)
+@receiver(post_delete, sender=Resena)
+@receiver(m2m_changed, sender=Barbero.especialidades.through)
+def portada_modificada(sender, **kwargs):
+    if kwargs.get("raw"):
+        return
+    transaction.on_commit(invalidar_portada)
+
+
+# --- Catálogo de los formularios de reserva (ver catalogo.py) ---
+@receiver(post_save, sender=Servicio)
+@receiver(post_delete, sender=Servicio)
+@receiver(post_save, sender=Barbero)
+@receiver(post_delete, sender=Barbero)
+def catalogo_modificado(sender, **kwargs):
+    if kwargs.get("raw"):
+        return
+    invalidar_catalogo()
+    transaction.on_commit(invalidar_catalogo)
+
+
+# --- Capacidad diaria del calendario (ver horarios.py) ---
+# Va antes que los resúmenes: registrar_guardado sustituye _original por los valores nuevos
+@receiver(post_save, sender=Cita)
+@receiver(post_delete, sender=Cita)
+def ocupacion_modificada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dias = {(instance.barbero_id, instance.fecha)}
+    barbero_anterior, fecha_anterior, *_ = getattr(instance, "_original", None) or (None, None)
+    if barbero_anterior is not None and fecha_anterior is not None:
+        dias.add((barbero_anterior, fecha_anterior))
+    for barbero_id, fecha in dias:
+        horarios.actualizar_ocupacion(fecha, barbero_id=barbero_id)
+
+
+# --- Lista de espera: el hueco de una cita cancelada se encola para ofrecerlo ---
+# También antes que los resúmenes, por el mismo motivo
+@receiver(post_save, sender=Cita)
+def cita_cancelada(sender, instance, created, raw=False, **kwargs):
+    if raw or created or instance.estado != "CANCELADA":
+        return
+    original = getattr(instance, "_original", None)
+    if original is not None and original[3] not in (None, "CANCELADA"):
+        lista_espera.encolar(instance.barbero_id, instance.fecha, instance.hora)
+
+
+@receiver(post_delete, sender=Cita)
+def cita_borrada_libera_hueco(sender, instance, **kwargs):
+    if instance.estado != "CANCELADA":
+        lista_espera.encolar(instance.barbero_id, instance.fecha, instance.hora)
+
+
+# --- Historial de estados (ver historial.py) ---
+# También antes que los resúmenes: necesita el estado de _original
+@receiver(post_save, sender=Cita)
+def estado_cambiado(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    autor = getattr(instance, "_autor", None)
+    if created:
+        historial.registrar(instance, autor=autor)
+        return
+    anterior = (getattr(instance, "_original", None) or (None,) * 4)[3]
+    if anterior is not None and anterior != instance.estado:
+        historial.registrar(instance, anterior, autor=autor)
+
+
+# --- Correos al cliente (ver notificaciones.py) ---
+# También antes que los resúmenes: compara con _original. Se encolan en la misma
+# transacción que la cita; los manda el comando enviar_correos
+@receiver(post_save, sender=Cita)
+def cita_notificada(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    notificaciones.cita_guardada(instance, created)
+
+
+# --- Resúmenes diarios del dashboard ---
+@receiver(post_save, sender=Cita)
+def cita_guardada(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    resumenes.registrar_guardado(instance, created)
+
+
+@receiver(post_delete, sender=Cita)
+def cita_borrada(sender, instance, **kwargs):
+    resumenes.registrar_borrado(instance)
+
+
+@receiver(post_save, sender=HorarioSemanal)
+@receiver(post_delete, sender=HorarioSemanal)
+def horario_modificado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    horarios.recalcular(barbero_id=instance.barbero_id)
+
+
+@receiver(post_save, sender=ExcepcionHorario)
+@receiver(post_delete, sender=ExcepcionHorario)
+def excepcion_modificada(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    dias = {(instance.barbero_id, instance.fecha), getattr(instance, "_original", None) or (None, None)}
+    for barbero_id, fecha in dias:
+        if barbero_id is not None:
+            horarios.recalcular(fecha, fecha, barbero_id=barbero_id)
+    instance._original = (instance.barbero_id, instance.fecha)
+
+
+@receiver(post_save, sender=CierreTienda)
+@receiver(post_delete, sender=CierreTienda)
+def cierre_modificado(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    horarios.recalcular(instance.fecha, instance.fecha)
+
+
+# --- Miniaturas de la foto del barbero ---
+@receiver(post_save, sender=Barbero)
+def barbero_guardado(sender, instance, raw=False, **kwargs):
+    if raw or not imagenes.necesita_derivados(instance):
+        return
+    try:
+        instance.miniaturas = imagenes.generar_derivados(instance.foto.name)
+    except OSError:
+        # Foto ilegible o inexistente: se sigue sirviendo el original
+        return
+    Barbero.objects.filter(id=instance.id).update(miniaturas=instance.miniaturas)
+
+
+# --- Contador de consultas de RendimientoMiddleware ---
+connection_created.connect(rendimiento.instalar_contador, dispatch_uid="gestion_citas.contador_consultas")
+for _conexion in connections.all(initialized_only=True):
+    rendimiento.instalar_contador(_conexion)
@@ -0,0 +1,35 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def foto_barbero(barbero, variante, clase="", estilo="", alt=None):
+    """<picture> con WebP/JPEG y srcset 1x/2x a partir de Barbero.miniaturas.
+
+    Si aún no hay derivados (o la foto ha cambiado) se usa la foto original.
+    Uso: {% foto_barbero barbero "avatar" clase="rounded-circle" estilo="width: 30px" %}
+    """
+    alt = barbero.nombre if alt is None else alt
+    miniaturas = barbero.miniaturas or {}
+    normal = miniaturas.get("variantes", {}).get(variante)
+    doble = miniaturas.get("variantes", {}).get(f"{variante}-2x")
+    if not normal or miniaturas.get("origen") != barbero.foto.name:
+        return format_html('<img src="{}" class="{}" style="{}" alt="{}">', barbero.foto.url, clase, estilo, alt)
+
+    def srcset(formato):
+        fuentes = f"{default_storage.url(normal[formato])} 1x"
+        if doble:
+            fuentes += f", {default_storage.url(doble[formato])} 2x"
+        return fuentes
+
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" width="{}" height="{}" class="{}" style="{}" alt="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset("webp"), default_storage.url(normal["jpeg"]), srcset("jpeg"),
+        normal["ancho"], normal["alto"], clase, estilo, alt,
+    )
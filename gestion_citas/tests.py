@@ -1,3 +1,1835 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, time, timedelta
+from importlib import import_module
+from inspect import iscoroutinefunction
+from io import StringIO
+from unittest import mock
+from decimal import Decimal
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib import admin
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import connection, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models.functions import Lower
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from barber_project.basedatos import configuracion_sqlite
+from barber_project.routers import RouterSoloLectura, solo_lectura
+
+from . import (
+    benchmark, busqueda, calendario, catalogo, historial, horarios, intercambio, lista_espera, notificaciones, reservas, resumenes,
+    series, views,
+)
+from .expiracion import expirar_citas_vencidas
+from .forms import CitaForm, CitaStaffForm
+from .huecos import HORARIOS_DISPONIBLES, IndiceHuecos
+from .models import (
+    Usuario, Servicio, Barbero, Cita, Resena, ResumenDiario, SerieCita,
+    HorarioSemanal, ExcepcionHorario, CierreTienda, CapacidadDiaria, EntradaEspera, HuecoLiberado,
+    HistorialEstadoCita, MensajeSalida,
+)
+from .sembrado import ESCALAS, sembrar
+
+
+def crear_datos_basicos():
+    usuario = Usuario.objects.create_user(
+        email="cliente@example.com", password="clave-segura-123",
+        first_name="Ana", last_name="García",
+    )
+    servicio = Servicio.objects.create(nombre="Corte", precio="15.00", duracion=30)
+    barbero = Barbero.objects.create(nombre="Juan", apellido="Pérez", experiencia=5)
+    barbero.especialidades.add(servicio)
+    return usuario, servicio, barbero
+
+
+class DisponibilidadBarberoTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.client.force_login(self.usuario)
+        self.manana = date.today() + timedelta(days=1)
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.manana, hora=time(10, 0),
+        )
+        self.url = reverse("disponibilidad_barbero", args=[self.barbero.id])
+
+    def test_devuelve_huecos_libres_y_ocupados(self):
+        fecha = self.manana.strftime("%Y-%m-%d")
+        respuesta = self.client.get(self.url, {"desde": fecha, "hasta": fecha})
+
+        self.assertEqual(respuesta.status_code, 200)
+        dia = respuesta.json()["dias"][fecha]
+        self.assertEqual(dia["ocupadas"], ["10:00"])
+        self.assertNotIn("10:00", dia["libres"])
+        self.assertIn("10:30", dia["libres"])
+
+    def test_etag_devuelve_304_si_no_hay_cambios(self):
+        parametros = {"mes": self.manana.strftime("%Y-%m")}
+        respuesta = self.client.get(self.url, parametros)
+        etag = respuesta["ETag"]
+
+        respuesta = self.client.get(self.url, parametros, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.manana, hora=time(11, 0),
+        )
+        respuesta = self.client.get(self.url, parametros, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_rango_invalido(self):
+        respuesta = self.client.get(self.url, {"desde": "2026-01-01", "hasta": "2026-12-31"})
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_primera_peticion_dentro_del_presupuesto_y_sin_escribir(self):
+        parametros = {"mes": self.manana.strftime("%Y-%m"), "servicio": self.servicio.id}
+        presupuesto = settings.RENDIMIENTO_PRESUPUESTO_CONSULTAS["disponibilidad_barbero"]
+
+        # Sin CapacidadDiaria: sesión, usuario, barbero, servicio, citas, CapacidadDiaria
+        # y los tres del horario para los días que faltan
+        with self.assertNumQueries(9):
+            fria = self.client.get(self.url, parametros).json()
+        self.assertLessEqual(9, presupuesto)
+        self.assertFalse(CapacidadDiaria.objects.exists())
+
+        # Con la capacidad guardada, lo mismo con tres consultas menos
+        horarios.recalcular(date.today(), date.today() + timedelta(days=62))
+        with self.assertNumQueries(6):
+            self.assertEqual(self.client.get(self.url, parametros).json(), fria)
+
+
+class IndiceHuecosTests(SimpleTestCase):
+    def setUp(self):
+        self.dia = date(2030, 1, 7)
+        # 10:00-11:00 y 12:00-12:30
+        self.indice = IndiceHuecos.desde_citas([
+            (self.dia, time(10, 0), 60),
+            (self.dia, time(12, 0), 30),
+        ])
+
+    def test_libre_tiene_en_cuenta_la_duracion(self):
+        self.assertFalse(self.indice.libre(self.dia, time(10, 30), 30))
+        self.assertFalse(self.indice.libre(self.dia, time(11, 30), 60))
+        self.assertTrue(self.indice.libre(self.dia, time(11, 0), 60))
+        self.assertTrue(self.indice.libre(self.dia, "12:30", 30))
+
+    def test_otro_dia_no_interfiere(self):
+        self.assertTrue(self.indice.libre(self.dia + timedelta(days=1), time(10, 0), 60))
+
+    def test_inicios_libres_respeta_turnos(self):
+        libres = self.indice.inicios_libres(self.dia, 60)
+        self.assertEqual(libres[:3], ["11:00", "12:30", "13:00"])
+        self.assertNotIn("13:30", libres)
+        self.assertEqual(libres[-1], "19:00")
+
+
+class CitaSolapeTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.largo = Servicio.objects.create(nombre="Corte y barba", precio="25.00", duracion=60)
+        self.fecha = date.today() + timedelta(days=1)
+
+    def test_servicio_largo_no_puede_pisar_la_siguiente_cita(self):
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 30),
+        )
+        cita = Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.largo,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+        with self.assertRaises(ValidationError):
+            cita.full_clean()
+
+    def test_editar_una_cita_no_choca_consigo_misma(self):
+        cita = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.largo,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+        cita.notas = "Con navaja"
+        cita.save()
+
+    def test_cambiar_la_hora_despues_de_validar_vuelve_a_comprobar(self):
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(11, 0),
+        )
+        cita = Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+        cita.full_clean()
+        cita.hora = time(11, 0)
+        with self.assertRaises(ValidationError):
+            cita.save()
+        self.assertEqual(Cita.objects.filter(fecha=self.fecha).count(), 1)
+
+    def test_guardar_lo_recien_validado_no_repite_la_validacion(self):
+        cita = Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+        cita.full_clean()
+        cita.notas = "Con navaja"
+        with mock.patch.object(Cita, "clean") as clean:
+            cita.save()
+        clean.assert_not_called()
+
+
+class PlanConsultasCitaTests(TestCase):
+    """Las consultas calientes sobre Cita tienen que ir por índice, nunca recorrer la tabla."""
+
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.hoy = date.today()
+
+    def assertSinRecorridoCompleto(self, queryset):
+        plan = queryset.explain()
+        self.assertNotRegex(plan, r"SCAN gestion_citas_cita\b", plan)
+        self.assertRegex(plan, r"SEARCH gestion_citas_cita\b", plan)
+
+    def test_comprobacion_de_solape(self):
+        # Lo que lanza IndiceHuecos.cargar desde Cita.clean
+        self.assertSinRecorridoCompleto(
+            Cita.objects.filter(barbero=self.barbero, fecha__gte=self.hoy, fecha__lte=self.hoy)
+            .exclude(estado="CANCELADA").exclude(id=1)
+            .order_by().values_list("fecha", "hora", "servicio__duracion")
+        )
+
+    def test_solape_solo_lee_el_indice_parcial_de_activas(self):
+        plan = (
+            Cita.objects.filter(barbero=self.barbero, fecha__gte=self.hoy, fecha__lte=self.hoy)
+            .exclude(estado="CANCELADA").order_by().values_list("fecha", "hora", "servicio__duracion")
+        ).explain()
+        self.assertIn("COVERING INDEX cita_activa_barbero_fecha_idx", plan)
+
+    def test_caducidad_de_pendientes(self):
+        self.assertSinRecorridoCompleto(
+            Cita.objects.filter(fecha__lt=self.hoy, estado="PENDIENTE")
+        )
+        self.assertSinRecorridoCompleto(
+            Cita.objects.filter(fecha=self.hoy, hora__lt=time(12, 0), estado="PENDIENTE")
+        )
+
+    def test_citas_futuras(self):
+        self.assertSinRecorridoCompleto(
+            Cita.objects.filter(fecha__gte=self.hoy).order_by("fecha", "hora")
+        )
+
+    def test_mis_citas(self):
+        self.assertSinRecorridoCompleto(
+            Cita.objects.filter(usuario=self.usuario).order_by("-fecha", "-hora")
+        )
+
+
+class ValoracionesBarberoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+
+    def valorar(self, puntuacion):
+        return Resena.objects.create(
+            barbero=self.barbero, usuario=self.usuario, puntuacion=puntuacion, comentario="Bien"
+        )
+
+    def test_agregados_se_mantienen_al_crear_editar_y_borrar(self):
+        self.valorar(5)
+        resena = self.valorar(2)
+        self.barbero.refresh_from_db()
+        self.assertEqual((self.barbero.num_resenas, self.barbero.suma_puntuaciones), (2, 7))
+        self.assertEqual(self.barbero.promedio_estrellas(), 3.5)
+
+        resena = Resena.objects.get(id=resena.id)
+        resena.puntuacion = 4
+        resena.save()
+        self.barbero.refresh_from_db()
+        self.assertEqual(self.barbero.suma_puntuaciones, 9)
+
+        resena.delete()
+        self.barbero.refresh_from_db()
+        self.assertEqual((self.barbero.num_resenas, self.barbero.suma_puntuaciones), (1, 5))
+
+    def test_recalcular_corrige_desviaciones(self):
+        self.valorar(4)
+        Barbero.objects.update(num_resenas=0, suma_puntuaciones=0)
+        Barbero.recalcular_valoraciones()
+        self.barbero.refresh_from_db()
+        self.assertEqual((self.barbero.num_resenas, self.barbero.suma_puntuaciones), (1, 4))
+
+    def test_portada_con_consultas_constantes(self):
+        otro = Barbero.objects.create(nombre="Luis", apellido="Gómez", experiencia=3)
+        otro.especialidades.add(self.servicio)
+        for puntuacion in (1, 3, 5, 4):
+            self.valorar(puntuacion)
+
+        # servicios + barberos + especialidades, sin importar cuántas reseñas haya
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse("home"))
+        self.assertContains(respuesta, "(4 opiniones)")
+
+
+class PortadaCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+
+    def test_anonimo_recibe_pagina_cacheada_sin_consultas(self):
+        self.client.get(reverse("home"))
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(reverse("home"))
+        self.assertContains(respuesta, "Corte")
+
+        with self.assertNumQueries(0):
+            respuesta = self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=respuesta["ETag"])
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_cambios_en_servicio_invalidan_la_portada(self):
+        etag = self.client.get(reverse("home"))["ETag"]
+        with self.captureOnCommitCallbacks(execute=True):
+            Servicio.objects.create(nombre="Afeitado clásico", precio="12.00", duracion=20)
+
+        respuesta = self.client.get(reverse("home"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertContains(respuesta, "Afeitado clásico")
+
+    def test_usuario_autenticado_reutiliza_fragmentos(self):
+        self.client.get(reverse("home"))
+        self.client.force_login(self.usuario)
+        # sesión + usuario; servicios y barberos salen de los fragmentos
+        with self.assertNumQueries(2):
+            respuesta = self.client.get(reverse("home"))
+        self.assertContains(respuesta, self.usuario.first_name)
+
+
+class ResumenDiarioTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=2)
+
+    def reservar(self, hora, servicio=None):
+        return Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=servicio or self.servicio,
+            fecha=self.fecha, hora=hora,
+        )
+
+    def resumen(self):
+        fila = ResumenDiario.objects.get(barbero=self.barbero, fecha=self.fecha)
+        return fila.citas, fila.cancelaciones, fila.ingresos
+
+    def test_se_mantiene_al_guardar_cambiar_y_borrar(self):
+        cita = self.reservar(time(10, 0))
+        self.reservar(time(11, 0))
+        self.assertEqual(self.resumen(), (2, 0, Decimal("30.00")))
+
+        cita = Cita.objects.get(id=cita.id)
+        cita.estado = "CANCELADA"
+        cita.save()
+        self.assertEqual(self.resumen(), (2, 1, Decimal("15.00")))
+
+        cita.delete()
+        self.assertEqual(self.resumen(), (1, 0, Decimal("15.00")))
+
+    def test_cambio_de_estado_masivo(self):
+        self.reservar(time(10, 0))
+        self.reservar(time(12, 0))
+        actualizadas = resumenes.cambiar_estado(Cita.objects.filter(fecha=self.fecha), "CANCELADA")
+        self.assertEqual(actualizadas, 2)
+        self.assertEqual(self.resumen(), (2, 2, Decimal("0.00")))
+
+    def test_reconstruir_coincide_con_incremental(self):
+        largo = Servicio.objects.create(nombre="Barba", precio="9.50", duracion=30)
+        self.reservar(time(10, 0))
+        self.reservar(time(16, 0), largo)
+        incremental = self.resumen()
+        ResumenDiario.objects.all().delete()
+        resumenes.reconstruir()
+        self.assertEqual(self.resumen(), incremental)
+
+    def test_dashboard_filtra_y_no_recorre_citas(self):
+        staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        self.client.force_login(staff)
+        for hora in (time(10, 0), time(10, 30), time(11, 0)):
+            self.reservar(hora)
+
+        # sesión, usuario, gráfica, KPIs y tasas del historial (el filtro de barbero sale del catálogo)
+        self.client.get(reverse("dashboard_staff"))
+        with self.assertNumQueries(5):
+            respuesta = self.client.get(reverse("dashboard_staff"), {"barbero": self.barbero.id})
+        self.assertEqual(respuesta.context["total_citas"], 3)
+        self.assertEqual(respuesta.context["ingresos"], Decimal("45.00"))
+
+        respuesta = self.client.get(reverse("dashboard_staff"), {"hasta": date.today().isoformat()})
+        self.assertEqual(respuesta.context["total_citas"], 0)
+
+
+class ExpiracionCitasTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+
+    def crear(self, fecha, hora, estado="PENDIENTE"):
+        cita = Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=fecha, hora=hora, estado=estado,
+        )
+        Cita.objects.bulk_create([cita])
+
+    def test_expira_en_lotes_y_es_idempotente(self):
+        ayer = date.today() - timedelta(days=1)
+        for hora in ("10:00", "10:30", "11:00"):
+            self.crear(ayer, hora)
+        self.crear(ayer, "12:00", estado="CONFIRMADA")
+        self.crear(date.today() + timedelta(days=1), "10:00")
+
+        self.assertEqual(expirar_citas_vencidas(lote=2), 3)
+        self.assertEqual(expirar_citas_vencidas(lote=2), 0)
+        self.assertEqual(Cita.objects.filter(estado="CANCELADA").count(), 3)
+        self.assertEqual(Cita.objects.filter(estado="PENDIENTE").count(), 1)
+
+    def test_agenda_profesional_no_escribe(self):
+        staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        self.client.force_login(staff)
+        self.crear(date.today() - timedelta(days=1), "10:00")
+
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse("agenda_profesional"))
+        escrituras = [q["sql"] for q in consultas if not q["sql"].lstrip().startswith("SELECT")]
+        self.assertEqual(escrituras, [])
+
+
+class AgendaProfesionalTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        self.client.force_login(staff)
+        citas = []
+        for dia in range(10):
+            for hora in ("10:00", "10:30", "11:00"):
+                citas.append(Cita(
+                    usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+                    fecha=date.today() + timedelta(days=dia), hora=hora,
+                ))
+        Cita.objects.bulk_create(citas)
+
+    def test_ventana_semanal_con_consultas_constantes(self):
+        # sesión, usuario y citas con sus relaciones; el desplegable de barberos
+        # sale del catálogo en caché, que carga la primera petición
+        self.client.get(reverse("agenda_profesional"))
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse("agenda_profesional"))
+        self.assertEqual(len(respuesta.context["citas"]), 21)
+        self.assertContains(respuesta, self.usuario.email)
+
+    @mock.patch("gestion_citas.views.AGENDA_POR_PAGINA", 4)
+    def test_paginacion_por_cursor(self):
+        vistas = []
+        url = ""
+        while True:
+            respuesta = self.client.get(reverse("agenda_profesional") + url)
+            vistas.extend(c.id for c in respuesta.context["citas"])
+            url = respuesta.context["siguiente_pagina"]
+            if not url:
+                break
+        esperadas = Cita.objects.filter(
+            fecha__lt=date.today() + timedelta(days=7)
+        ).order_by("fecha", "hora", "id").values_list("id", flat=True)
+        self.assertEqual(vistas, list(esperadas))
+
+    def test_filtro_por_estado(self):
+        Cita.objects.filter(hora="10:00").update(estado="CONFIRMADA")
+        respuesta = self.client.get(reverse("agenda_profesional"), {"estado": "CONFIRMADA"})
+        self.assertEqual(len(respuesta.context["citas"]), 7)
+
+
+class MisCitasTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.client.force_login(self.usuario)
+
+    def crear_citas(self, dias):
+        Cita.objects.bulk_create([
+            Cita(
+                usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+                fecha=date.today() + timedelta(days=dia), hora="10:00",
+            )
+            for dia in dias
+        ])
+
+    def test_consultas_constantes_sin_importar_el_historial(self):
+        self.crear_citas([-3, -2, 1])
+        # sesión, usuario y, por cada lista, COUNT + página
+        with self.assertNumQueries(6):
+            self.client.get(reverse("mis_citas"))
+
+        self.crear_citas(range(-200, -3))
+        self.crear_citas(range(2, 60))
+        with self.assertNumQueries(6):
+            respuesta = self.client.get(reverse("mis_citas"))
+        self.assertEqual(respuesta.context["proximas"].paginator.count, 59)
+        self.assertEqual(respuesta.context["pasadas"].paginator.count, 199)
+
+    def test_separa_proximas_y_pasadas(self):
+        self.crear_citas([-1, 0, 5])
+        respuesta = self.client.get(reverse("mis_citas"))
+        proximas = [c.fecha for c in respuesta.context["proximas"]]
+        pasadas = [c.fecha for c in respuesta.context["pasadas"]]
+        self.assertEqual(proximas, [date.today(), date.today() + timedelta(days=5)])
+        self.assertEqual(pasadas, [date.today() - timedelta(days=1)])
+
+
+class ReservaAtomicaTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=3)
+
+    def test_reservar_desde_la_vista_comprueba_solapes_una_vez(self):
+        self.client.force_login(self.usuario)
+        datos = {
+            "barbero": self.barbero.id, "servicio": self.servicio.id,
+            "fecha": self.fecha.isoformat(), "hora": "10:00", "notas": "",
+        }
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post(reverse("reservar_cita"), datos)
+        self.assertRedirects(respuesta, reverse("mis_citas"), fetch_redirect_response=False)
+        solapes = [q for q in consultas if 'AS "servicio__duracion"' in q["sql"]]
+        self.assertEqual(len(solapes), 1)
+
+    def test_hueco_duplicado_devuelve_resultado_limpio(self):
+        Cita.objects.bulk_create([Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 0),
+        )])
+        cita = Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+        # Simulamos que la otra reserva entró después de nuestra comprobación
+        with mock.patch.object(Cita, "clean"):
+            resultado = reservas.reservar_cita(cita)
+        self.assertFalse(resultado.ok)
+        self.assertIn(reservas.MENSAJE_HUECO_OCUPADO, resultado.error.messages)
+
+    def test_reintenta_si_la_base_de_datos_esta_bloqueada(self):
+        from django.db import OperationalError
+
+        llamadas = []
+
+        def operacion():
+            llamadas.append(1)
+            if len(llamadas) < 3:
+                raise OperationalError("database is locked")
+            return "hecho"
+
+        with mock.patch("gestion_citas.reservas.time.sleep") as dormir:
+            self.assertEqual(reservas._en_transaccion(operacion), "hecho")
+        self.assertEqual(dormir.call_count, 2)
+
+
+class MigracionCitasDuplicadasTests(TestCase):
+    # 0004 crea cita_unica_barbero_fecha_hora; antes cancela los duplicados que ya hubiera
+    def test_se_queda_la_mas_antigua_y_cancela_las_demas(self):
+        usuario, servicio, barbero = crear_datos_basicos()
+        fecha = date.today() + timedelta(days=2)
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX cita_unica_barbero_fecha_hora")
+        primera, segunda, tercera, otra_hora = Cita.objects.bulk_create([
+            Cita(usuario=usuario, barbero=barbero, servicio=servicio, fecha=fecha, hora=hora, notas=notas)
+            for hora, notas in ((time(10, 0), ""), (time(10, 0), "Con navaja"), (time(10, 0), None), (time(11, 0), ""))
+        ])
+
+        migracion = import_module("gestion_citas.migrations.0004_cita_indices")
+        estado = MigrationExecutor(connection).loader.project_state(
+            ("gestion_citas", "0003_alter_barbero_id_alter_cita_id_alter_servicio_id_and_more")
+        )
+        migracion.cancelar_duplicadas(estado.apps, None)
+
+        estados = dict(Cita.objects.values_list("id", "estado"))
+        self.assertEqual(
+            [estados[cita.id] for cita in (primera, segunda, tercera, otra_hora)],
+            ["PENDIENTE", "CANCELADA", "CANCELADA", "PENDIENTE"],
+        )
+        segunda.refresh_from_db()
+        self.assertEqual(segunda.notas, f"Con navaja\nCancelada al migrar: duplicaba la cita {primera.id}.")
+        # Ya se puede crear la restricción
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE UNIQUE INDEX cita_unica_barbero_fecha_hora ON gestion_citas_cita (barbero_id, fecha, hora)"
+                " WHERE NOT (estado = 'CANCELADA')"
+            )
+
+
+class ReservaConcurrenteTests(TransactionTestCase):
+    """Varias peticiones a la vez sobre el mismo hueco: solo una puede ganar."""
+
+    PETICIONES = 8
+
+    def test_solo_una_reserva_gana(self):
+        usuario, servicio, barbero = crear_datos_basicos()
+        fecha = date.today() + timedelta(days=1)
+        salida = threading.Barrier(self.PETICIONES)
+        resultados = []
+
+        def reservar():
+            try:
+                cita = Cita(usuario=usuario, barbero=barbero, servicio=servicio, fecha=fecha, hora=time(17, 0))
+                salida.wait()
+                resultados.append(reservas.reservar_cita(cita, intentos=20, espera=0.01).ok)
+            finally:
+                connections.close_all()
+
+        hilos = [threading.Thread(target=reservar) for _ in range(self.PETICIONES)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(resultados), self.PETICIONES)
+        self.assertEqual(resultados.count(True), 1)
+        self.assertEqual(Cita.objects.filter(barbero=barbero, fecha=fecha).count(), 1)
+
+
+def foto_de_prueba(nombre="retrato.jpg", tamano=(640, 480)):
+    from io import BytesIO
+
+    from PIL import Image
+
+    salida = BytesIO()
+    Image.new("RGB", tamano, (180, 120, 60)).save(salida, "JPEG")
+    return SimpleUploadedFile(nombre, salida.getvalue(), content_type="image/jpeg")
+
+
+class MiniaturasBarberoTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+
+    def test_al_subir_foto_se_generan_las_variantes(self):
+        barbero = Barbero.objects.create(nombre="Juan", apellido="Pérez", experiencia=5, foto=foto_de_prueba())
+        barbero.refresh_from_db()
+
+        variantes = barbero.miniaturas["variantes"]
+        self.assertEqual(set(variantes), {"avatar", "avatar-2x", "tarjeta", "tarjeta-2x"})
+        tarjeta = variantes["tarjeta"]
+        self.assertIn(barbero.miniaturas["huella"], tarjeta["webp"])
+        self.assertTrue(tarjeta["webp"].startswith("barberos/"))
+        self.assertTrue(default_storage.exists(tarjeta["webp"]))
+        self.assertTrue(default_storage.exists(tarjeta["jpeg"]))
+
+        html = Template('{% load fotos %}{% foto_barbero b "tarjeta" clase="x" %}').render(Context({"b": barbero}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("tarjeta-2x.webp 2x", html)
+
+    def test_sin_derivados_usa_la_foto_original(self):
+        barbero = Barbero.objects.create(nombre="Juan", apellido="Pérez", experiencia=5, foto=foto_de_prueba())
+        Barbero.objects.update(miniaturas={})
+        barbero.refresh_from_db()
+        html = Template('{% load fotos %}{% foto_barbero b "avatar" %}').render(Context({"b": barbero}))
+        self.assertIn(barbero.foto.url, html)
+        self.assertNotIn("<picture>", html)
+
+    def test_comando_regenera_en_paralelo(self):
+        for nombre in ("Ana", "Luis"):
+            Barbero.objects.create(nombre=nombre, apellido="X", experiencia=1, foto=foto_de_prueba(f"{nombre}.jpg"))
+        Barbero.objects.update(miniaturas={})
+
+        # El catálogo de los formularios ya leído, con las miniaturas vacías
+        self.assertEqual([barbero.miniaturas for barbero in catalogo.actual().barberos], [{}, {}])
+
+        call_command("generar_miniaturas", procesos=2, stdout=open(os.devnull, "w"))
+        for barbero in Barbero.objects.all():
+            self.assertEqual(barbero.miniaturas["origen"], barbero.foto.name)
+        for barbero in catalogo.actual().barberos:
+            self.assertEqual(barbero.miniaturas["origen"], barbero.foto.name)
+
+
+class ConfiguracionSQLiteTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_opciones_por_defecto(self):
+        with mock.patch.dict(os.environ, {}, clear=True):
+            bases = configuracion_sqlite("/tmp/barberia.sqlite3")
+        opciones = bases["default"]["OPTIONS"]
+        self.assertEqual(list(bases), ["default"])
+        self.assertEqual(opciones["transaction_mode"], "IMMEDIATE")
+        self.assertEqual(opciones["timeout"], 20.0)
+        self.assertIn("PRAGMA journal_mode=WAL", opciones["init_command"])
+        self.assertIn("PRAGMA synchronous=NORMAL", opciones["init_command"])
+        self.assertEqual(bases["default"]["CONN_MAX_AGE"], 60)
+
+    def test_alias_de_lectura(self):
+        with mock.patch.dict(os.environ, {"BARBERIA_DB_LECTURA": "1", "BARBERIA_DB_WAL": "1"}):
+            bases = configuracion_sqlite("/tmp/barberia.sqlite3")
+        lectura = bases["lectura"]
+        self.assertEqual(lectura["NAME"], "file:/tmp/barberia.sqlite3?mode=ro")
+        self.assertTrue(lectura["OPTIONS"]["uri"])
+        # journal_mode escribe en la cabecera del fichero: no se puede desde una conexión de solo lectura
+        self.assertNotIn("journal_mode", lectura["OPTIONS"]["init_command"])
+        self.assertEqual(lectura["TEST"], {"MIRROR": "default"})
+
+    def test_pragmas_aplicados_a_la_conexion(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+    def test_router_solo_lectura(self):
+        router = RouterSoloLectura()
+        vistas = []
+
+        @solo_lectura
+        def vista():
+            vistas.append(router.db_for_read(Cita))
+            return router.db_for_write(Cita)
+
+        with mock.patch.dict(connections.settings, {"lectura": connections.settings["default"]}):
+            self.assertEqual(vista(), "default")
+            self.assertEqual(vistas, ["lectura"])
+            self.assertEqual(router.db_for_read(Cita), "default")
+
+
+class VistasAsincronasTests(TestCase):
+    # AsyncClient pasa por el manejador ASGI: cualquier acceso síncrono a la BD
+    # desde el bucle de eventos fallaría con SynchronousOnlyOperation
+    def setUp(self):
+        cache.clear()
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        self.manana = date.today() + timedelta(days=1)
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.manana, hora=time(10, 0),
+        )
+
+    def test_vistas_de_lectura_son_corrutinas(self):
+        for vista in (views.home, views.mis_citas, views.disponibilidad_barbero, views.agenda_profesional):
+            self.assertTrue(iscoroutinefunction(vista), vista.__name__)
+
+    async def test_portada_anonima(self):
+        respuesta = await self.async_client.get(reverse("home"))
+        self.assertContains(respuesta, "Juan")
+        respuesta = await self.async_client.get(reverse("home"), headers={"if-none-match": respuesta["ETag"]})
+        self.assertEqual(respuesta.status_code, 304)
+
+    async def test_mis_citas_y_disponibilidad(self):
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.get(reverse("mis_citas"))
+        self.assertEqual(respuesta.context["proximas"].paginator.count, 1)
+
+        fecha = self.manana.strftime("%Y-%m-%d")
+        url = reverse("disponibilidad_barbero", args=[self.barbero.id])
+        respuesta = await self.async_client.get(url, {"desde": fecha, "servicio": self.servicio.id})
+        self.assertEqual(respuesta.json()["dias"][fecha]["ocupadas"], ["10:00"])
+
+    async def test_agenda_staff(self):
+        await self.async_client.aforce_login(self.staff)
+        respuesta = await self.async_client.get(reverse("agenda_profesional"), {"barbero": self.barbero.id})
+        self.assertEqual(len(respuesta.context["citas"]), 1)
+
+        await self.async_client.aforce_login(self.usuario)
+        respuesta = await self.async_client.get(reverse("agenda_profesional"))
+        self.assertRedirects(respuesta, reverse("home"), fetch_redirect_response=False)
+
+
+class RendimientoMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+
+    def test_cabecera_y_linea_de_log(self):
+        self.client.force_login(self.usuario)
+        with self.assertLogs("gestion_citas.rendimiento", "INFO") as logs:
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get(reverse("home"))
+
+        self.assertIn("total;dur=", respuesta["Server-Timing"])
+        self.assertIn(f'desc="{len(consultas)} consultas"', respuesta["Server-Timing"])
+        registro = json.loads(logs.records[0].getMessage())
+        self.assertEqual(registro["vista"], "home")
+        self.assertEqual(registro["consultas"], len(consultas))
+        self.assertEqual(registro["bytes"], len(respuesta.content))
+        self.assertGreater(registro["plantilla_ms"], 0)
+
+    @override_settings(RENDIMIENTO_PRESUPUESTO_CONSULTAS={"mis_citas": 1})
+    def test_aviso_si_se_supera_el_presupuesto(self):
+        self.client.force_login(self.usuario)
+        with self.assertLogs("gestion_citas.rendimiento", "WARNING") as logs:
+            self.client.get(reverse("mis_citas"))
+        aviso = json.loads(logs.records[0].getMessage())
+        self.assertEqual(aviso["presupuesto"], 1)
+        self.assertGreater(aviso["consultas"], 1)
+
+    def test_vistas_dentro_del_presupuesto(self):
+        # Cada vista en frío (sin catálogo en caché ni capacidad precalculada) cabe en su presupuesto
+        staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        mes = date.today().strftime("%Y-%m")
+        peticiones = {
+            "home": (self.usuario, reverse("home"), {}),
+            "mis_citas": (self.usuario, reverse("mis_citas"), {}),
+            "disponibilidad_barbero": (
+                self.usuario, reverse("disponibilidad_barbero", args=[self.barbero.id]),
+                {"mes": mes, "servicio": self.servicio.id},
+            ),
+            "calendario_barbero": (self.usuario, reverse("calendario_barbero", args=[self.barbero.id]), {"mes": mes}),
+            "agenda_profesional": (staff, reverse("agenda_profesional"), {}),
+            "dashboard_staff": (staff, reverse("dashboard_staff"), {}),
+        }
+        self.assertEqual(set(peticiones), set(settings.RENDIMIENTO_PRESUPUESTO_CONSULTAS))
+        for vista, (usuario, ruta, parametros) in peticiones.items():
+            with self.subTest(vista=vista):
+                self.client.force_login(usuario)
+                cache.clear()
+                with self.assertNoLogs("gestion_citas.rendimiento", "WARNING"):
+                    respuesta = self.client.get(ruta, parametros)
+                self.assertEqual(respuesta.status_code, 200)
+
+    def test_resumen_de_logs(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".log", delete=False) as fichero:
+            for ms in range(1, 101):
+                fichero.write(json.dumps({"vista": "home", "ruta": "/", "ms": ms, "consultas": 3, "bd_ms": 1}) + "\n")
+            fichero.write("línea que no es JSON\n")
+        self.addCleanup(os.remove, fichero.name)
+
+        salida = StringIO()
+        call_command("resumen_rendimiento", fichero.name, stdout=salida)
+        fila = next(linea for linea in salida.getvalue().splitlines() if linea.startswith("home"))
+        self.assertEqual(fila.split()[1:5], ["100", "50.5", "96.0", "100.0"])
+
+
+class BenchmarkPeticionesTests(TestCase):
+    # Repite la ejecución guardada en bench/referencia.json: si alguna petición de la
+    # mezcla hace más consultas que entonces, la prueba falla
+    def setUp(self):
+        cache.clear()
+
+    def test_sin_regresiones_de_consultas(self):
+        with open(benchmark.REFERENCIA_POR_DEFECTO, encoding="utf-8") as fichero:
+            referencia = json.load(fichero)
+        parametros = referencia["parametros"]
+        sembrar(semilla=parametros["semilla"], **ESCALAS[parametros["escala"]])
+
+        # Ninguna petición de la mezcla, ni las del calentamiento, se pasa de su presupuesto
+        with self.assertNoLogs("gestion_citas.rendimiento", "WARNING"):
+            resultados = benchmark.reproducir(
+                benchmark.cargar_mezcla(), parametros["peticiones"], parametros["semilla"],
+                calentamiento=parametros["calentamiento"],
+            )
+        self.assertEqual(benchmark.comparar(resultados, referencia), [])
+        self.assertEqual(sum(datos["errores"] for datos in resultados["endpoints"].values()), 0)
+
+    def test_comparar_detecta_regresiones(self):
+        referencia = {"endpoints": {"mis_citas": {"errores": 0, "consultas_max": 6, "p95_ms": 10.0}}}
+        resultados = {"endpoints": {"mis_citas": {"errores": 0, "consultas_max": 9, "p95_ms": 30.0}}}
+        self.assertEqual(len(benchmark.comparar(resultados, referencia)), 1)
+        self.assertEqual(len(benchmark.comparar(resultados, referencia, tolerancia=0.5)), 2)
+
+
+class IntercambioCitasTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        self.fecha = date.today() + timedelta(days=2)
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.fecha, hora=time(10, 0),
+        )
+
+    def fila(self, hora, **cambios):
+        return {
+            "fecha": self.fecha.isoformat(), "hora": hora, "barbero_id": str(self.barbero.id),
+            "servicio_id": str(self.servicio.id), "usuario_email": self.usuario.email, **cambios,
+        }
+
+    def test_importar_valida_solapes_contra_bd_y_fichero(self):
+        filas = [
+            self.fila("10:00"),                          # choca con la cita ya guardada
+            self.fila("11:00"),
+            self.fila("11:00"),                          # choca con la fila anterior
+            self.fila("11:00", estado="CANCELADA"),      # las canceladas no ocupan hueco
+            self.fila("12:00", usuario_email="nadie@example.com"),
+            self.fila("25:00"),
+            self.fila("12:00", barbero_id="999"),
+        ]
+        # barberos y servicios; por lote, usuarios e índice del barbero; el primer lote
+        # además guarda (INSERT de citas y de su historial + reconstruir su día, con
+        # sus SAVEPOINT) y mira si ese día tiene capacidad calculada que actualizar
+        with self.assertNumQueries(16):
+            informe = intercambio.importar(filas, lote=4)
+
+        self.assertEqual(informe.creadas, 2)
+        self.assertEqual([fila for fila, _ in informe.errores], [1, 3, 6, 7, 5])
+        self.assertEqual(Cita.objects.filter(fecha=self.fecha).count(), 3)
+        resumen = ResumenDiario.objects.get(barbero=self.barbero, fecha=self.fecha)
+        self.assertEqual((resumen.citas, resumen.cancelaciones), (3, 1))
+
+    def test_simular_no_escribe(self):
+        informe = intercambio.importar([self.fila("11:00")], simular=True)
+        self.assertEqual((informe.validas, informe.creadas), (1, 0))
+        self.assertEqual(Cita.objects.count(), 1)
+
+    def test_exportar_en_streaming_e_importar_de_nuevo(self):
+        self.client.force_login(self.staff)
+        respuesta = self.client.get(reverse("exportar_citas"), {"formato": "csv"})
+        self.assertTrue(respuesta.streaming)
+        contenido = b"".join(respuesta.streaming_content).decode()
+        self.assertEqual(contenido.splitlines()[0].split(","), intercambio.COLUMNAS)
+
+        # El mismo fichero, otro día: se vuelve a importar tal cual
+        otro_dia = (self.fecha + timedelta(days=1)).isoformat()
+        fichero = SimpleUploadedFile("citas.csv", contenido.replace(self.fecha.isoformat(), otro_dia).encode())
+        respuesta = self.client.post(reverse("importar_citas"), {"fichero": fichero})
+        self.assertEqual(respuesta.json()["creadas"], 1)
+
+        respuesta = self.client.get(reverse("exportar_citas"), {"formato": "json"})
+        citas = json.loads(b"".join(respuesta.streaming_content))
+        self.assertEqual([cita["fecha"] for cita in citas], [self.fecha.isoformat(), otro_dia])
+
+    def test_solo_staff(self):
+        self.client.force_login(self.usuario)
+        self.assertRedirects(self.client.get(reverse("exportar_citas")), reverse("home"))
+        respuesta = self.client.post(reverse("importar_citas"))
+        self.assertEqual(respuesta.status_code, 403)
+
+
+class SerieCitaTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.client.force_login(self.usuario)
+        self.inicio = date.today() + timedelta(days=1)
+        # La tercera semana el barbero ya tiene a otro cliente a las 10:00
+        self.ocupada = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=self.inicio + timedelta(weeks=2), hora=time(10, 0),
+        )
+
+    def crear(self, semanas=4, cada=1):
+        serie = SerieCita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, hora=time(10, 0),
+            fecha_inicio=self.inicio, fecha_fin=self.inicio + timedelta(weeks=semanas - 1), cada_semanas=cada,
+        )
+        return series.crear_serie(serie)
+
+    def test_crear_salta_fechas_ocupadas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            resultado = self.crear()
+
+        self.assertTrue(resultado.ok)
+        self.assertEqual(len(resultado.creadas), 3)
+        self.assertEqual([fecha for fecha, _ in resultado.omitidas], [self.ocupada.fecha])
+        # Una sola lectura de la agenda y un solo INSERT para todas las citas
+        sql = [consulta["sql"] for consulta in consultas.captured_queries]
+        self.assertEqual(sum('FROM "gestion_citas_cita"' in q and q.startswith("SELECT") for q in sql), 2)
+        self.assertEqual(sum(q.startswith('INSERT INTO "gestion_citas_cita"') for q in sql), 1)
+        self.assertEqual(ResumenDiario.objects.filter(barbero=self.barbero).count(), 4)
+
+    def test_cancelar_desde_una_cita(self):
+        resultado = self.crear()
+        segunda = resultado.creadas[1]
+
+        self.assertEqual(series.cancelar_desde(segunda), 2)
+        estados = list(resultado.serie.citas.order_by("fecha").values_list("estado", flat=True))
+        self.assertEqual(estados, ["PENDIENTE", "CANCELADA", "CANCELADA"])
+        resultado.serie.refresh_from_db()
+        self.assertEqual(resultado.serie.fecha_fin, segunda.fecha - timedelta(days=1))
+        resumen = ResumenDiario.objects.get(barbero=self.barbero, fecha=segunda.fecha)
+        self.assertEqual((resumen.cancelaciones, resumen.ingresos), (1, 0))
+
+    def test_modificar_desde_es_todo_o_nada(self):
+        resultado = self.crear()
+        primera = resultado.creadas[0]
+
+        ultima = resultado.creadas[-1]
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=ultima.fecha, hora=time(11, 0),
+        )
+
+        # A las 10:45 la última semana choca con la cita de las 11:00: no cambia nada
+        conflictos = series.modificar_desde(primera, hora=time(10, 45))
+        self.assertEqual([fecha for fecha, _ in conflictos], [ultima.fecha])
+        self.assertFalse(resultado.serie.citas.exclude(hora=time(10, 0)).exists())
+
+        largo = Servicio.objects.create(nombre="Tinte", precio="25.00", duracion=60)
+        with CaptureQueriesContext(connection) as consultas:
+            conflictos = series.modificar_desde(primera, hora=time(12, 0), servicio=largo)
+        self.assertEqual(conflictos, [])
+        # Las citas de la serie, la agenda del barbero y un único UPDATE para todas
+        sql = [consulta["sql"] for consulta in consultas.captured_queries]
+        self.assertEqual(sum(q.startswith("SELECT") and 'FROM "gestion_citas_cita"' in q for q in sql), 3)
+        self.assertEqual(sum(q.startswith('UPDATE "gestion_citas_cita"') for q in sql), 1)
+        self.assertEqual(set(resultado.serie.citas.values_list("hora", "servicio")), {(time(12, 0), largo.id)})
+        resumen = ResumenDiario.objects.get(barbero=self.barbero, fecha=primera.fecha)
+        self.assertEqual(resumen.ingresos, Decimal("25.00"))
+
+    def test_vistas(self):
+        respuesta = self.client.post(reverse("reservar_serie"), {
+            "barbero": self.barbero.id, "servicio": self.servicio.id, "hora": "10:00",
+            "fecha_inicio": self.inicio.isoformat(), "cada_semanas": 2,
+            "fecha_fin": (self.inicio + timedelta(weeks=4)).isoformat(),
+        }, follow=True)
+        self.assertRedirects(respuesta, reverse("mis_citas"))
+        self.assertContains(respuesta, "2 citas reservadas")
+        self.assertContains(respuesta, "No se han podido reservar")
+        serie = SerieCita.objects.get()
+        self.assertContains(respuesta, reverse("cancelar_serie", args=[serie.citas.first().id]))
+
+        otro = Usuario.objects.create_user(email="otro@example.com", password="x", first_name="O", last_name="T")
+        self.client.force_login(otro)
+        cita = serie.citas.order_by("fecha").first()
+        self.assertEqual(self.client.post(reverse("cancelar_serie", args=[cita.id])).status_code, 404)
+
+        self.client.force_login(self.usuario)
+        self.assertContains(self.client.get(reverse("editar_serie", args=[cita.id])), 'name="hora"')
+        self.client.post(reverse("cancelar_serie", args=[cita.id]))
+        self.assertFalse(serie.citas.exclude(estado="CANCELADA").exists())
+
+    def test_no_admite_series_demasiado_largas(self):
+        from .forms import SerieCitaForm
+
+        form = SerieCitaForm({
+            "barbero": self.barbero.id, "servicio": self.servicio.id, "hora": "10:00",
+            "fecha_inicio": self.inicio.isoformat(), "cada_semanas": 1,
+            "fecha_fin": (self.inicio + timedelta(weeks=60)).isoformat(),
+        })
+        self.assertFalse(form.is_valid())
+
+
+class HorariosTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.client.force_login(self.usuario)
+        self.dia = date.today() + timedelta(days=7)
+        self.url = reverse("calendario_barbero", args=[self.barbero.id])
+
+    def turnos(self, fecha=None):
+        fecha = fecha or self.dia
+        return horarios.turnos_por_dia([self.barbero.id], fecha, fecha)[(self.barbero.id, fecha)]
+
+    def test_prioridad_de_horarios(self):
+        # Sin horario propio: los turnos de siempre
+        self.assertEqual(self.turnos(), [("10:00", "14:00"), ("16:00", "20:00")])
+
+        HorarioSemanal.objects.create(barbero=self.barbero, dia_semana=self.dia.weekday(), inicio=time(9), fin=time(15))
+        self.assertEqual(self.turnos(), [("09:00", "15:00")])
+        # Con horario propio, los días que no aparecen no trabaja
+        self.assertEqual(self.turnos(self.dia + timedelta(days=1)), [])
+
+        ExcepcionHorario.objects.create(barbero=self.barbero, fecha=self.dia, inicio=time(17), fin=time(19))
+        self.assertEqual(self.turnos(), [("17:00", "19:00")])
+
+        CierreTienda.objects.create(fecha=self.dia, motivo="Festivo")
+        self.assertEqual(self.turnos(), [])
+
+    def test_no_se_reserva_fuera_de_horario(self):
+        ExcepcionHorario.objects.create(barbero=self.barbero, fecha=self.dia, motivo="Vacaciones")
+        cita = Cita(usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.dia, hora=time(10))
+        with self.assertRaises(ValidationError):
+            cita.full_clean()
+
+        # Tiene que caber entera: 13:45 + 30 minutos se sale del turno de la mañana
+        cita.fecha = self.dia + timedelta(days=1)
+        cita.hora = time(13, 45)
+        with self.assertRaises(ValidationError):
+            cita.full_clean()
+
+    def test_calendario_sale_de_la_capacidad_precalculada(self):
+        parametros = {"desde": self.dia.isoformat(), "hasta": (self.dia + timedelta(days=2)).isoformat()}
+        presupuesto = settings.RENDIMIENTO_PRESUPUESTO_CONSULTAS["calendario_barbero"]
+
+        # Sin calcular: sesión, usuario, barbero, CapacidadDiaria, los tres del horario
+        # y las citas, todo en memoria; una lectura nunca escribe en la tabla
+        with self.assertNumQueries(8):
+            self.assertEqual(self.client.get(self.url, parametros).json()["completos"], [])
+        self.assertLessEqual(8, presupuesto)
+        self.assertFalse(CapacidadDiaria.objects.exists())
+
+        # Ya calculado (lo hace recalcular_capacidad): una sola consulta a CapacidadDiaria
+        call_command("recalcular_capacidad", dias=14, stdout=StringIO())
+        with self.assertNumQueries(4):
+            self.client.get(self.url, parametros)
+
+        # Llenamos el día: la capacidad se actualiza al guardar cada cita
+        Cita.objects.bulk_create([
+            Cita(usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.dia, hora=hora)
+            for hora in horarios.inicios(horarios.TURNOS)[1:]
+        ])
+        horarios.actualizar_ocupacion(self.dia, barbero_id=self.barbero.id)
+        ultima = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.dia, hora=time(10),
+        )
+        self.assertEqual(self.client.get(self.url, parametros).json()["completos"], [self.dia.isoformat()])
+
+        # Moverla de día libera el hueco en el día viejo
+        ultima.fecha = self.dia + timedelta(days=1)
+        ultima.save()
+        capacidad = CapacidadDiaria.objects.get(barbero=self.barbero, fecha=self.dia)
+        self.assertEqual((capacidad.ocupados, capacidad.huecos), (15, 16))
+
+        # Un cierre de la tienda se ve en el calendario en cuanto se guarda
+        CierreTienda.objects.create(fecha=self.dia + timedelta(days=2))
+        self.assertEqual(self.client.get(self.url, parametros).json()["cerrados"], [(self.dia + timedelta(days=2)).isoformat()])
+
+    def test_disponibilidad_usa_los_turnos_del_dia(self):
+        ExcepcionHorario.objects.create(barbero=self.barbero, fecha=self.dia, inicio=time(18), fin=time(19))
+        respuesta = self.client.get(
+            reverse("disponibilidad_barbero", args=[self.barbero.id]),
+            {"desde": self.dia.isoformat(), "hasta": self.dia.isoformat()},
+        )
+        self.assertEqual(respuesta.json()["dias"][self.dia.isoformat()]["libres"], ["18:00", "18:30"])
+
+
+class ListaEsperaTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=3)
+        self.cita = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(11, 0),
+        )
+        self.primera, self.segunda = [
+            Usuario.objects.create_user(email=f"espera{n}@example.com", password="x", first_name="E", last_name=str(n))
+            for n in (1, 2)
+        ]
+
+    def apuntar(self, usuario, desde=time(10, 0), hasta=time(12, 0)):
+        return EntradaEspera.objects.create(
+            usuario=usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, desde=desde, hasta=hasta,
+        )
+
+    def test_candidatas_por_indice_y_sin_ordenar_aparte(self):
+        plan = lista_espera.candidatas(self.barbero.id, self.fecha, time(11, 0)).explain()
+        self.assertIn("USING INDEX espera_candidatas_idx (barbero_id=? AND fecha=? AND estado=?)", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_candidatas_por_orden_de_llegada_dentro_de_su_franja(self):
+        tarde = self.apuntar(self.segunda, desde=time(16, 0), hasta=time(18, 0))
+        primera = self.apuntar(self.primera, desde=time(11, 0), hasta=time(12, 0))
+        segunda = self.apuntar(self.segunda, desde=time(9, 0), hasta=time(11, 0))
+        self.assertEqual(list(lista_espera.candidatas(self.barbero.id, self.fecha, time(11, 0))), [primera, segunda])
+        self.assertEqual(list(lista_espera.candidatas(self.barbero.id, self.fecha, time(17, 0))), [tarde])
+
+    def test_cancelar_sin_nadie_esperando_no_encola(self):
+        with self.assertNumQueries(1):
+            self.assertFalse(lista_espera.encolar(self.barbero.id, self.fecha, time(11, 0)))
+
+    def test_cancelar_encola_y_el_proceso_ofrece_el_hueco(self):
+        fuera_de_franja = self.apuntar(self.segunda, desde=time(16, 0), hasta=time(18, 0))
+        entrada = self.apuntar(self.primera)
+
+        self.client.force_login(self.usuario)
+        self.client.post(reverse("cancelar_cita", args=[self.cita.id]))
+        self.assertEqual(HuecoLiberado.objects.count(), 1)
+
+        self.assertEqual(lista_espera.procesar(), (0, 1, 1))
+        entrada.refresh_from_db()
+        self.assertEqual(entrada.estado, EntradaEspera.OFRECIDA)
+        self.assertEqual((entrada.cita.usuario, entrada.cita.hora), (self.primera, time(11, 0)))
+        self.assertTrue(MensajeSalida.objects.filter(usuario=self.primera, tipo="OFERTA").exists())
+        self.assertEqual(EntradaEspera.objects.get(id=fuera_de_franja.id).estado, EntradaEspera.ESPERANDO)
+        self.assertFalse(HuecoLiberado.objects.exists())
+
+        self.client.force_login(self.primera)
+        self.assertContains(self.client.get(reverse("lista_espera")), "Te hemos reservado las 11:00")
+        self.client.post(reverse("responder_espera", args=[entrada.id]), {"accion": "aceptar"})
+        entrada.refresh_from_db()
+        self.assertEqual(entrada.estado, EntradaEspera.ATENDIDA)
+
+    def test_la_oferta_caduca_y_pasa_al_siguiente(self):
+        primera = self.apuntar(self.primera)
+        segunda = self.apuntar(self.segunda)
+        self.cita.estado = "CANCELADA"
+        self.cita.save()
+        lista_espera.procesar()
+
+        # Pasado el plazo, la misma pasada cancela la oferta y se la da a la segunda
+        caducadas, _, asignados = lista_espera.procesar(ahora=timezone.now() + timedelta(minutes=31))
+        self.assertEqual((caducadas, asignados), (1, 1))
+        primera.refresh_from_db()
+        segunda.refresh_from_db()
+        self.assertEqual(primera.estado, EntradaEspera.CADUCADA)
+        self.assertEqual(primera.cita.estado, "CANCELADA")
+        self.assertEqual(segunda.estado, EntradaEspera.OFRECIDA)
+        self.assertEqual(segunda.cita.hora, time(11, 0))
+
+    @override_settings(LISTA_ESPERA_ASIGNAR=True)
+    def test_asignar_sin_confirmacion(self):
+        entrada = self.apuntar(self.primera)
+        self.cita.delete()
+        lista_espera.procesar()
+        entrada.refresh_from_db()
+        self.assertEqual(entrada.estado, EntradaEspera.ATENDIDA)
+        self.assertEqual(entrada.cita.estado, "PENDIENTE")
+
+
+class HistorialEstadoCitaTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=2)
+        self.cita = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(11, 0),
+        )
+
+    def cambios(self, cita):
+        return list(cita.historial.values_list("estado_anterior", "estado"))
+
+    def test_cancelar_cambia_el_estado_sin_borrar(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse("cancelar_cita", args=[self.cita.id]))
+
+        self.cita.refresh_from_db()
+        self.assertEqual(self.cita.estado, "CANCELADA")
+        self.assertEqual(self.cambios(self.cita), [(None, "PENDIENTE"), ("PENDIENTE", "CANCELADA")])
+        self.assertEqual(self.cita.historial.last().autor, self.usuario)
+        resumen = ResumenDiario.objects.get(barbero=self.barbero, fecha=self.fecha)
+        self.assertEqual((resumen.citas, resumen.cancelaciones, resumen.ingresos), (1, 1, Decimal("0.00")))
+
+        # El hueco queda libre y la cita desaparece de las próximas
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(11, 0),
+        )
+        self.assertEqual(len(self.client.get(reverse("mis_citas")).context["proximas"]), 1)
+
+        # Cancelar dos veces no deja otra fila
+        self.client.post(reverse("cancelar_cita", args=[self.cita.id]))
+        self.assertEqual(self.cita.historial.count(), 2)
+
+    def test_cambios_masivos_tambien_quedan_en_el_historial(self):
+        Cita.objects.bulk_create([Cita(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() - timedelta(days=1), hora=time(10, 0),
+        )])
+        vencida = Cita.objects.get(fecha__lt=date.today())
+        self.assertEqual(expirar_citas_vencidas(), 1)
+        self.assertEqual(self.cambios(vencida), [("PENDIENTE", "CANCELADA")])
+
+    def test_el_historial_no_se_modifica(self):
+        fila = self.cita.historial.get()
+        with self.assertRaises(ValueError):
+            fila.save()
+        with self.assertRaises(ValueError):
+            fila.delete()
+
+    def test_tasas_de_cancelacion_y_no_presentados(self):
+        otro = Barbero.objects.create(nombre="Luis", apellido="Gil", experiencia=2)
+        for hora, estado in ((time(12, 0), "NO_PRESENTADO"), (time(16, 0), "CANCELADA"), (time(17, 0), None)):
+            cita = Cita.objects.create(
+                usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=hora,
+            )
+            if estado:
+                cita = Cita.objects.get(id=cita.id)
+                cita.estado = estado
+                cita.save()
+        Cita.objects.create(usuario=self.usuario, barbero=otro, servicio=self.servicio, fecha=self.fecha, hora=hora)
+
+        with self.assertNumQueries(1):
+            tasas = historial.tasas(desde=self.fecha, hasta=self.fecha)
+        self.assertEqual(
+            [(fila["barbero__nombre"], fila["reservas"], fila["canceladas"], fila["no_presentadas"]) for fila in tasas],
+            [("Juan", 4, 1, 1), ("Luis", 1, 0, 0)],
+        )
+        self.assertEqual((tasas[0]["tasa_cancelacion"], tasas[0]["tasa_no_presentado"]), (25.0, 25.0))
+        self.assertEqual(historial.tasas(desde=self.fecha + timedelta(days=1)), [])
+
+        # El no presentado cuenta como cita, pero no como ingreso
+        resumen = ResumenDiario.objects.get(barbero=self.barbero, fecha=self.fecha)
+        self.assertEqual((resumen.citas, resumen.cancelaciones, resumen.ingresos), (4, 1, Decimal("30.00")))
+
+
+class CatalogoReservaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.client.force_login(self.usuario)
+
+    def test_formulario_de_reserva_sin_consultas_de_catalogo(self):
+        self.client.get(reverse("reservar_cita"))
+        # sesión, usuario y las horas posibles; barberos, servicios y precios salen de la caché
+        with self.assertNumQueries(3):
+            respuesta = self.client.get(reverse("reservar_cita"))
+        self.assertContains(respuesta, "Juan")
+        self.assertEqual(json.loads(respuesta.context["precios_json"]), {str(self.servicio.id): 15.0})
+
+    def test_los_cambios_de_barbero_y_servicio_invalidan_el_catalogo(self):
+        version = catalogo.actual().version
+        with self.captureOnCommitCallbacks(execute=True):
+            Servicio.objects.create(nombre="Afeitado", precio="12.00", duracion=20)
+        self.assertNotEqual(catalogo.actual().version, version)
+        self.assertIn("Afeitado - 12.00€", str(CitaForm()["servicio"]))
+
+        self.barbero.delete()
+        self.assertEqual(catalogo.actual().barberos, [])
+
+    def test_valida_contra_el_catalogo(self):
+        manana = date.today() + timedelta(days=1)
+        datos = {"barbero": self.barbero.id, "servicio": self.servicio.id, "fecha": manana, "hora": "10:00"}
+        catalogo.actual()
+        # El desplegable no consulta; solo queda la comprobación de la FK de servicio de Cita.full_clean
+        with self.assertNumQueries(1):
+            form = CitaForm({**datos, "barbero": 999})
+            self.assertFalse(form.is_valid())
+        self.assertIn("barbero", form.errors)
+
+        form = CitaForm(datos)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.cleaned_data["servicio"].duracion, 30)
+
+
+class BuscarUsuariosTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="S", last_name="T", is_staff=True
+        )
+        Usuario.objects.bulk_create([
+            Usuario(email=f"ana{n:02d}@example.com", first_name="Ana", last_name=str(n)) for n in range(25)
+        ])
+        self.client.force_login(self.staff)
+
+    def buscar(self, **params):
+        return self.client.get(reverse("buscar_usuarios"), params).json()
+
+    def test_prefijo_paginado_por_cursor(self):
+        primera = self.buscar(q="ANA")
+        self.assertEqual(len(primera["resultados"]), 20)
+        self.assertEqual(primera["resultados"][0]["etiqueta"], "Ana 0 (ana00@example.com)")
+        segunda = self.buscar(q="ana", despues=primera["siguiente"])
+        self.assertEqual([fila["email"] for fila in segunda["resultados"]], [f"ana{n}@example.com" for n in range(20, 25)])
+        self.assertIsNone(segunda["siguiente"])
+        self.assertEqual(self.buscar(q="cli")["resultados"][0]["id"], self.usuario.id)
+
+    def test_sin_distinguir_mayusculas_del_correo(self):
+        # normalize_email deja la parte local tal cual
+        marta = Usuario.objects.create_user(email="Marta.Lopez@X.com", password="x", first_name="Marta", last_name="L")
+        self.assertEqual(marta.email, "Marta.Lopez@x.com")
+        for q in ("marta", "MARTA.lo", "Marta.Lopez@x"):
+            self.assertEqual([fila["id"] for fila in self.buscar(q=q)["resultados"]], [marta.id])
+        # Con la última letra siguiente, U+D7FF daba un sustituto que SQLite no acepta
+        self.assertEqual(self.buscar(q="ana\ud7ff")["resultados"], [])
+
+    def test_el_cursor_no_pierde_correos_que_solo_cambian_en_mayusculas(self):
+        Usuario.objects.bulk_create([
+            Usuario(email=email, first_name="Bea", last_name="B") for email in ("bea@x.com", "BEA@x.com", "Bea@x.com")
+        ])
+        emails = [fila["email"] for fila in self.buscar(q="bea")["resultados"]]
+        self.assertEqual(sorted(emails), ["BEA@x.com", "Bea@x.com", "bea@x.com"])
+        for posicion, email in enumerate(emails):
+            resto = [fila["email"] for fila in self.buscar(q="bea", despues=email)["resultados"]]
+            self.assertEqual(resto, emails[posicion + 1:])
+
+    def test_rango_por_el_indice_del_correo_en_minusculas(self):
+        plan = (
+            Usuario.objects.alias(correo=Lower("email")).filter(correo__gte="ana", correo__lt="anb")
+            .order_by("correo", "email").explain()
+        )
+        self.assertIn("USING INDEX usuario_email_minusculas_idx", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_solo_staff(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse("buscar_usuarios"), {"q": "ana"}).status_code, 403)
+
+    def test_el_formulario_de_staff_no_pinta_todos_los_clientes(self):
+        cita = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() + timedelta(days=1), hora=time(10, 0),
+        )
+        respuesta = self.client.get(reverse("editar_cita_staff", args=[cita.id]))
+        self.assertContains(respuesta, "Ana García (cliente@example.com)")
+        self.assertNotContains(respuesta, "ana00@example.com")
+
+        form = CitaStaffForm({
+            "usuario": self.staff.id, "barbero": self.barbero.id, "servicio": self.servicio.id,
+            "fecha": cita.fecha, "hora": "10:00", "estado": "CONFIRMADA",
+        }, instance=cita)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().usuario, self.staff)
+
+
+@override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend")
+class NotificacionesTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=3)
+
+    def reservar(self, hora=time(11, 0)):
+        return Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=hora,
+        )
+
+    def cola(self):
+        return list(MensajeSalida.objects.order_by("id").values_list("tipo", "estado"))
+
+    def test_reservar_encola_confirmacion_y_recordatorio(self):
+        self.client.force_login(self.usuario)
+        self.client.post(reverse("reservar_cita"), {
+            "barbero": self.barbero.id, "servicio": self.servicio.id, "fecha": self.fecha.isoformat(), "hora": "11:00",
+        })
+        self.assertEqual(self.cola(), [("RESERVA", "PENDIENTE"), ("RECORDATORIO", "PENDIENTE")])
+        recordatorio = MensajeSalida.objects.get(tipo="RECORDATORIO")
+        self.assertEqual(timezone.localtime(recordatorio.enviar_desde).date(), self.fecha - timedelta(days=1))
+
+        # Solo sale lo que ya toca; el recordatorio espera a su hora
+        self.assertEqual(notificaciones.enviar_pendientes(), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.usuario.email])
+        self.assertIn(self.fecha.strftime("%d/%m/%Y"), mail.outbox[0].subject)
+        self.assertIn("Corte", mail.outbox[0].body)
+
+        self.assertEqual(notificaciones.enviar_pendientes(ahora=recordatorio.enviar_desde), (1, 0, 0))
+        self.assertTrue(mail.outbox[1].subject.startswith("Recordatorio"))
+
+    def test_si_la_cita_no_se_guarda_tampoco_el_correo(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.reservar()
+                raise RuntimeError
+        self.assertFalse(MensajeSalida.objects.exists())
+
+    def test_cambiar_reprograma_y_cancelar_descarta_el_recordatorio(self):
+        cita = Cita.objects.get(id=self.reservar().id)
+        cita.fecha += timedelta(days=1)
+        cita.save()
+        self.assertEqual(self.cola(), [
+            ("RESERVA", "PENDIENTE"), ("RECORDATORIO", "DESCARTADO"), ("CAMBIO", "PENDIENTE"), ("RECORDATORIO", "PENDIENTE"),
+        ])
+
+        self.client.force_login(self.usuario)
+        self.client.post(reverse("cancelar_cita", args=[cita.id]))
+        self.assertEqual(self.cola()[3:], [("RECORDATORIO", "DESCARTADO"), ("CANCELACION", "PENDIENTE")])
+
+        # Aunque se hubiera quedado pendiente, un recordatorio de una cita cancelada no sale
+        notificaciones.programar_recordatorios([cita])
+        self.assertEqual(notificaciones.enviar_pendientes(ahora=timezone.now() + timedelta(days=3)), (3, 0, 1))
+        self.assertEqual([correo.subject.split()[0] for correo in mail.outbox], ["Cita", "Tu", "Cita"])
+
+    def test_una_sola_conexion_por_pasada(self):
+        for hora in (time(10, 0), time(11, 0), time(12, 0)):
+            self.reservar(hora)
+        with mock.patch("gestion_citas.notificaciones.get_connection", wraps=notificaciones.get_connection) as conexion:
+            self.assertEqual(notificaciones.enviar_pendientes(), (3, 0, 0))
+        conexion.assert_called_once()
+
+    def test_los_fallos_se_reintentan_mas_tarde(self):
+        self.reservar()
+        ahora = timezone.now()
+        with mock.patch(
+            "django.core.mail.backends.locmem.EmailBackend.send_messages", side_effect=OSError("sin red")
+        ):
+            self.assertEqual(notificaciones.enviar_pendientes(ahora=ahora), (0, 1, 0))
+        mensaje = MensajeSalida.objects.get(tipo="RESERVA")
+        self.assertEqual((mensaje.estado, mensaje.intentos, mensaje.error), ("PENDIENTE", 1, "sin red"))
+        self.assertEqual(notificaciones.enviar_pendientes(ahora=ahora), (0, 0, 0))
+        self.assertEqual(notificaciones.enviar_pendientes(ahora=mensaje.enviar_desde), (1, 0, 0))
+
+    def test_pendientes_por_el_indice_parcial(self):
+        plan = notificaciones.pendientes(timezone.now(), 100).explain()
+        self.assertIn("mensaje_pendiente_idx", plan)
+
+    def test_registro_y_comando(self):
+        self.client.post(reverse("registro"), {
+            "email": "nuevo@example.com", "first_name": "Eva", "last_name": "Sol",
+            "password1": "clave-muy-segura-987", "password2": "clave-muy-segura-987",
+        })
+        salida = StringIO()
+        call_command("enviar_correos", stdout=salida)
+        self.assertIn("1 correos enviados", salida.getvalue())
+        self.assertEqual(mail.outbox[0].subject, "Bienvenido a la barbería")
+        self.assertIn("Eva", mail.outbox[0].body)
+
+
+class CalendarioIcsTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.fecha = date.today() + timedelta(days=2)
+        self.cita = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(10, 0),
+            notas="Degradado; sin cuchilla, por favor",
+        )
+        self.url = calendario.url("barbero", self.barbero.id)
+
+    def pedir(self, url=None, **cabeceras):
+        respuesta = self.client.get(url or self.url, **cabeceras)
+        contenido = b"".join(respuesta.streaming_content).decode() if respuesta.status_code == 200 else ""
+        return respuesta, contenido
+
+    def test_sin_token_valido_no_hay_calendario(self):
+        token = calendario.token("barbero", self.barbero.id)
+        self.assertEqual(self.client.get(self.url.replace(token, "x" * 32)).status_code, 404)
+        # El token de un barbero no vale para otro ni para el calendario de un cliente
+        self.assertEqual(self.client.get(reverse("ics_barbero", args=[self.barbero.id + 1, token])).status_code, 404)
+        self.assertEqual(self.client.get(reverse("ics_cliente", args=[self.barbero.id, token])).status_code, 404)
+
+    def test_calendario_del_barbero(self):
+        cancelada = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(12, 0),
+            estado="CANCELADA",
+        )
+        fuera = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() - timedelta(days=calendario.DIAS_ATRAS + 1), hora=time(10, 0), estado="CONFIRMADA",
+        )
+        respuesta, contenido = self.pedir()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(respuesta["Content-Type"].startswith("text/calendar"))
+        self.assertTrue(respuesta["ETag"])
+        self.assertTrue(contenido.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertTrue(contenido.endswith("END:VCALENDAR\r\n"))
+        self.assertIn("X-WR-CALNAME:Agenda de Juan Pérez", contenido)
+        self.assertIn(f"UID:cita-{self.cita.id}@testserver", contenido)
+        self.assertIn("SUMMARY:Corte - Ana García", contenido)
+        self.assertIn("DESCRIPTION:Degradado\\; sin cuchilla\\, por favor", contenido)
+        # Las canceladas van como CANCELLED para que el móvil las quite
+        self.assertIn(f"UID:cita-{cancelada.id}@", contenido)
+        self.assertIn("STATUS:CANCELLED", contenido)
+        self.assertNotIn(f"UID:cita-{fuera.id}@", contenido)
+
+        inicio = timezone.make_aware(timezone.datetime.combine(self.fecha, time(10, 0)))
+        self.assertIn(f"DTSTART:{calendario._utc(inicio)}", contenido)
+        self.assertIn(f"DTEND:{calendario._utc(inicio + timedelta(minutes=30))}", contenido)
+
+    def test_calendario_del_cliente_solo_tiene_sus_citas(self):
+        otro = Usuario.objects.create_user(email="otro@example.com", password="x", first_name="Luis", last_name="Ruiz")
+        ajena = Cita.objects.create(
+            usuario=otro, barbero=self.barbero, servicio=self.servicio, fecha=self.fecha, hora=time(11, 0),
+        )
+        respuesta, contenido = self.pedir(calendario.url("cliente", self.usuario.id))
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn("SUMMARY:Corte con Juan Pérez", contenido)
+        self.assertIn(f"UID:cita-{self.cita.id}@", contenido)
+        self.assertNotIn(f"UID:cita-{ajena.id}@", contenido)
+
+    def test_sin_cambios_304_con_una_consulta(self):
+        etag = self.pedir()[0]["ETag"]
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertEqual(respuesta["ETag"], etag)
+
+    def test_el_etag_cambia_con_cualquier_cambio_de_sus_citas(self):
+        etags = [self.pedir()[0]["ETag"]]
+
+        cita = Cita.objects.get(id=self.cita.id)
+        cita.hora = time(11, 0)
+        cita.save()
+        etags.append(self.pedir()[0]["ETag"])
+
+        # Los update() masivos también cuentan
+        resumenes.cambiar_estado(Cita.objects.filter(id=cita.id), "CONFIRMADA")
+        etags.append(self.pedir()[0]["ETag"])
+
+        Cita.objects.filter(id=cita.id).delete()
+        etags.append(self.pedir()[0]["ETag"])
+        self.assertEqual(len(set(etags)), 4)
+
+        # Las citas de otro barbero no
+        otro = Barbero.objects.create(nombre="Pedro", apellido="Gil", experiencia=2)
+        etag = self.pedir()[0]["ETag"]
+        Cita.objects.create(usuario=self.usuario, barbero=otro, servicio=self.servicio, fecha=self.fecha, hora=time(10, 0))
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_el_etag_cambia_si_cambia_el_catalogo(self):
+        # El resumen de cada evento lleva el nombre del servicio y del barbero
+        etag = self.pedir()[0]["ETag"]
+        version = catalogo.version()
+        Servicio.objects.filter(id=self.servicio.id).update(nombre="Corte clásico")
+        catalogo.invalidar_catalogo()
+        self.assertNotEqual(catalogo.version(), version)
+        respuesta, contenido = self.pedir()
+        self.assertNotEqual(respuesta["ETag"], etag)
+        self.assertIn("SUMMARY:Corte clásico - Ana García", contenido)
+
+    def test_la_version_sale_del_indice(self):
+        desde, hasta = calendario.ventana()
+        for tipo, propietario, indice in (
+            ("barbero", self.barbero.id, "cita_barbero_fecha_hora_idx"),
+            ("cliente", self.usuario.id, "cita_usuario_fecha_hora_idx"),
+        ):
+            # Las mismas columnas que lee version() con su aggregate(Max, Count)
+            plan = calendario.citas(tipo, propietario, desde, hasta).order_by().values_list("actualizado", "id").explain()
+            self.assertIn(f"COVERING INDEX {indice}", plan)
+
+    def test_lineas_largas_se_doblan_a_75_bytes(self):
+        linea = "DESCRIPTION:" + "ñ" * 100
+        doblada = calendario._linea(linea)
+        trozos = doblada[:-2].split("\r\n")
+        self.assertTrue(all(len(trozo.encode()) <= 75 for trozo in trozos))
+        self.assertTrue(all(trozo.startswith(" ") for trozo in trozos[1:]))
+        self.assertEqual("".join(trozo[1:] if n else trozo for n, trozo in enumerate(trozos)), linea)
+
+
+class BusquedaTextoTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.staff = Usuario.objects.create_user(
+            email="staff@example.com", password="x", first_name="Staff", last_name="Tienda", is_staff=True,
+        )
+
+    def ids_clientes(self, texto):
+        return [usuario.id for usuario in busqueda.clientes(busqueda.consulta_fts(texto))]
+
+    def ids_citas(self, texto):
+        return set(Cita.objects.filter(busqueda.filtro_citas(busqueda.consulta_fts(texto))).values_list("id", flat=True))
+
+    def assertIndicesIntegros(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO busqueda_usuario (busqueda_usuario) VALUES ('integrity-check')")
+            cursor.execute("INSERT INTO busqueda_cita (busqueda_cita) VALUES ('integrity-check')")
+
+    def triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'busqueda_%'")
+            return dict(cursor.fetchall())
+
+    def test_los_triggers_estan_en_su_tabla(self):
+        # Si una migración rehace la tabla sin llamar a busqueda.reconstruir(), esto falla
+        esperados = {nombre: "gestion_citas_usuario" for nombre in busqueda.TRIGGERS_USUARIO}
+        esperados |= {nombre: "gestion_citas_cita" for nombre in busqueda.TRIGGERS_CITA}
+        self.assertEqual(self.triggers(), esperados)
+
+    def test_reconstruir_crea_los_mismos_triggers_que_las_migraciones(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'busqueda_%'")
+            migrados = dict(cursor.fetchall())
+        self.assertEqual(migrados, busqueda.TRIGGERS_USUARIO | busqueda.TRIGGERS_CITA)
+
+    def test_reconstruir_recupera_triggers_e_indices(self):
+        esperados = self.triggers()
+        # Lo que deja una reconstrucción de las tablas de Django en SQLite
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER busqueda_usuario_alta")
+            cursor.execute("DROP TRIGGER busqueda_cita_alta")
+        nueva = Usuario.objects.create_user(email="zoe@example.com", password="x", first_name="Zoe", last_name="Ibarra")
+        cita = Cita.objects.create(
+            usuario=nueva, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() + timedelta(days=1), hora=time(10, 0), notas="Pelo rizado",
+        )
+        sin_notas = Cita.objects.create(
+            usuario=nueva, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() + timedelta(days=1), hora=time(11, 0),
+        )
+        self.assertEqual(self.ids_clientes("ibarra"), [])
+
+        busqueda.reconstruir()
+        self.assertEqual(self.triggers(), esperados)
+        self.assertEqual(self.ids_clientes("ibarra"), [nueva.id])
+        self.assertEqual(self.ids_citas("rizado"), {cita.id})
+        # Las citas sin notas siguen fuera del índice: ponerles notas después no choca
+        Cita.objects.filter(id=sin_notas.id).update(notas="Barba larga")
+        self.assertEqual(self.ids_citas("barba"), {sin_notas.id})
+        self.assertIndicesIntegros()
+
+    def test_prefijos_sin_tildes_y_todas_las_palabras(self):
+        self.assertEqual(self.ids_clientes("garcia"), [self.usuario.id])
+        self.assertEqual(self.ids_clientes("GARC"), [self.usuario.id])
+        self.assertEqual(self.ids_clientes("ana garc"), [self.usuario.id])
+        self.assertEqual(self.ids_clientes("ana tienda"), [])
+        self.assertEqual(self.ids_clientes("cliente@exa"), [self.usuario.id])
+
+    def test_lo_que_escribe_el_usuario_no_es_sintaxis_fts(self):
+        self.assertIsNone(busqueda.consulta_fts("a * -"))
+        self.assertEqual(busqueda.consulta_fts('ana" OR (x* NEAR'), '"ana"* "or"* "near"*')
+        self.assertEqual(self.ids_clientes('ana" OR garcía'), [])
+
+    def test_los_triggers_siguen_altas_cambios_y_bajas(self):
+        otro = Usuario.objects.create_user(email="luis@example.com", password="x", first_name="Luis", last_name="Ruiz")
+        self.assertEqual(self.ids_clientes("ruiz"), [otro.id])
+
+        # El login cambia last_login, pero no lo indexado
+        Usuario.objects.filter(id=otro.id).update(last_login=timezone.now())
+        Usuario.objects.filter(id=otro.id).update(last_name="Navarro")
+        self.assertEqual(self.ids_clientes("ruiz"), [])
+        self.assertEqual(self.ids_clientes("navarro"), [otro.id])
+
+        # bulk_create no pasa por señales, pero sí por los triggers
+        Usuario.objects.bulk_create([
+            Usuario(email=f"masivo{n}@example.com", first_name="Masivo", last_name="Bulk") for n in range(3)
+        ])
+        self.assertEqual(len(self.ids_clientes("masivo")), 3)
+
+        otro.delete()
+        self.assertEqual(self.ids_clientes("navarro"), [])
+        self.assertIndicesIntegros()
+
+    def test_citas_por_notas_o_por_cliente(self):
+        fecha = date.today() + timedelta(days=1)
+        con_notas = Cita.objects.create(
+            usuario=self.staff, barbero=self.barbero, servicio=self.servicio, fecha=fecha, hora=time(10, 0),
+            notas="Alergia al tinte",
+        )
+        sin_notas = Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio, fecha=fecha, hora=time(11, 0),
+        )
+        self.assertEqual(self.ids_citas("alergia"), {con_notas.id})
+        self.assertEqual(self.ids_citas("garcia"), {sin_notas.id})
+
+        Cita.objects.filter(id__in=[con_notas.id, sin_notas.id]).update(notas="Barba larga")
+        self.assertEqual(self.ids_citas("alergia"), set())
+        self.assertEqual(self.ids_citas("barba"), {con_notas.id, sin_notas.id})
+        Cita.objects.filter(id=sin_notas.id).update(notas=None)
+        self.assertEqual(self.ids_citas("barba"), {con_notas.id})
+        self.assertIndicesIntegros()
+
+    def test_clientes_por_relevancia(self):
+        # "ana" en el nombre y en el correo pesa más que un prefijo suelto del correo
+        anabel = Usuario.objects.create_user(email="anabel@example.com", password="x", first_name="Isabel", last_name="Gil")
+        ana = Usuario.objects.create_user(email="ana@example.com", password="x", first_name="Ana", last_name="Sol")
+        resultado = self.ids_clientes("ana")
+        self.assertEqual(resultado[0], ana.id)
+        self.assertEqual(set(resultado), {ana.id, anabel.id, self.usuario.id})
+
+    def test_api_solo_para_el_staff(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse("buscar_staff"), {"q": "garcia"}).status_code, 403)
+
+        Cita.objects.create(
+            usuario=self.usuario, barbero=self.barbero, servicio=self.servicio,
+            fecha=date.today() + timedelta(days=1), hora=time(10, 0),
+        )
+        self.client.force_login(self.staff)
+        with self.assertNumQueries(4):  # sesión, usuario, clientes y citas
+            datos = self.client.get(reverse("buscar_staff"), {"q": "garcia"}).json()
+        self.assertEqual([cliente["id"] for cliente in datos["clientes"]], [self.usuario.id])
+        self.assertEqual(datos["clientes"][0]["etiqueta"], str(self.usuario))
+        self.assertEqual([(cita["cliente"], cita["barbero"]) for cita in datos["citas"]], [(str(self.usuario), "Juan")])
+        self.assertEqual(self.client.get(reverse("buscar_staff"), {"q": "*"}).json(), {"clientes": [], "citas": []})
+
+    def test_el_admin_busca_por_el_indice(self):
+        self.staff.is_superuser = True
+        self.staff.save()
+        self.client.force_login(self.staff)
+        for url in ("admin:gestion_citas_usuario_changelist", "admin:gestion_citas_cita_changelist"):
+            with CaptureQueriesContext(connection) as consultas:
+                respuesta = self.client.get(reverse(url), {"q": "garcia"})
+            self.assertEqual(respuesta.status_code, 200)
+            sql = " ".join(consulta["sql"] for consulta in consultas.captured_queries)
+            self.assertIn("MATCH", sql)
+            self.assertNotIn("LIKE", sql)
+        respuesta = self.client.get(reverse("admin:gestion_citas_usuario_changelist"), {"q": "garcia"})
+        self.assertContains(respuesta, "cliente@example.com")
+
+
+class AdminChangelistTests(TestCase):
+    def setUp(self):
+        self.usuario, self.servicio, self.barbero = crear_datos_basicos()
+        self.admin = Usuario.objects.create_superuser(
+            email="admin@example.com", password="x", first_name="Admin", last_name="Tienda",
+        )
+        self.client.force_login(self.admin)
+        self.fecha = date.today() + timedelta(days=1)
+        self.filas = 0
+
+    def anadir_filas(self, cuantas):
+        # Cada fila con su propio cliente, para que un N+1 se note
+        for _ in range(cuantas):
+            cliente = Usuario.objects.create_user(
+                email=f"c{self.filas}@example.com", password="x", first_name="Cliente", last_name=str(self.filas),
+            )
+            dia, hueco = divmod(self.filas, len(HORARIOS_DISPONIBLES))
+            Cita.objects.create(
+                usuario=cliente, barbero=self.barbero, servicio=self.servicio,
+                fecha=self.fecha + timedelta(days=dia), hora=HORARIOS_DISPONIBLES[hueco],
+            )
+            Resena.objects.create(barbero=self.barbero, usuario=cliente, puntuacion=5, comentario="Bien")
+            self.filas += 1
+
+    def consultas(self, url, **parametros):
+        with CaptureQueriesContext(connection) as capturadas:
+            respuesta = self.client.get(reverse(url), parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        return [consulta["sql"] for consulta in capturadas.captured_queries]
+
+    def test_las_consultas_no_crecen_con_las_filas(self):
+        for url in (
+            "admin:gestion_citas_cita_changelist",
+            "admin:gestion_citas_usuario_changelist",
+            "admin:gestion_citas_resena_changelist",
+            "admin:gestion_citas_mensajesalida_changelist",
+            "admin:gestion_citas_entradaespera_changelist",
+        ):
+            with self.subTest(url=url):
+                self.anadir_filas(2)
+                pocas = len(self.consultas(url))
+                self.anadir_filas(4)
+                self.assertEqual(len(self.consultas(url)), pocas)
+
+    def test_cita_changelist_de_una_consulta_con_joins(self):
+        self.anadir_filas(3)
+        sql = self.consultas("admin:gestion_citas_cita_changelist", fecha__year=self.fecha.year)
+        listado = [consulta for consulta in sql if consulta.startswith('SELECT "gestion_citas_cita"."id"')]
+        self.assertEqual(len(listado), 1)
+        self.assertIn("INNER JOIN", listado[0])
+
+    def test_sin_count_de_la_tabla_entera(self):
+        self.anadir_filas(3)
+        with mock.patch("gestion_citas.admin.UMBRAL_ESTIMACION", 1):
+            sql = self.consultas("admin:gestion_citas_cita_changelist")
+            self.assertFalse([consulta for consulta in sql if "COUNT(" in consulta], sql)
+            self.assertTrue([consulta for consulta in sql if 'MAX("gestion_citas_cita"."id")' in consulta])
+
+            # Con filtros se cuenta, pero con tope
+            sql = self.consultas("admin:gestion_citas_cita_changelist", estado__exact="PENDIENTE")
+            cuentas = [consulta for consulta in sql if "COUNT(" in consulta]
+            self.assertEqual(len(cuentas), 1)
+            self.assertIn("LIMIT 10000", cuentas[0])
+
+    def test_paginas_de_mas_por_ids_borrados(self):
+        # MAX(id) cuenta las filas borradas: la última página estimada no tiene nada
+        self.anadir_filas(6)
+        Cita.objects.filter(id__in=Cita.objects.order_by("id").values("id")[:4]).delete()
+        restantes = set(Cita.objects.values_list("id", flat=True))
+        with mock.patch("gestion_citas.admin.UMBRAL_ESTIMACION", 1), \
+                mock.patch.object(admin.site._registry[Cita], "list_per_page", 2):
+            respuesta = self.client.get(reverse("admin:gestion_citas_cita_changelist"), {"p": 3})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual({cita.id for cita in respuesta.context["cl"].result_list}, restantes)
+
+    def test_tablas_grandes_con_la_misma_paginacion(self):
+        from .admin import TablaGrande
+
+        for modelo in (Usuario, Cita, Resena, MensajeSalida):
+            with self.subTest(modelo=modelo.__name__):
+                self.assertIsInstance(admin.site._registry[modelo], TablaGrande)
+                self.assertFalse(admin.site._registry[modelo].show_full_result_count)
+
+    def test_formularios_sin_desplegables_de_clientes(self):
+        self.anadir_filas(5)
+        cita = Cita.objects.first()
+        for url, argumentos in (
+            ("admin:gestion_citas_cita_add", []),
+            ("admin:gestion_citas_cita_change", [cita.id]),
+            ("admin:gestion_citas_resena_add", []),
+        ):
+            with self.subTest(url=url):
+                respuesta = self.client.get(reverse(url, args=argumentos))
+                self.assertContains(respuesta, "admin-autocomplete")
+                # Solo el cliente elegido, si lo hay; nunca la lista entera
+                self.assertNotContains(respuesta, "c4@example.com")
@@ -15,6 +15,15 @@ urlpatterns = [
 
     path('mis-citas/', views.mis_citas, name='mis_citas'),
     path('reservar/', views.reservar_cita, name='reservar_cita'),
+    path('reservar/serie/', views.reservar_serie, name='reservar_serie'),
+    path('serie/<int:cita_id>/editar/', views.editar_serie, name='editar_serie'),
+    path('serie/<int:cita_id>/cancelar/', views.cancelar_serie, name='cancelar_serie'),
+    path('lista-espera/', views.lista_espera_cliente, name='lista_espera'),
+    path('lista-espera/<int:entrada_id>/responder/', views.responder_espera, name='responder_espera'),
+    path('api/disponibilidad/<int:barbero_id>/', views.disponibilidad_barbero, name='disponibilidad_barbero'),
+    path('api/calendario/<int:barbero_id>/', views.calendario_barbero, name='calendario_barbero'),
+    path('api/usuarios/', views.buscar_usuarios, name='buscar_usuarios'),
+    path('api/buscar/', views.buscar_staff, name='buscar_staff'),
     path('editar/<int:cita_id>/', views.editar_cita, name='editar_cita'),
     path('cancelar/<int:cita_id>/', views.cancelar_cita, name='cancelar_cita'),
     path('agenda-staff/', views.agenda_profesional, name='agenda_profesional'),
@@ -22,6 +31,10 @@ urlpatterns = [
     path('dashboard/', views.dashboard_staff, name='dashboard_staff'),
     path('valorar/<int:barbero_id>/', views.dejar_resena, name='dejar_resena'),
     path('agenda-staff/editar/<int:cita_id>/', views.editar_cita_staff, name='editar_cita_staff'),
+    path('agenda-staff/exportar/', views.exportar_citas, name='exportar_citas'),
+    path('agenda-staff/importar/', views.importar_citas, name='importar_citas'),
+    path('calendario/barbero/<int:propietario_id>/<str:token>.ics', views.calendario_ics, {'tipo': 'barbero'}, name='ics_barbero'),
+    path('calendario/cliente/<int:propietario_id>/<str:token>.ics', views.calendario_ics, {'tipo': 'cliente'}, name='ics_cliente'),
 ]
 
 handler404 = 'gestion_citas.views.error_404'
\ No newline at end of file
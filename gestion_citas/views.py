@@ -1,20 +1,52 @@
 from collections import defaultdict
-from django.forms import ValidationError
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
 from django.contrib.auth import login
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .forms import EditarPerfilForm, RegistroUsuarioForm, CitaForm, ResenaForm,CitaStaffForm
-from .models import Servicio, Barbero, Cita, Resena
-from datetime import date, datetime
-from django.db.models import Count
+from .forms import EditarPerfilForm, RegistroUsuarioForm, CitaForm, ResenaForm,CitaStaffForm, FiltroDashboardForm, FiltroAgendaForm, SerieCitaForm, CambioSerieForm, EntradaEsperaForm
+from .models import Servicio, Barbero, Cita, Resena, ResumenDiario, EntradaEspera, MensajeSalida, Usuario
+from .huecos import PASO_MINUTOS, IndiceHuecos
+from .cache_portada import guardar_pagina_anonima, pagina_anonima
+from . import busqueda, calendario, catalogo, historial, horarios, intercambio, lista_espera, notificaciones, reservas, series
+from barber_project.routers import solo_lectura
+from datetime import date, datetime, timedelta
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce, Lower
+from decimal import Decimal
+from django.core.paginator import Paginator
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.views.decorators.http import require_GET, require_POST
+import csv
+import hashlib
+import io
 import json
-
-
-def home(request):
+import string
+
+# Máximo de días que se pueden pedir de una vez a la API de disponibilidad
+MAX_DIAS_DISPONIBILIDAD = 62
+
+
+@solo_lectura
+async def home(request):
+    # Los anónimos sin mensajes pendientes ven siempre la misma página: se sirve entera
+    # desde caché (o como 304) sin tocar la base de datos
+    usuario = await _usuario(request)
+    anonimo = not usuario.is_authenticated and not await sync_to_async(_hay_mensajes)(request)
+    if anonimo:
+        cacheada = pagina_anonima()
+        if cacheada:
+            contenido, etag = cacheada
+            respuesta = get_conditional_response(request, etag=etag) or HttpResponse(contenido)
+            return _cabeceras_portada(respuesta, etag)
+
+    # Los querysets son perezosos: si los fragmentos {% cache %} están guardados, no se ejecutan
     servicios = Servicio.objects.all()
-    barberos = Barbero.objects.all()
-    return render(
+    # Las valoraciones vienen precalculadas en Barbero; solo falta traer las especialidades de golpe
+    barberos = Barbero.objects.prefetch_related("especialidades")
+    respuesta = await arender(
         request,
         "gestion_citas/public/home.html",
         {
@@ -22,13 +54,40 @@ def home(request):
             "barberos": barberos,
         },
     )
+    if anonimo:
+        _cabeceras_portada(respuesta, guardar_pagina_anonima(respuesta.content))
+    return respuesta
+
+
+# Las plantillas y {% cache %} son síncronos: se pintan en el hilo de la BD
+arender = sync_to_async(render)
+
+
+async def _usuario(request):
+    # Deja el usuario ya cargado en request.user para que la plantilla no lo vuelva a pedir
+    request.user = await request.auser()
+    return request.user
+
+
+def _hay_mensajes(request):
+    return bool(len(messages.get_messages(request)))
+
+
+def _cabeceras_portada(respuesta, etag):
+    respuesta["ETag"] = etag
+    patch_cache_control(respuesta, no_cache=True)
+    patch_vary_headers(respuesta, ["Cookie"])
+    return respuesta
 
 
 def registro(request):
     if request.method == "POST":
         form = RegistroUsuarioForm(request.POST)
         if form.is_valid():
-            usuario = form.save()
+            # El correo de bienvenida se encola con el usuario (lo manda enviar_correos)
+            with transaction.atomic():
+                usuario = form.save()
+                notificaciones.encolar(usuario.id, MensajeSalida.BIENVENIDA)
             login(request, usuario)
             messages.success(request, "Registro completado")
             return redirect("home")
@@ -37,62 +96,195 @@ def registro(request):
     return render(request, "gestion_citas/auth/registro.html", {"form": form})
 
 
+@solo_lectura
 @login_required
-def mis_citas(request):
-    citas = Cita.objects.filter(usuario=request.user).order_by("-fecha", "-hora")
-    return render(request, "gestion_citas/citas/mis_citas.html", {"citas": citas})
+async def mis_citas(request):
+    hoy = date.today()
+    citas = (
+        Cita.objects.filter(usuario=await _usuario(request))
+        .select_related("barbero", "servicio", "serie")
+        .only(*CAMPOS_MIS_CITAS)
+    )
+    # Dos listas independientes, cada una con su paginación (?proximas=N&pasadas=M)
+    # Las canceladas solo se ven en el historial de pasadas
+    proximas = await _pagina(
+        citas.filter(fecha__gte=hoy).exclude(estado="CANCELADA").order_by("fecha", "hora"),
+        request.GET.get("proximas"),
+    )
+    pasadas = await _pagina(
+        citas.filter(fecha__lt=hoy).order_by("-fecha", "-hora"), request.GET.get("pasadas")
+    )
+    return await arender(request, "gestion_citas/citas/mis_citas.html", {
+        "proximas": proximas,
+        "pasadas": pasadas,
+    })
+
+
+async def _pagina(citas, numero, por_pagina=None):
+    # Paginator.get_page con el COUNT y la página leídos por el ORM asíncrono
+    paginator = Paginator(citas, por_pagina or MIS_CITAS_POR_PAGINA)
+    paginator.count = await citas.acount()
+    pagina = paginator.get_page(numero)
+    pagina.object_list = [cita async for cita in pagina.object_list.aiterator()]
+    return pagina
+
+
+MIS_CITAS_POR_PAGINA = 12
+
+# Solo las columnas que pinta mis_citas.html
+CAMPOS_MIS_CITAS = [
+    "fecha", "hora", "estado", "barbero", "servicio", "serie",
+    "barbero__nombre", "servicio__nombre", "servicio__precio", "serie__cada_semanas",
+]
 
 
 @login_required
 def reservar_cita(request):
     if request.method == 'POST':
         form = CitaForm(request.POST)
-        if form.is_valid():
-            # ... (código de guardado igual que antes) ...
-            cita = form.save(commit=False)
-            cita.usuario = request.user
-            try:
-                cita.full_clean()
-                cita.save()
-                messages.success(request, '¡Cita reservada con éxito!')
-                return redirect('mis_citas')
-            except ValidationError as e:
-                form.add_error(None, e)
+        # Validación y guardado en una sola transacción (ver reservas.py)
+        if reservas.guardar_formulario(form, usuario=request.user).ok:
+            messages.success(request, '¡Cita reservada con éxito!')
+            return redirect('mis_citas')
     else:
         form = CitaForm()
     
     # --- DATOS PARA JAVASCRIPT Y DISEÑO ---
-    barberos = Barbero.objects.all()
-    servicios = Servicio.objects.all()
-    
-    # 1. Definimos los huecos (Ahora con medias horas)
-    # Puedes ajustar esto a tu horario real
-    horarios_disponibles = [
-        "10:00", "10:30", "11:00", "11:30", "12:00", "12:30", "13:00", "13:30",
-        "16:00", "16:30", "17:00", "17:30", "18:00", "18:30", "19:00", "19:30"
-    ]
+    # La ocupación ya no se incrusta en la página: el calendario la pide mes a mes
+    # a la API de disponibilidad (ver disponibilidad_barbero).
+    # Barberos, servicios y precios salen del catálogo en caché (ver catalogo.py)
+    datos = catalogo.actual()
 
-    # 2. Obtenemos citas futuras ocupadas
-    citas_futuras = Cita.objects.filter(fecha__gte=date.today())
-    agenda_ocupada = defaultdict(lambda: defaultdict(list))
-    
-    for cita in citas_futuras:
-        fecha_str = cita.fecha.strftime("%Y-%m-%d")
-        # Aseguramos formato HH:MM (sin segundos)
-        hora_str = cita.hora.strftime("%H:%M") 
-        agenda_ocupada[cita.barbero.id][fecha_str].append(hora_str)
-
-    # Convertimos a JSON
-    agenda_ocupada_json = json.dumps({k: dict(v) for k, v in agenda_ocupada.items()})
-    precios_json = json.dumps({s.id: float(s.precio) for s in servicios})
-    
     return render(request, 'gestion_citas/citas/reservar_cita.html', {
         'form': form,
-        'barberos': barberos,
-        'servicios': servicios,
-        'agenda_json': agenda_ocupada_json,
-        'precios_json': precios_json,
-        'horarios': horarios_disponibles, # <--- PASAMOS LA LISTA DE HORAS
+        'barberos': datos.barberos,
+        'servicios': datos.servicios,
+        'precios_json': datos.precios_json,
+        'horarios': horarios.horas_posibles(), # <--- PASAMOS LA LISTA DE HORAS
+    })
+
+
+def _rango_disponibilidad(request):
+    # Acepta ?mes=AAAA-MM o bien ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (ambos incluidos)
+    mes = request.GET.get("mes")
+    if mes:
+        inicio = datetime.strptime(mes, "%Y-%m").date()
+        siguiente = (inicio.replace(day=28) + timedelta(days=4)).replace(day=1)
+        return inicio, siguiente - timedelta(days=1)
+
+    desde = datetime.strptime(request.GET["desde"], "%Y-%m-%d").date()
+    hasta = datetime.strptime(request.GET.get("hasta", request.GET["desde"]), "%Y-%m-%d").date()
+    return desde, hasta
+
+
+@solo_lectura
+@login_required
+@require_GET
+async def disponibilidad_barbero(request, barbero_id):
+    try:
+        desde, hasta = _rango_disponibilidad(request)
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Indica ?mes=AAAA-MM o ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD"}, status=400)
+
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_DISPONIBILIDAD:
+        return JsonResponse({"error": f"El rango debe ser de 1 a {MAX_DIAS_DISPONIBILIDAD} días"}, status=400)
+
+    barbero = await aget_object_or_404(Barbero, id=barbero_id)
+
+    # La duración del servicio elegido decide qué inicios caben (por defecto, un hueco)
+    duracion = None
+    servicio_id = request.GET.get("servicio", "")
+    if servicio_id.isdigit():
+        duracion = await Servicio.objects.filter(id=servicio_id).values_list("duracion", flat=True).afirst()
+    duracion = duracion or PASO_MINUTOS
+
+    # Nunca devolvemos días pasados
+    desde = max(desde, date.today())
+
+    # Una sola consulta (fecha, hora, duración) para todo el rango, sin instanciar modelos
+    # (async for sobre el queryset: aiterator() con values_list de varias columnas
+    # ejecuta la consulta en el hilo del bucle de eventos)
+    filas = [
+        fila async for fila in
+        Cita.objects.filter(barbero=barbero, fecha__gte=desde, fecha__lte=hasta)
+        .exclude(estado="CANCELADA")
+        .order_by().values_list("fecha", "hora", "servicio__duracion")
+    ]
+    indice = IndiceHuecos.desde_citas(filas)
+
+    # Turnos de cada día, ya resueltos en CapacidadDiaria (horario, excepciones y cierres);
+    # los días sin calcular salen de los horarios y de este mismo índice
+    capacidad = await horarios.acapacidad(barbero.id, desde, hasta, indice=indice)
+    ocupadas = defaultdict(set)
+    for fecha, hora, _ in filas:
+        ocupadas[fecha].add(hora.strftime("%H:%M"))
+
+    dias = {}
+    for dia, fila in sorted(capacidad.items()):
+        dias[dia.strftime("%Y-%m-%d")] = {
+            "ocupadas": sorted(ocupadas.get(dia, [])),
+            "libres": indice.inicios_libres(dia, duracion, turnos=horarios.leer_turnos(fila.turnos)),
+            "huecos": fila.huecos,
+            "completo": fila.completo,
+        }
+
+    datos = {
+        "barbero": barbero.id,
+        "desde": desde.strftime("%Y-%m-%d"),
+        "hasta": hasta.strftime("%Y-%m-%d"),
+        "duracion": duracion,
+        "dias": dias,
+    }
+    return _json_con_etag(request, datos)
+
+
+def _json_con_etag(request, datos):
+    # El ETag sale del propio contenido: si no ha cambiado, el navegador recibe un 304
+    contenido = json.dumps(datos, sort_keys=True)
+    etag = '"%s"' % hashlib.md5(contenido.encode()).hexdigest()
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        respuesta = JsonResponse(datos)
+    respuesta["ETag"] = etag
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    patch_vary_headers(respuesta, ["Cookie"])
+    return respuesta
+
+
+@solo_lectura
+@login_required
+@require_GET
+async def calendario_barbero(request, barbero_id):
+    """Días completos y cerrados de un barbero, para pintar el calendario de un mes.
+
+    Sale de CapacidadDiaria (una consulta por el índice barbero+fecha), sin
+    calcular huecos; solo los días que el comando recalcular_capacidad aún no
+    ha guardado se calculan al vuelo. Las horas de un día concreto las da
+    disponibilidad_barbero.
+    """
+    try:
+        desde, hasta = _rango_disponibilidad(request)
+    except (KeyError, ValueError):
+        return JsonResponse({"error": "Indica ?mes=AAAA-MM o ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD"}, status=400)
+
+    if hasta < desde or (hasta - desde).days >= MAX_DIAS_DISPONIBILIDAD:
+        return JsonResponse({"error": f"El rango debe ser de 1 a {MAX_DIAS_DISPONIBILIDAD} días"}, status=400)
+
+    barbero = await aget_object_or_404(Barbero, id=barbero_id)
+    desde = max(desde, date.today())
+    completos, cerrados = [], []
+    for dia, fila in sorted((await horarios.acapacidad(barbero.id, desde, hasta)).items()):
+        if not fila.huecos:
+            cerrados.append(dia.strftime("%Y-%m-%d"))
+        elif fila.completo:
+            completos.append(dia.strftime("%Y-%m-%d"))
+
+    return _json_con_etag(request, {
+        "barbero": barbero.id,
+        "desde": desde.strftime("%Y-%m-%d"),
+        "hasta": hasta.strftime("%Y-%m-%d"),
+        "completos": completos,
+        "cerrados": cerrados,
     })
 
 
@@ -101,7 +293,13 @@ def cancelar_cita(request, cita_id):
     cita = get_object_or_404(Cita, id=cita_id, usuario=request.user)
 
     if request.method == "POST":
-        cita.delete()
+        # La cita se queda, cancelada: resúmenes, calendario, lista de espera,
+        # historial y correo se actualizan por señal, en la misma transacción
+        if cita.estado != "CANCELADA":
+            cita.estado = "CANCELADA"
+            cita._autor = request.user
+            with transaction.atomic():
+                cita.save()
         messages.warning(request, "La cita ha sido cancelada.")
         return redirect("mis_citas")
 
@@ -110,40 +308,98 @@ def cancelar_cita(request, cita_id):
     )
 
 
+@solo_lectura
 @login_required
-@login_required
-def agenda_profesional(request):
-    if not request.user.is_staff:
+async def agenda_profesional(request):
+    if not (await _usuario(request)).is_staff:
         messages.error(request, "No tienes permisos para acceder a la agenda profesional.")
         return redirect('home')
 
-    Cita.objects.filter(fecha__lt=date.today(), estado='PENDIENTE').update(estado='CANCELADA')
-
-    ahora_mismo = datetime.now().time()
-    Cita.objects.filter(fecha=date.today(), hora__lt=ahora_mismo, estado='PENDIENTE').update(estado='CANCELADA')
+    # Solo lectura: las pendientes vencidas las cancela el comando expirar_citas
 
     hoy = date.today()
-    citas = Cita.objects.filter(fecha__gte=hoy).order_by('fecha', 'hora')
-    
-    return render(request, 'gestion_citas/citas/agenda_profesional.html', {
+    filtros = FiltroAgendaForm(request.GET or None)
+    # Validar el barbero elegido consulta la BD: se hace en el hilo síncrono
+    datos = filtros.cleaned_data if await sync_to_async(filtros.is_valid)() else {}
+
+    # Ventana de una semana; dentro de ella, páginas por cursor (fecha, hora, id)
+    desde = datos.get("semana") or hoy
+    hasta = desde + timedelta(days=7)
+    citas = (
+        Cita.objects.select_related('usuario', 'barbero', 'servicio')
+        .only(*CAMPOS_AGENDA)
+        .filter(fecha__gte=desde, fecha__lt=hasta)
+        .order_by('fecha', 'hora', 'id')
+    )
+    if datos.get("barbero"):
+        citas = citas.filter(barbero=datos["barbero"])
+    if datos.get("estado"):
+        citas = citas.filter(estado=datos["estado"])
+    if datos.get("despues"):
+        fecha, hora, cita_id = datos["despues"]
+        citas = citas.filter(
+            Q(fecha__gt=fecha)
+            | Q(fecha=fecha, hora__gt=hora)
+            | Q(fecha=fecha, hora=hora, id__gt=cita_id)
+        )
+
+    # Pedimos una de más para saber si hay otra página
+    citas = [cita async for cita in citas[:AGENDA_POR_PAGINA + 1].aiterator()]
+    siguiente_pagina = None
+    if len(citas) > AGENDA_POR_PAGINA:
+        citas = citas[:AGENDA_POR_PAGINA]
+        ultima = citas[-1]
+        siguiente_pagina = _url_agenda(
+            request, despues=f"{ultima.fecha:%Y-%m-%d},{ultima.hora:%H:%M:%S},{ultima.id}"
+        )
+
+    return await arender(request, 'gestion_citas/citas/agenda_profesional.html', {
         'citas': citas,
-        'hoy': hoy
+        'hoy': hoy,
+        'filtros': filtros,
+        'desde': desde,
+        'hasta': hasta - timedelta(days=1),
+        'semana_anterior': _url_agenda(request, semana=desde - timedelta(days=7), despues=None),
+        'semana_siguiente': _url_agenda(request, semana=hasta, despues=None),
+        'siguiente_pagina': siguiente_pagina,
+        # Con un barbero elegido, el enlace para suscribirse a su agenda
+        'url_calendario': datos.get("barbero") and request.build_absolute_uri(
+            calendario.url("barbero", datos["barbero"].id)
+        ),
     })
 
 
+# Máximo de citas por página en la agenda del staff
+AGENDA_POR_PAGINA = 100
+
+# Solo las columnas que pinta agenda_profesional.html
+CAMPOS_AGENDA = [
+    'fecha', 'hora', 'estado', 'notas', 'usuario', 'barbero', 'servicio',
+    'usuario__first_name', 'usuario__last_name', 'usuario__email',
+    'barbero__nombre', 'barbero__foto', 'barbero__miniaturas',
+    'servicio__nombre', 'servicio__duracion',
+]
+
+
+def _url_agenda(request, **cambios):
+    # Misma agenda con otros parámetros (conserva los filtros)
+    parametros = request.GET.copy()
+    for clave, valor in cambios.items():
+        parametros.pop(clave, None)
+        if valor is not None:
+            parametros[clave] = str(valor)
+    return f"?{parametros.urlencode()}"
+
+
 @login_required
 def editar_cita(request, cita_id):
     cita = get_object_or_404(Cita, id=cita_id, usuario=request.user)
 
     if request.method == "POST":
         form = CitaForm(request.POST, instance=cita)
-        if form.is_valid():
-            try:
-                form.save()
-                messages.success(request, "La cita ha sido modificada correctamente.")
-                return redirect("mis_citas")
-            except ValidationError as e:
-                form.add_error(None, e)
+        if reservas.guardar_formulario(form).ok:
+            messages.success(request, "La cita ha sido modificada correctamente.")
+            return redirect("mis_citas")
     else:
         form = CitaForm(instance=cita)
 
@@ -168,34 +424,64 @@ def mi_perfil(request):
     else:
         form = EditarPerfilForm(instance=usuario)
 
-    return render(request, "gestion_citas/auth/perfil.html", {"form": form})
+    return render(request, "gestion_citas/auth/perfil.html", {
+        "form": form,
+        "url_calendario": request.build_absolute_uri(calendario.url("cliente", usuario.id)),
+    })
 
 
+@solo_lectura
 @login_required
 def dashboard_staff(request):
     if not request.user.is_staff:
         return redirect("home")
 
+    # Todo sale de ResumenDiario: una fila por barbero y día, nunca de recorrer las citas
+    filtros = FiltroDashboardForm(request.GET or None)
+    resumen = ResumenDiario.objects.all()
+    rango = {}
+    if filtros.is_valid():
+        if filtros.cleaned_data["desde"]:
+            resumen = resumen.filter(fecha__gte=filtros.cleaned_data["desde"])
+            rango["desde"] = filtros.cleaned_data["desde"]
+        if filtros.cleaned_data["hasta"]:
+            resumen = resumen.filter(fecha__lte=filtros.cleaned_data["hasta"])
+            rango["hasta"] = filtros.cleaned_data["hasta"]
+        if filtros.cleaned_data["barbero"]:
+            resumen = resumen.filter(barbero=filtros.cleaned_data["barbero"])
+            rango["barbero_id"] = filtros.cleaned_data["barbero"].id
+
     # 1. Datos para la Gráfica: Citas por Barbero
     # Esto crea una lista: [{'barbero__nombre': 'Juan', 'total': 5}, ...]
-    datos_barberos = Cita.objects.values("barbero__nombre").annotate(total=Count("id"))
+    datos_barberos = (
+        resumen.values("barbero__nombre")
+        .annotate(total=Sum("citas"))
+        .order_by("barbero__nombre")
+    )
 
     # Preparamos las listas para JavaScript
     nombres = [d["barbero__nombre"] for d in datos_barberos]
     cantidades = [d["total"] for d in datos_barberos]
 
     # 2. Datos simples (KPIs)
-    total_citas = Cita.objects.count()
-    ingresos_estimados = sum([c.servicio.precio for c in Cita.objects.all()])
+    kpis = resumen.aggregate(
+        total_citas=Coalesce(Sum("citas"), 0),
+        cancelaciones=Coalesce(Sum("cancelaciones"), 0),
+        ingresos=Coalesce(Sum("ingresos"), Decimal(0)),
+    )
 
     return render(
         request,
         "gestion_citas/citas/dashboard.html",
         {
+            "filtros": filtros,
             "nombres_js": nombres,
             "cantidades_js": cantidades,
-            "total_citas": total_citas,
-            "ingresos": ingresos_estimados,
+            "total_citas": kpis["total_citas"],
+            "cancelaciones": kpis["cancelaciones"],
+            "ingresos": kpis["ingresos"],
+            # Cancelaciones y no presentados: del historial de estados, con los mismos filtros
+            "tasas": historial.tasas(**rango),
         },
     )
 
@@ -233,8 +519,8 @@ def editar_cita_staff(request, cita_id):
 
     if request.method == 'POST':
         form = CitaStaffForm(request.POST, instance=cita)
-        if form.is_valid():
-            form.save()
+        cita._autor = request.user  # queda en el historial si cambia el estado
+        if reservas.guardar_formulario(form).ok:
             messages.success(request, 'Cita actualizada correctamente.')
             return redirect('agenda_profesional') # Vuelve a la agenda
     else:
@@ -243,4 +529,284 @@ def editar_cita_staff(request, cita_id):
     return render(request, 'gestion_citas/citas/editar_cita_staff.html', {
         'form': form,
         'cita': cita
-    })  
\ No newline at end of file
+    })  
+
+BUSCAR_USUARIOS_POR_PAGINA = 20
+MAYOR_CARACTER = chr(0x10FFFF)
+# LOWER() de SQLite solo cambia las letras ASCII; el prefijo se trata igual para compararlo con el índice
+_ASCII_A_MINUSCULAS = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _minusculas(texto):
+    return texto.translate(_ASCII_A_MINUSCULAS)
+
+
+@solo_lectura
+@login_required
+@require_GET
+def buscar_usuarios(request):
+    """Clientes cuyo correo empieza por ?q=, sin distinguir mayúsculas, para el buscador de editar_cita_staff.
+
+    Es un rango sobre el índice de LOWER(email) (LIKE 'q%' no lo usaría en
+    SQLite), paginado por cursor: ?despues=<último correo de la página>.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Solo para el personal"}, status=403)
+
+    prefijo = _minusculas(request.GET.get("q", "").strip())
+    if len(prefijo) < 2:
+        return JsonResponse({"resultados": [], "siguiente": None})
+    # Todo lo que empieza por el prefijo queda entre él y el prefijo seguido del mayor carácter
+    # posible; SQLite compara el texto byte a byte en UTF-8, que respeta ese orden
+    usuarios = Usuario.objects.alias(correo=Lower("email")).filter(
+        correo__gte=prefijo, correo__lt=prefijo + MAYOR_CARACTER
+    )
+    despues = request.GET.get("despues")
+    if despues:
+        usuarios = usuarios.filter(
+            Q(correo__gt=_minusculas(despues)) | Q(correo=_minusculas(despues), email__gt=despues)
+        )
+
+    filas = list(
+        usuarios.order_by("correo", "email").values_list("id", "email", "first_name", "last_name")[:BUSCAR_USUARIOS_POR_PAGINA + 1]
+    )
+    hay_mas = len(filas) > BUSCAR_USUARIOS_POR_PAGINA
+    filas = filas[:BUSCAR_USUARIOS_POR_PAGINA]
+    return JsonResponse({
+        # La misma etiqueta que Usuario.__str__, que es lo que pinta el buscador
+        "resultados": [
+            {"id": usuario_id, "email": email, "etiqueta": f"{nombre} {apellido} ({email})"}
+            for usuario_id, email, nombre, apellido in filas
+        ],
+        "siguiente": filas[-1][1] if hay_mas else None,
+    })
+
+
+@solo_lectura
+@login_required
+@require_GET
+def buscar_staff(request):
+    """Clientes y citas que coinciden con ?q=, por el índice de texto (ver busqueda.py).
+
+    Cada palabra cuenta como prefijo y tienen que aparecer todas. Los clientes
+    van por relevancia; las citas, de la más reciente a la más antigua.
+    """
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Solo para el personal"}, status=403)
+
+    consulta = busqueda.consulta_fts(request.GET.get("q", ""))
+    if consulta is None:
+        return JsonResponse({"clientes": [], "citas": []})
+    return JsonResponse({
+        "clientes": [
+            {"id": usuario.id, "email": usuario.email, "etiqueta": str(usuario)}
+            for usuario in busqueda.clientes(consulta)
+        ],
+        "citas": [
+            {
+                "id": cita.id,
+                "fecha": cita.fecha.isoformat(),
+                "hora": cita.hora.strftime("%H:%M"),
+                "estado": cita.estado,
+                "cliente": str(cita.usuario),
+                "barbero": cita.barbero.nombre,
+                "servicio": cita.servicio.nombre,
+                "notas": cita.notas or "",
+            }
+            for cita in busqueda.citas(consulta)
+        ],
+    })
+
+
+@solo_lectura
+@login_required
+@require_GET
+def exportar_citas(request):
+    if not request.user.is_staff:
+        return redirect("home")
+
+    formato = request.GET.get("formato", "csv")
+    if formato not in intercambio.EXPORTADORES:
+        return JsonResponse({"error": "formato debe ser csv o json"}, status=400)
+
+    # Mismos filtros que el dashboard (desde, hasta, barbero)
+    filtros = FiltroDashboardForm(request.GET)
+    citas = Cita.objects.all()
+    if filtros.is_valid():
+        if filtros.cleaned_data["desde"]:
+            citas = citas.filter(fecha__gte=filtros.cleaned_data["desde"])
+        if filtros.cleaned_data["hasta"]:
+            citas = citas.filter(fecha__lte=filtros.cleaned_data["hasta"])
+        if filtros.cleaned_data["barbero"]:
+            citas = citas.filter(barbero=filtros.cleaned_data["barbero"])
+
+    # Se genera mientras se envía: la memoria no crece con el número de citas
+    exportador, tipo = intercambio.EXPORTADORES[formato]
+    respuesta = StreamingHttpResponse(exportador(citas), content_type=tipo)
+    respuesta["Content-Disposition"] = f'attachment; filename="citas-{date.today():%Y%m%d}.{formato}"'
+    return respuesta
+
+
+@solo_lectura
+@require_GET
+def calendario_ics(request, tipo, propietario_id, token):
+    """Calendario .ics de un barbero o de un cliente, sin sesión: basta el token de la URL.
+
+    Si el cliente manda el ETag de la última vez y nada ha cambiado, un 304
+    con una sola consulta (ver calendario.py).
+    """
+    if not calendario.token_valido(tipo, propietario_id, token):
+        raise Http404
+
+    desde, hasta = calendario.ventana()
+    citas = calendario.citas(tipo, propietario_id, desde, hasta)
+    etag = calendario.version(citas, desde)
+    respuesta = get_conditional_response(request, etag=etag)
+    if respuesta is None:
+        titulo = calendario.nombre(tipo, propietario_id)
+        if titulo is None:
+            raise Http404
+        dominio = request.get_host().split(":")[0]
+        respuesta = StreamingHttpResponse(
+            calendario.generar(tipo, citas, titulo, dominio), content_type="text/calendar; charset=utf-8"
+        )
+        respuesta["Content-Disposition"] = f'inline; filename="{tipo}-{propietario_id}.ics"'
+    respuesta["ETag"] = etag
+    # Que el cliente pregunte siempre, pero sin que nadie más guarde el calendario
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+
+# Errores que se devuelven como máximo en la respuesta de importar_citas
+MAX_ERRORES_IMPORTACION = 500
+
+
+@login_required
+@require_POST
+def importar_citas(request):
+    if not request.user.is_staff:
+        return JsonResponse({"error": "Solo el staff puede importar citas"}, status=403)
+
+    fichero = request.FILES.get("fichero")
+    if fichero is None:
+        return JsonResponse({"error": "Falta el fichero"}, status=400)
+    formato = request.POST.get("formato") or ("json" if fichero.name.lower().endswith((".json", ".jsonl")) else "csv")
+
+    texto = io.TextIOWrapper(fichero.file, encoding="utf-8-sig", newline="")
+    try:
+        informe = intercambio.importar(
+            intercambio.leer(texto, formato), simular=bool(request.POST.get("simular"))
+        )
+    except (ValueError, UnicodeDecodeError, csv.Error) as error:
+        return JsonResponse({"error": f"No se puede leer el fichero: {error}"}, status=400)
+    return JsonResponse(informe.como_dict(limite=MAX_ERRORES_IMPORTACION))
+
+
+@login_required
+def reservar_serie(request):
+    omitidas = []
+    if request.method == "POST":
+        form = SerieCitaForm(request.POST)
+        if form.is_valid():
+            serie = form.save(commit=False)
+            serie.usuario = request.user
+            # Todas las fechas se comprueban de una vez y se crean con un solo INSERT
+            resultado = series.crear_serie(serie)
+            omitidas = resultado.omitidas
+            if resultado.ok:
+                messages.success(request, f"Serie creada: {len(resultado.creadas)} citas reservadas.")
+                if omitidas:
+                    messages.warning(request, "No se han podido reservar: " + _fechas_omitidas(omitidas))
+                return redirect("mis_citas")
+            form.add_error(None, resultado.error)
+    else:
+        form = SerieCitaForm()
+
+    return render(request, "gestion_citas/citas/reservar_serie.html", {"form": form, "omitidas": omitidas})
+
+
+def _fechas_omitidas(omitidas):
+    return "; ".join(f"{fecha:%d/%m/%Y} ({motivo.lower()})" for fecha, motivo in omitidas)
+
+
+def _cita_de_serie(request, cita_id):
+    # El cliente solo ve sus series; el staff, todas
+    citas = Cita.objects.select_related("servicio").filter(serie__isnull=False)
+    if not request.user.is_staff:
+        citas = citas.filter(usuario=request.user)
+    return get_object_or_404(citas, id=cita_id)
+
+
+@login_required
+def editar_serie(request, cita_id):
+    cita = _cita_de_serie(request, cita_id)
+
+    if request.method == "POST":
+        form = CambioSerieForm(request.POST)
+        if form.is_valid():
+            conflictos = series.modificar_desde(cita, **form.cleaned_data)
+            if not conflictos:
+                messages.success(request, "Se han cambiado esta cita y las siguientes de la serie.")
+                return redirect("mis_citas")
+            form.add_error(None, "No se ha cambiado nada, hay fechas ocupadas: " + _fechas_omitidas(conflictos))
+    else:
+        form = CambioSerieForm(initial={"hora": cita.hora, "servicio": cita.servicio})
+
+    return render(request, "gestion_citas/citas/editar_cita.html", {"form": form, "cita": cita})
+
+
+@login_required
+@require_POST
+def cancelar_serie(request, cita_id):
+    cita = _cita_de_serie(request, cita_id)
+    canceladas = series.cancelar_desde(cita)
+    messages.warning(request, f"Se han cancelado {canceladas} citas de la serie.")
+    return redirect("mis_citas")
+
+
+@login_required
+def lista_espera_cliente(request):
+    if request.method == "POST":
+        form = EntradaEsperaForm(request.POST)
+        if form.is_valid():
+            entrada = form.save(commit=False)
+            entrada.usuario = request.user
+            entrada.save()
+            messages.success(request, "Te hemos apuntado. Si se libera un hueco te lo reservamos y te avisamos aquí.")
+            return redirect("lista_espera")
+    else:
+        # Desde el formulario de reserva llegan barbero, servicio y fecha ya elegidos
+        form = EntradaEsperaForm(initial={
+            campo: request.GET[campo] for campo in ("barbero", "servicio", "fecha") if request.GET.get(campo)
+        })
+
+    entradas = (
+        EntradaEspera.objects.filter(usuario=request.user, fecha__gte=date.today())
+        .exclude(estado=EntradaEspera.RETIRADA)
+        .select_related("barbero", "servicio", "cita")
+        .order_by("fecha", "desde")
+    )
+    return render(request, "gestion_citas/citas/lista_espera.html", {"form": form, "entradas": entradas})
+
+
+@login_required
+@require_POST
+def responder_espera(request, entrada_id):
+    entrada = get_object_or_404(EntradaEspera, id=entrada_id, usuario=request.user)
+    accion = request.POST.get("accion")
+
+    if accion == "aceptar":
+        if lista_espera.aceptar_oferta(entrada):
+            messages.success(request, "¡Cita confirmada! Ya la tienes en Mis Citas.")
+        else:
+            messages.error(request, "El plazo para confirmar ese hueco ha terminado.")
+    elif entrada.estado == EntradaEspera.OFRECIDA:
+        # Rechazar la oferta: el hueco pasa al siguiente de la lista
+        lista_espera.liberar_oferta(entrada, EntradaEspera.RETIRADA)
+        messages.warning(request, "Has rechazado el hueco; se lo ofreceremos a otra persona.")
+    else:
+        EntradaEspera.objects.filter(id=entrada.id, estado=EntradaEspera.ESPERANDO).update(
+            estado=EntradaEspera.RETIRADA
+        )
+        messages.warning(request, "Te has borrado de la lista de espera.")
+    return redirect("lista_espera")